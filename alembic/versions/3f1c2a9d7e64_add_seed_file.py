@@ -0,0 +1,35 @@
+"""Add seed_file
+
+Revision ID: 3f1c2a9d7e64
+Revises: 84ce8ae91b40
+Create Date: 2026-10-18 15:40:12.318204
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3f1c2a9d7e64"
+down_revision = "84ce8ae91b40"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "seed_file",
+        sa.Column("name", sa.Text(), nullable=False),
+        sa.Column("checksum", sa.CHAR(length=64), nullable=False),
+        sa.Column(
+            "loaded_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    op.drop_table("seed_file")
@@ -0,0 +1,26 @@
+"""Add country_document.checksum
+
+Revision ID: 8d4e0b6c1f27
+Revises: 3f1c2a9d7e64
+Create Date: 2026-10-18 16:02:45.901377
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8d4e0b6c1f27"
+down_revision = "3f1c2a9d7e64"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "country_document", sa.Column("checksum", sa.CHAR(length=64), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column("country_document", "checksum")
@@ -0,0 +1,24 @@
+"""Add seed_file.contents
+
+Revision ID: a9c3e5d2f871
+Revises: e2b6d09a4c13
+Create Date: 2026-10-18 18:12:30.604117
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a9c3e5d2f871"
+down_revision = "e2b6d09a4c13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("seed_file", sa.Column("contents", sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("seed_file", "contents")
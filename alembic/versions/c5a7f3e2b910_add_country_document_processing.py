@@ -0,0 +1,34 @@
+"""Add country_document processing columns
+
+Revision ID: c5a7f3e2b910
+Revises: 8d4e0b6c1f27
+Create Date: 2026-10-18 16:31:08.522961
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c5a7f3e2b910"
+down_revision = "8d4e0b6c1f27"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("country_document", sa.Column("status", sa.Text(), nullable=True))
+    op.add_column(
+        "country_document", sa.Column("page_count", sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        "country_document",
+        sa.Column("info", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("country_document", "info")
+    op.drop_column("country_document", "page_count")
+    op.drop_column("country_document", "status")
@@ -0,0 +1,27 @@
+"""Index country_document.checksum
+
+Revision ID: e2b6d09a4c13
+Revises: c5a7f3e2b910
+Create Date: 2026-10-18 17:05:42.118230
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e2b6d09a4c13"
+down_revision = "c5a7f3e2b910"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        op.f("ix_country_document_checksum"),
+        "country_document",
+        ["checksum"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_country_document_checksum"), table_name="country_document")
@@ -1,7 +1,5 @@
-import json
 from typing import Union
 
-import aioredis
 import fastapi_plugins
 import sentry_sdk
 from fastapi import FastAPI
@@ -10,24 +8,25 @@ from fastapi.routing import APIRoute
 from opentelemetry import trace
 from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from pydantic import ValidationError
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
 from sentry_sdk.integrations.redis import RedisIntegration
 from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
 from starlette.status import HTTP_422_UNPROCESSABLE_ENTITY
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
+from app.api.deps import NotModified
 from app.api.v1.api import api_router
+from app.core import cache as caches
 from app.core.config import settings
 from app.core.logger import log
-from app.db.session import SessionLocal
-from app.models import Country
+from app.core.metrics import metrics_response
+from app.core.tracing import create_tracer_provider
+from app.core.warmer import warm_cache
+from app.db.session import async_engine, engine
 
 sentry_sdk.init(
     dsn=settings.SENTRY_DSN,
@@ -72,6 +71,11 @@ async def generic_exception_handler(request, exc) -> JSONResponse:
     return r
 
 
+@app.exception_handler(NotModified)
+async def not_modified_handler(request, exc) -> Response:
+    return Response(status_code=304, headers=exc.headers)
+
+
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request, exc) -> JSONResponse:
     return JSONResponse(
@@ -79,29 +83,31 @@ async def http_exception_handler(request, exc) -> JSONResponse:
     )
 
 
-async def prepopulateRedis():
-    db = SessionLocal()
-    cache = await aioredis.create_redis_pool(settings.REDIS_URL)
-    # Prepopulate REDIS cache
-    log.debug("PREPOPULATE Country")
-    countrys = db.query(Country)
-    for country in countrys:
-        await cache.hset("country", country.id, json.dumps(country.to_dict()))
-
-    cache.close()
-    await cache.wait_closed()
-
-
 @app.on_event("startup")
 async def on_startup() -> None:
-    await prepopulateRedis()
     await fastapi_plugins.redis_plugin.init_app(app, config=config)
     await fastapi_plugins.redis_plugin.init()
+    cache = await fastapi_plugins.redis_plugin()
+    caches.invalidator.bind(cache)
+    await caches.invalidator.subscribe(cache)
+    await warm_cache(cache)
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
+    await caches.invalidator.unsubscribe(await fastapi_plugins.redis_plugin())
+    caches.invalidator.bind(None)
     await fastapi_plugins.redis_plugin.terminate()
+    await async_engine.dispose()
+    engine.dispose()
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    """
+    Prometheus metrics, aggregated over all workers.
+    """
+    return metrics_response()
 
 
 app.add_middleware(SentryAsgiMiddleware)
@@ -120,21 +126,10 @@ app.include_router(
 
 if settings.CONFIG_TYPE == "prod":
     trace.set_tracer_provider(
-        TracerProvider(
-            resource=Resource.create({"service.name": settings.APPLICATION_NAME}),
+        create_tracer_provider(
+            JaegerExporter(agent_host_name=settings.JAEGER_HOST, agent_port=6831)
         )
     )
-    tracer = trace.get_tracer(__name__)
-
-    jaeger_exporter = JaegerExporter(
-        agent_host_name=settings.JAEGER_HOST,
-        agent_port=6831,
-    )
-    # Create a BatchSpanProcessor and add the exporter to it
-    span_processor = BatchSpanProcessor(jaeger_exporter)
-
-    # add to the tracer
-    trace.get_tracer_provider().add_span_processor(span_processor)
 
     FastAPIInstrumentor.instrument_app(app)
 
@@ -1,6 +1,15 @@
-from typing import Generator
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncGenerator, Dict, Generator, Optional
 
-from app.db.session import SessionLocal
+import aioredis
+import fastapi_plugins
+from fastapi import Depends, HTTPException, Query, Request, Response
+
+from app.api.files import etag_matches
+from app.core import cache as caches
+from app.core.config import settings
+from app.crud.base import decode_cursor
+from app.db.session import AsyncSessionLocal, SessionLocal
 
 
 def get_db() -> Generator:
@@ -9,3 +18,95 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+class PageParams:
+    """
+    Query parameters shared by the list endpoints.
+
+    `cursor` is the `next` value of the previous page; `stream=true` returns
+    every row as NDJSON instead of a page. `paged` tells whether the client
+    asked for a page (sent `cursor` or `limit`), for the endpoints that keep
+    their unpaged response otherwise.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1, le=settings.MAX_PAGE_SIZE),
+        stream: bool = False,
+    ):
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+        self.cursor = cursor
+        self.limit = limit or settings.PAGE_SIZE
+        self.paged = cursor is not None or limit is not None
+        self.stream = stream
+
+
+class NotModified(HTTPException):
+    """Answered with an empty 304 carrying `headers`."""
+
+    def __init__(self, headers: Dict[str, str]):
+        super().__init__(status_code=304, headers=headers)
+
+
+def _not_modified_since(request: Request, modified: float) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return int(modified) <= since.timestamp()
+
+
+class ConditionalGet:
+    """
+    Router dependency validating the GET responses built from `table`
+    against its revision (see `TableRevisions`).
+
+    A request whose If-None-Match (or, without one, If-Modified-Since)
+    still matches is answered 304 before the endpoint, and so the
+    database, is reached. Other responses get the ETag, Last-Modified and
+    API_CACHE_CONTROL headers; endpoints returning a `Response` of their
+    own set their headers themselves.
+    """
+
+    def __init__(self, table: str):
+        self.table = table
+
+    async def __call__(
+        self,
+        request: Request,
+        response: Response,
+        cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+    ) -> None:
+        if request.method not in ("GET", "HEAD"):
+            return
+
+        revision, modified = await caches.revisions.get(cache, self.table)
+        etag = f'"{settings.ETAG_VERSION}-{self.table}-{revision}"'
+        headers = {
+            # Weak: the same rows may be encoded differently
+            "ETag": f"W/{etag}",
+            "Last-Modified": formatdate(modified, usegmt=True),
+            "Cache-Control": settings.API_CACHE_CONTROL,
+        }
+        if "if-none-match" in request.headers:
+            if etag_matches(request, etag):
+                raise NotModified(headers)
+        elif _not_modified_since(request, modified):
+            raise NotModified(headers)
+        response.headers.update(headers)
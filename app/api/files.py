@@ -0,0 +1,143 @@
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import (
+    FileResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+
+from app.core.config import settings
+from app.storage import get_storage
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Whether the `If-None-Match` header of `request` lists `etag`, or is `*`.
+    """
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return if_none_match.strip() == "*" or etag in tags or f"W/{etag}" in tags
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The first and last byte of a single `bytes=` range of a `size` bytes file.
+
+    Returns None for a missing, malformed or multi-range header, which are
+    answered with the whole file. Raises ValueError when the range lies
+    outside the file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, dash, last = header[len("bytes=") :].strip().partition("-")
+    if not dash or not (first or last):
+        return None
+    if (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        # Suffix range: the last `last` bytes
+        start, end = size - int(last), size - 1
+        if int(last) == 0 or size == 0:
+            raise ValueError(f"Range {header} not satisfiable")
+        return max(start, 0), end
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(f"Range {header} not satisfiable")
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+async def file_response(
+    request: Request,
+    key: str,
+    *,
+    filename: str,
+    media_type: str,
+    checksum: Optional[str] = None,
+) -> Response:
+    """
+    Serve a stored file as a download.
+
+    The ETag is the stored sha256 `checksum`, or a weak one from the file's
+    mtime and size for rows stored before checksums were kept. A matching
+    `If-None-Match` gets a 304. Otherwise the body is left to whatever can
+    send it without the API: a presigned URL of the storage backend (307),
+    or with ACCEL_REDIRECT_LOCATION set, the reverse proxy through
+    `X-Accel-Redirect`; both also serve the ranges. Failing that a single
+    `Range` (honouring `If-Range`) gets a 206 and anything else the whole
+    file.
+
+    Raises FileNotFoundError when the file is missing.
+    """
+    storage = get_storage()
+    stat = None
+    if checksum:
+        etag = f'"{checksum}"'
+    else:
+        stat = await run_in_threadpool(storage.stat, key)
+        if stat is None:
+            raise FileNotFoundError(key)
+        etag = f'W/"{int(stat[1])}-{stat[0]}"'
+
+    headers = {"ETag": etag, "Cache-Control": settings.FILE_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    url = await run_in_threadpool(
+        storage.url, key, filename=filename, media_type=media_type
+    )
+    if url is not None:
+        # The URL expires, so the redirect itself is not cached
+        return RedirectResponse(
+            url, status_code=307, headers={"Cache-Control": "no-store"}
+        )
+
+    quoted = quote(filename)
+    if quoted == filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    else:
+        headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quoted}"
+    headers["Accept-Ranges"] = "bytes"
+
+    path = storage.path(key)
+    if path is not None and settings.ACCEL_REDIRECT_LOCATION:
+        headers["X-Accel-Redirect"] = quote(
+            f"{settings.ACCEL_REDIRECT_LOCATION.rstrip('/')}/{key}"
+        )
+        return Response(media_type=media_type, headers=headers)
+
+    if stat is None:
+        stat = await run_in_threadpool(storage.stat, key)
+        if stat is None:
+            raise FileNotFoundError(key)
+    size = stat[0]
+
+    # If-Range needs a strong match, else the whole (changed) file is sent
+    start, end = 0, size - 1
+    if_range = request.headers.get("if-range")
+    if if_range is None or (if_range.strip() == etag and checksum):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(
+                status_code=416, headers={"Content-Range": f"bytes */{size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    if path is not None and "Content-Range" not in headers:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        storage.iter_bytes(key, start, end - start + 1),
+        status_code=206 if "Content-Range" in headers else 200,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -0,0 +1,33 @@
+import json
+from typing import Type
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from starlette.responses import StreamingResponse
+
+from app.core.config import settings
+from app.crud.base import AsyncCRUDBase
+from app.db.session import AsyncSessionLocal
+
+
+def ndjson_response(
+    crud_obj: AsyncCRUDBase, schema: Type[BaseModel]
+) -> StreamingResponse:
+    """
+    Stream every row of `crud_obj`'s model as newline-delimited JSON.
+
+    The response opens its own session, so the server-side cursor lives
+    exactly as long as the body is being sent.
+    """
+
+    async def lines():
+        async with AsyncSessionLocal() as db:
+            async for rows in crud_obj.stream(
+                db, batch_size=settings.STREAM_BATCH_SIZE, load=schema
+            ):
+                yield "".join(
+                    json.dumps(jsonable_encoder(schema.from_orm(row))) + "\n"
+                    for row in rows
+                )
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -5,12 +5,15 @@ from app.api.v1.endpoints import (
     country_contact,
     country_document,
     country_sector,
+    ingest,
     region,
     sector,
     sector_division,
     sector_group,
     sector_industry,
+    sector_tree,
     sub_region,
+    tasks,
 )
 
 api_router = APIRouter()
@@ -34,5 +37,10 @@ api_router.include_router(
 api_router.include_router(
     sector_industry.router, prefix="/sector-industry", tags=["sector industry"]
 )
+api_router.include_router(
+    sector_tree.router, prefix="/sector-tree", tags=["sector tree"]
+)
 api_router.include_router(region.router, prefix="/region", tags=["region"])
 api_router.include_router(sub_region.router, prefix="/sub-region", tags=["sub region"])
+api_router.include_router(ingest.router, prefix="/ingest", tags=["ingest"])
+api_router.include_router(tasks.router, prefix="/tasks", tags=["tasks"])
@@ -1,35 +1,41 @@
-import json
-from typing import Any
+from typing import Any, List
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute, dependencies=[Depends(deps.ConditionalGet("country"))]
+)
 
 
 @router.post("/", response_model=schemas.CountryResponse)
 async def create_country(
     country_in: schemas.CountryCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new country.
     """
     try:
-        country = crud.country.create(db=db, obj_in=country_in)
+        country = await crud.country.create(
+            db=db, obj_in=country_in, load=schemas.Country
+        )
     except Exception:
         raise HTTPException(
             status_code=400, detail="Country with this ID already exists"
         )
 
-    await cache.hset("country", country.id, json.dumps(country.to_dict()))
+    await caches.country.set(cache, country)
 
     return {"success": True, "data": country}
 
@@ -37,11 +43,13 @@ async def create_country(
 @router.get("/{id}", response_model=schemas.CountryResponse)
 async def get_country(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get country by ID."""
-    r = crud.country.get(db, id)
+    r = await caches.country.get_or_load(
+        cache, id, lambda: crud.country.get(db, id, load=schemas.Country)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="Country not found")
 
@@ -52,17 +60,21 @@ async def get_country(
 async def update_country(
     id: str,
     country_in: schemas.CountryUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a country.
     """
-    country = crud.country.get(db=db, id=id)
+    country = await crud.country.get(db=db, id=id)
     if not country:
         raise HTTPException(status_code=404, detail="Country not found")
 
-    country = crud.country.update(db=db, db_obj=country, obj_in=country_in)
+    country = await crud.country.update(
+        db=db, db_obj=country, obj_in=country_in, load=schemas.Country
+    )
+
+    await caches.country.set(cache, country)
 
     return {"success": True, "data": country}
 
@@ -70,28 +82,80 @@ async def update_country(
 @router.delete("/{id}", response_model=schemas.CountryResponse)
 async def delete_country(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an country.
     """
-    country = crud.country.get(db=db, id=id)
+    country = await crud.country.get(db=db, id=id)
     if not country:
         raise HTTPException(status_code=404, detail="Country not found")
 
-    country = crud.country.remove(db=db, id=id)
+    country = await crud.country.remove(db=db, id=id, load=schemas.Country)
+
+    await caches.country.delete(cache, id)
 
     return {"success": True, "data": None}
 
 
 @router.get("/", response_model=schemas.CountryListResponse)
 async def list_countrys(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve countrys.
     """
-    rows = crud.country.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.country, schemas.Country)
+
+    try:
+        rows, next_cursor = await crud.country.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.Country
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.CountryBatchResponse)
+async def batch_get_country(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get countrys by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.country.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.country.get_many(db, ids, load=schemas.Country),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_country(
+    countrys_in: List[schemas.CountryCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update countrys in bulk, reporting the outcome of every row.
+    """
+    if len(countrys_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.country.bulk_upsert(
+        db, objs_in=countrys_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return {"success": True, "data": rows}
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
@@ -1,37 +1,42 @@
-import json
 from typing import Any, List
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute,
+    dependencies=[Depends(deps.ConditionalGet("country_contact"))],
+)
 
 
 @router.post("/", response_model=schemas.CountryContact)
 async def create_country_contact(
     country_contact_in: schemas.CountryContactCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new country_contact.
     """
     try:
-        country_contact = crud.country_contact.create(db=db, obj_in=country_contact_in)
+        country_contact = await crud.country_contact.create(
+            db=db, obj_in=country_contact_in, load=schemas.CountryContact
+        )
     except Exception:
         raise HTTPException(
             status_code=400, detail="CountryContact with this ID already exists"
         )
 
-    await cache.hset(
-        "country_contact", country_contact.id, json.dumps(country_contact.to_dict())
-    )
+    await caches.country_contact.set(cache, country_contact)
 
     return {"success": True, "data": country_contact}
 
@@ -39,11 +44,13 @@ async def create_country_contact(
 @router.get("/{id}", response_model=schemas.CountryContact)
 async def get_country_contact(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get country_contact by ID."""
-    r = crud.country_contact.get(db, id)
+    r = await caches.country_contact.get_or_load(
+        cache, id, lambda: crud.country_contact.get(db, id, load=schemas.CountryContact)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="CountryContact not found")
 
@@ -54,48 +61,107 @@ async def get_country_contact(
 async def update_country_contact(
     id: str,
     country_contact_in: schemas.CountryContactUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a country_contact.
     """
-    country_contact = crud.country_contact.get(db=db, id=id)
+    country_contact = await crud.country_contact.get(db=db, id=id)
     if not country_contact:
         raise HTTPException(status_code=404, detail="CountryContact not found")
 
-    country_contact = crud.country_contact.update(
-        db=db, db_obj=country_contact, obj_in=country_contact_in
+    country_contact = await crud.country_contact.update(
+        db=db,
+        db_obj=country_contact,
+        obj_in=country_contact_in,
+        load=schemas.CountryContact,
     )
 
+    await caches.country_contact.set(cache, country_contact)
+
     return {"success": True, "data": country_contact}
 
 
 @router.delete("/{id}", response_model=schemas.CountryContact)
 async def delete_country_contact(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an country_contact.
     """
-    country_contact = crud.country_contact.get(db=db, id=id)
+    country_contact = await crud.country_contact.get(db=db, id=id)
     if not country_contact:
         raise HTTPException(status_code=404, detail="CountryContact not found")
 
-    country_contact = crud.country_contact.remove(db=db, id=id)
+    country_contact = await crud.country_contact.remove(
+        db=db, id=id, load=schemas.CountryContact
+    )
+
+    await caches.country_contact.delete(cache, id)
 
     return {"success": True, "data": None}
 
 
-@router.get("/", response_model=List[schemas.CountryContact])
+@router.get("/", response_model=schemas.CountryContactListResponse)
 async def list_country_contacts(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve country_contacts.
     """
-    rows = crud.country_contact.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.country_contact, schemas.CountryContact)
+
+    try:
+        rows, next_cursor = await crud.country_contact.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.CountryContact
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.CountryContactBatchResponse)
+async def batch_get_country_contact(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get country_contacts by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.country_contact.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.country_contact.get_many(db, ids, load=schemas.CountryContact),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_country_contact(
+    country_contacts_in: List[schemas.CountryContactCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update country_contacts in bulk, reporting the outcome of every row.
+    """
+    if len(country_contacts_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.country_contact.bulk_upsert(
+        db, objs_in=country_contacts_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return {"success": True, "data": rows}
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
@@ -1,53 +1,119 @@
-import json
-from typing import Any, List
+import mimetypes
+from typing import Any, List, Optional
 from uuid import UUID
 
 import aioredis
 import fastapi_plugins
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
 
 from app import crud, schemas
 from app.api import deps
+from app.api.files import file_response
+from app.core import cache as caches
+from app.core.celery_app import celery_app
 from app.core.logger import TimedRoute, log  # noqa
+from app.utils import FileTooLarge
 
 router = APIRouter(route_class=TimedRoute)
 
+# Not on /{id}/file, whose responses carry the ETag of the file itself
+conditional = [Depends(deps.ConditionalGet("country_document"))]
 
-@router.post("/", response_model=schemas.CountryDocument)
+
+async def process_document(country_document: Any) -> str:
+    """
+    Queue the page count and metadata extraction of a new document and
+    return the id of the task to poll at /tasks/{task_id}.
+    """
+    task = await run_in_threadpool(
+        celery_app.send_task,
+        "information.process_document",
+        args=[str(country_document.id)],
+    )
+    return task.id
+
+
+@router.post("/", response_model=schemas.CountryDocumentResponse)
 async def create_country_document(
     country_document_in: schemas.CountryDocumentCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new country_document.
     """
     try:
-        country_document = crud.country_document.create(
-            db=db, obj_in=country_document_in
+        country_document = await crud.country_document.create(
+            db=db, obj_in=country_document_in, load=schemas.CountryDocument
         )
     except Exception:
         raise HTTPException(
             status_code=400, detail="CountryDocument with this ID already exists"
         )
 
-    await cache.hset(
-        "country_document", country_document.id, json.dumps(country_document.to_dict())
+    if isinstance(country_document, dict):
+        raise HTTPException(status_code=422, detail=country_document["message"])
+
+    await caches.country_document.set(cache, country_document)
+    task_id = await process_document(country_document)
+
+    return {"success": True, "data": country_document, "task_id": task_id}
+
+
+@router.post("/upload", response_model=schemas.CountryDocumentResponse)
+async def upload_country_document(
+    file: UploadFile = File(...),
+    country_id: str = Form(...),
+    document_type: Optional[str] = Form(None),
+    name: Optional[str] = Form(None),
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Create new country_document from a PDF sent as multipart/form-data.
+    """
+    obj_in = schemas.CountryDocumentCreate(
+        country_id=country_id,
+        document_type=document_type,
+        name=name or file.filename,
     )
+    try:
+        country_document = await crud.country_document.upload(
+            db=db, obj_in=obj_in, file=file.file, load=schemas.CountryDocument
+        )
+    except FileTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception:
+        raise HTTPException(
+            status_code=400, detail="CountryDocument with this ID already exists"
+        )
+    finally:
+        await file.close()
 
-    return {"success": True, "data": country_document}
+    await caches.country_document.set(cache, country_document)
+    task_id = await process_document(country_document)
+
+    return {"success": True, "data": country_document, "task_id": task_id}
 
 
-@router.get("/{id}", response_model=schemas.CountryDocument)
+@router.get("/{id}", response_model=schemas.CountryDocument, dependencies=conditional)
 async def get_country_document(
     id: UUID,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get country_document by ID."""
-    r = crud.country_document.get(db, id)
+    r = await caches.country_document.get_or_load(
+        cache,
+        id,
+        lambda: crud.country_document.get(db, id, load=schemas.CountryDocument),
+    )
     if not r:
         raise HTTPException(status_code=401, detail="CountryDocument not found")
 
@@ -58,64 +124,112 @@ async def get_country_document(
 async def update_country_document(
     id: UUID,
     country_document_in: schemas.CountryDocumentUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a country_document.
     """
-    country_document = crud.country_document.get(db=db, id=id)
+    country_document = await crud.country_document.get(db=db, id=id)
     if not country_document:
         raise HTTPException(status_code=404, detail="CountryDocument not found")
 
-    country_document = crud.country_document.update(
-        db=db, db_obj=country_document, obj_in=country_document_in
+    country_document = await crud.country_document.update(
+        db=db,
+        db_obj=country_document,
+        obj_in=country_document_in,
+        load=schemas.CountryDocument,
     )
 
+    await caches.country_document.set(cache, country_document)
+
     return {"success": True, "data": country_document}
 
 
 @router.delete("/{id}", response_model=schemas.CountryDocument)
 async def delete_country_document(
     id: UUID,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an country_document.
     """
-    country_document = crud.country_document.get(db=db, id=id)
+    country_document = await crud.country_document.get(db=db, id=id)
     if not country_document:
         raise HTTPException(status_code=404, detail="CountryDocument not found")
 
-    country_document = crud.country_document.remove(db=db, id=id)
+    country_document = await crud.country_document.remove(
+        db=db, id=id, load=schemas.CountryDocument
+    )
+
+    await caches.country_document.delete(cache, id)
 
     return {"success": True, "data": None}
 
 
-@router.get("/{country_id}/list", response_model=List[schemas.CountryDocument])
+@router.get(
+    "/{country_id}/list",
+    response_model=List[schemas.CountryDocument],
+    dependencies=conditional,
+)
 async def list_country_documents(
     country_id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve country_documents.
     """
-    rows = crud.country_document.get_for_country(db, country_id)
+    rows = await crud.country_document.get_for_country(
+        db, country_id, load=schemas.CountryDocument
+    )
 
     return {"success": True, "data": rows}
 
 
-@router.get("/{id}/file")
-def get_country_document_file(id: UUID, db: Session = Depends(deps.get_db)) -> Any:
-    attachment = crud.amendment_attachment.get_file(db, id)
+@router.get("/{id}/file", response_class=Response)
+async def get_country_document_file(
+    id: UUID, request: Request, db: AsyncSession = Depends(deps.get_async_db)
+) -> Response:
+    """
+    Download the PDF of a country_document.
+    Supports single byte ranges and conditional requests on its checksum.
+    """
+    document = await crud.country_document.get_file(db, id)
 
-    if not attachment:
+    if not document:
         raise HTTPException(status_code=404, detail="File not found")
 
-    amendment = str(attachment["amendment_id"]).zfill(6)
-    filename = f'USE Amendment {amendment} - Attachment - {attachment["attachment_type"]}.{attachment["extension"]}'
+    extension = mimetypes.guess_extension(document["filetype"]) or ""
+    try:
+        return await file_response(
+            request,
+            document["key"],
+            filename=f'{document["name"] or id}{extension}',
+            media_type=document["filetype"],
+            checksum=document["checksum"],
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(
-        attachment["filepath"], media_type="application/octet-stream", filename=filename
+
+@router.post("/batch-get", response_model=schemas.CountryDocumentBatchResponse)
+async def batch_get_country_document(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get country_documents by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.country_document.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.country_document.get_many(
+            db, ids, load=schemas.CountryDocument
+        ),
     )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
@@ -1,37 +1,42 @@
-import json
 from typing import Any, List
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute,
+    dependencies=[Depends(deps.ConditionalGet("country_sector"))],
+)
 
 
 @router.post("/", response_model=schemas.CountrySector)
 async def create_country_sector(
     country_sector_in: schemas.CountrySectorCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new country_sector.
     """
     try:
-        country_sector = crud.country_sector.create(db=db, obj_in=country_sector_in)
+        country_sector = await crud.country_sector.create(
+            db=db, obj_in=country_sector_in, load=schemas.CountrySector
+        )
     except Exception:
         raise HTTPException(
             status_code=400, detail="CountrySector with this ID already exists"
         )
 
-    await cache.hset(
-        "country_sector", country_sector.id, json.dumps(country_sector.to_dict())
-    )
+    await caches.country_sector.set(cache, country_sector)
 
     return {"success": True, "data": country_sector}
 
@@ -39,11 +44,13 @@ async def create_country_sector(
 @router.get("/{id}", response_model=schemas.CountrySector)
 async def get_country_sector(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get country_sector by ID."""
-    r = crud.country_sector.get(db, id)
+    r = await caches.country_sector.get_or_load(
+        cache, id, lambda: crud.country_sector.get(db, id, load=schemas.CountrySector)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="CountrySector not found")
 
@@ -54,48 +61,107 @@ async def get_country_sector(
 async def update_country_sector(
     id: str,
     country_sector_in: schemas.CountrySectorUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a country_sector.
     """
-    country_sector = crud.country_sector.get(db=db, id=id)
+    country_sector = await crud.country_sector.get(db=db, id=id)
     if not country_sector:
         raise HTTPException(status_code=404, detail="CountrySector not found")
 
-    country_sector = crud.country_sector.update(
-        db=db, db_obj=country_sector, obj_in=country_sector_in
+    country_sector = await crud.country_sector.update(
+        db=db,
+        db_obj=country_sector,
+        obj_in=country_sector_in,
+        load=schemas.CountrySector,
     )
 
+    await caches.country_sector.set(cache, country_sector)
+
     return {"success": True, "data": country_sector}
 
 
 @router.delete("/{id}", response_model=schemas.CountrySector)
 async def delete_country_sector(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an country_sector.
     """
-    country_sector = crud.country_sector.get(db=db, id=id)
+    country_sector = await crud.country_sector.get(db=db, id=id)
     if not country_sector:
         raise HTTPException(status_code=404, detail="CountrySector not found")
 
-    country_sector = crud.country_sector.remove(db=db, id=id)
+    country_sector = await crud.country_sector.remove(
+        db=db, id=id, load=schemas.CountrySector
+    )
+
+    await caches.country_sector.delete(cache, id)
 
     return {"success": True, "data": None}
 
 
-@router.get("/", response_model=List[schemas.CountrySector])
+@router.get("/", response_model=schemas.CountrySectorListResponse)
 async def list_country_sectors(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve country_sectors.
     """
-    rows = crud.country_sector.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.country_sector, schemas.CountrySector)
+
+    try:
+        rows, next_cursor = await crud.country_sector.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.CountrySector
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.CountrySectorBatchResponse)
+async def batch_get_country_sector(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get country_sectors by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.country_sector.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.country_sector.get_many(db, ids, load=schemas.CountrySector),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_country_sector(
+    country_sectors_in: List[schemas.CountrySectorCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update country_sectors in bulk, reporting the outcome of every row.
+    """
+    if len(country_sectors_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.country_sector.bulk_upsert(
+        db, objs_in=country_sectors_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return {"success": True, "data": rows}
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
@@ -0,0 +1,37 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.api import deps
+from app.core.logger import TimedRoute, log  # noqa
+from app.db.ingest import ingest_csv, ingestable_models
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.post("/{table}", response_model=schemas.IngestResponse)
+def ingest_table(
+    table: str,
+    file: UploadFile = File(...),
+    update: bool = True,
+    db: Session = Depends(deps.get_db),
+) -> Any:
+    """
+    Load a CSV (or gzipped CSV) file into a table.
+    Existing rows are updated unless `update` is false.
+    """
+    if table not in ingestable_models:
+        raise HTTPException(status_code=404, detail=f"Cannot ingest into {table}")
+
+    try:
+        r = ingest_csv(db, table, file.file, update=update)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except DBAPIError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e.orig).strip())
+
+    return {"success": True, "data": r}
@@ -1,35 +1,39 @@
-import json
-from typing import Any, List
+from typing import Any, List, Union
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute, dependencies=[Depends(deps.ConditionalGet("region"))]
+)
 
 
 @router.post("/", response_model=schemas.Region)
 async def create_region(
     region_in: schemas.RegionCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new region.
     """
     try:
-        region = crud.region.create(db=db, obj_in=region_in)
+        region = await crud.region.create(db=db, obj_in=region_in, load=schemas.Region)
     except Exception:
         raise HTTPException(
             status_code=400, detail="Region with this ID already exists"
         )
 
-    await cache.hset("region", region.id, json.dumps(region.to_dict()))
+    await caches.region.set(cache, region)
 
     return region
 
@@ -37,15 +41,13 @@ async def create_region(
 @router.get("/{id}", response_model=schemas.Region)
 async def get_region(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get region by ID."""
-    r = await cache.hget("region", id)
-    if r:
-        return json.loads(r)
-
-    r = crud.region.get(db, id)
+    r = await caches.region.get_or_load(
+        cache, id, lambda: crud.region.get(db, id, load=schemas.Region)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="Region not found")
 
@@ -56,19 +58,21 @@ async def get_region(
 async def update_region(
     id: str,
     region_in: schemas.RegionUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a region.
     """
-    region = crud.region.get(db=db, id=id)
+    region = await crud.region.get(db=db, id=id)
     if not region:
         raise HTTPException(status_code=404, detail="Region not found")
 
-    region = crud.region.update(db=db, db_obj=region, obj_in=region_in)
+    region = await crud.region.update(
+        db=db, db_obj=region, obj_in=region_in, load=schemas.Region
+    )
 
-    await cache.hset("region", region.id, json.dumps(region.to_dict()))
+    await caches.region.set(cache, region)
 
     return region
 
@@ -76,30 +80,84 @@ async def update_region(
 @router.delete("/{id}", response_model=schemas.Region)
 async def delete_region(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an region.
     """
-    region = crud.region.get(db=db, id=id)
+    region = await crud.region.get(db=db, id=id)
     if not region:
         raise HTTPException(status_code=404, detail="Region not found")
 
-    region = crud.region.remove(db=db, id=id)
+    region = await crud.region.remove(db=db, id=id, load=schemas.Region)
 
-    await cache.hdel("region", id)
+    await caches.region.delete(cache, id)
 
     return region
 
 
-@router.get("/", response_model=List[schemas.Region])
+@router.get("/", response_model=Union[List[schemas.Region], schemas.RegionListResponse])
 async def list_regions(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve countries.
     """
-    rows = crud.region.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.region, schemas.Region)
+
+    try:
+        rows, next_cursor = await crud.region.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.Region
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if not page.paged:
+        # The plain list of the first PAGE_SIZE rows this endpoint has
+        # always returned; the envelope only for clients asking for pages
+        return rows
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.RegionBatchResponse)
+async def batch_get_region(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get regions by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.region.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.region.get_many(db, ids, load=schemas.Region),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_region(
+    regions_in: List[schemas.RegionCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update regions in bulk, reporting the outcome of every row.
+    """
+    if len(regions_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.region.bulk_upsert(
+        db, objs_in=regions_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return rows
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
@@ -1,35 +1,39 @@
-import json
-from typing import Any
+from typing import Any, List
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute, dependencies=[Depends(deps.ConditionalGet("sector"))]
+)
 
 
 @router.post("/", response_model=schemas.SectorResponse)
 async def create_sector(
     sector_in: schemas.SectorCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new sector.
     """
     try:
-        sector = crud.sector.create(db=db, obj_in=sector_in)
+        sector = await crud.sector.create(db=db, obj_in=sector_in, load=schemas.Sector)
     except Exception:
         raise HTTPException(
             status_code=400, detail="Sector with this ID already exists"
         )
 
-    await cache.hset("sector", sector.id, json.dumps(sector.to_dict()))
+    await caches.sector.set(cache, sector)
 
     return {"success": True, "data": sector}
 
@@ -37,11 +41,13 @@ async def create_sector(
 @router.get("/{id}", response_model=schemas.SectorResponse)
 async def get_sector(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get sector by ID."""
-    r = crud.sector.get(db, id)
+    r = await caches.sector.get_or_load(
+        cache, id, lambda: crud.sector.get(db, id, load=schemas.Sector)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="Sector not found")
 
@@ -52,17 +58,21 @@ async def get_sector(
 async def update_sector(
     id: str,
     sector_in: schemas.SectorUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a sector.
     """
-    sector = crud.sector.get(db=db, id=id)
+    sector = await crud.sector.get(db=db, id=id)
     if not sector:
         raise HTTPException(status_code=404, detail="Sector not found")
 
-    sector = crud.sector.update(db=db, db_obj=sector, obj_in=sector_in)
+    sector = await crud.sector.update(
+        db=db, db_obj=sector, obj_in=sector_in, load=schemas.Sector
+    )
+
+    await caches.sector.set(cache, sector)
 
     return {"success": True, "data": sector}
 
@@ -70,28 +80,80 @@ async def update_sector(
 @router.delete("/{id}", response_model=schemas.SectorResponse)
 async def delete_sector(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an sector.
     """
-    sector = crud.sector.get(db=db, id=id)
+    sector = await crud.sector.get(db=db, id=id)
     if not sector:
         raise HTTPException(status_code=404, detail="Sector not found")
 
-    sector = crud.sector.remove(db=db, id=id)
+    sector = await crud.sector.remove(db=db, id=id, load=schemas.Sector)
+
+    await caches.sector.delete(cache, id)
 
     return {"success": True, "data": None}
 
 
 @router.get("/", response_model=schemas.SectorListResponse)
 async def list_sectors(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve sectors.
     """
-    rows = crud.sector.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.sector, schemas.Sector)
+
+    try:
+        rows, next_cursor = await crud.sector.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.Sector
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.SectorBatchResponse)
+async def batch_get_sector(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get sectors by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.sector.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.sector.get_many(db, ids, load=schemas.Sector),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_sector(
+    sectors_in: List[schemas.SectorCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update sectors in bulk, reporting the outcome of every row.
+    """
+    if len(sectors_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.sector.bulk_upsert(
+        db, objs_in=sectors_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return {"success": True, "data": rows}
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
@@ -4,7 +4,8 @@ from typing import Any
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
@@ -16,21 +17,23 @@ router = APIRouter(route_class=TimedRoute)
 @router.post("/", response_model=schemas.SectorClassResponse)
 async def create_sector_class(
     sector_class_in: schemas.SectorClassCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new sector_class.
     """
     try:
-        sector_class = crud.sector_class.create(db=db, obj_in=sector_class_in)
+        sector_class = await crud.sector_class.create(db=db, obj_in=sector_class_in)
     except Exception:
         raise HTTPException(
             status_code=400, detail="SectorClass with this ID already exists"
         )
 
     await cache.hset(
-        "sector_class", sector_class.id, json.dumps(sector_class.to_dict())
+        "sector_class",
+        sector_class.id,
+        json.dumps(jsonable_encoder(schemas.SectorClass.from_orm(sector_class))),
     )
 
     return {"success": True, "data": sector_class}
@@ -39,7 +42,7 @@ async def create_sector_class(
 @router.get("/{id}", response_model=schemas.SectorClassResponse)
 async def get_sector_class(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get sector_class by ID."""
@@ -47,7 +50,7 @@ async def get_sector_class(
     if r:
         return {"success": True, "data": json.loads(r)}
 
-    r = crud.sector_class.get(db, id)
+    r = await crud.sector_class.get(db, id)
     if not r:
         raise HTTPException(status_code=401, detail="SectorClass not found")
 
@@ -58,22 +61,24 @@ async def get_sector_class(
 async def update_sector_class(
     id: str,
     sector_class_in: schemas.SectorClassUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a sector_class.
     """
-    sector_class = crud.sector_class.get(db=db, id=id)
+    sector_class = await crud.sector_class.get(db=db, id=id)
     if not sector_class:
         raise HTTPException(status_code=404, detail="SectorClass not found")
 
-    sector_class = crud.sector_class.update(
+    sector_class = await crud.sector_class.update(
         db=db, db_obj=sector_class, obj_in=sector_class_in
     )
 
     await cache.hset(
-        "sector_class", sector_class.id, json.dumps(sector_class.to_dict())
+        "sector_class",
+        sector_class.id,
+        json.dumps(jsonable_encoder(schemas.SectorClass.from_orm(sector_class))),
     )
 
     return {"success": True, "data": sector_class}
@@ -82,17 +87,17 @@ async def update_sector_class(
 @router.delete("/{id}", response_model=schemas.SectorClassResponse)
 async def delete_sector_class(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an sector_class.
     """
-    sector_class = crud.sector_class.get(db=db, id=id)
+    sector_class = await crud.sector_class.get(db=db, id=id)
     if not sector_class:
         raise HTTPException(status_code=404, detail="SectorClass not found")
 
-    sector_class = crud.sector_class.remove(db=db, id=id)
+    sector_class = await crud.sector_class.remove(db=db, id=id)
 
     await cache.hdel("sector_class", id)
 
@@ -101,11 +106,11 @@ async def delete_sector_class(
 
 @router.get("/", response_model=schemas.SectorClassListResponse)
 async def list_sector_classs(
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve sector_classs.
     """
-    rows = crud.sector_class.get_multi(db, limit=1000)
+    rows = await crud.sector_class.get_multi(db, limit=1000)
 
     return {"success": True, "data": rows}
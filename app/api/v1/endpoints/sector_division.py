@@ -1,37 +1,42 @@
-import json
-from typing import Any
+from typing import Any, List
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute,
+    dependencies=[Depends(deps.ConditionalGet("sector_division"))],
+)
 
 
 @router.post("/", response_model=schemas.SectorDivisionResponse)
 async def create_sector_division(
     sector_division_in: schemas.SectorDivisionCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new sector_division.
     """
     try:
-        sector_division = crud.sector_division.create(db=db, obj_in=sector_division_in)
+        sector_division = await crud.sector_division.create(
+            db=db, obj_in=sector_division_in, load=schemas.SectorDivision
+        )
     except Exception:
         raise HTTPException(
             status_code=400, detail="SectorDivision with this ID already exists"
         )
 
-    await cache.hset(
-        "sector_division", sector_division.id, json.dumps(sector_division.to_dict())
-    )
+    await caches.sector_division.set(cache, sector_division)
 
     return {"success": True, "data": sector_division}
 
@@ -39,15 +44,13 @@ async def create_sector_division(
 @router.get("/{id}", response_model=schemas.SectorDivisionResponse)
 async def get_sector_division(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get sector_division by ID."""
-    r = await cache.hget("sector_division", id)
-    if r:
-        return {"success": True, "data": json.loads(r)}
-
-    r = crud.sector_division.get(db, id)
+    r = await caches.sector_division.get_or_load(
+        cache, id, lambda: crud.sector_division.get(db, id, load=schemas.SectorDivision)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="SectorDivision not found")
 
@@ -58,23 +61,24 @@ async def get_sector_division(
 async def update_sector_division(
     id: str,
     sector_division_in: schemas.SectorDivisionUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a sector_division.
     """
-    sector_division = crud.sector_division.get(db=db, id=id)
+    sector_division = await crud.sector_division.get(db=db, id=id)
     if not sector_division:
         raise HTTPException(status_code=404, detail="SectorDivision not found")
 
-    sector_division = crud.sector_division.update(
-        db=db, db_obj=sector_division, obj_in=sector_division_in
+    sector_division = await crud.sector_division.update(
+        db=db,
+        db_obj=sector_division,
+        obj_in=sector_division_in,
+        load=schemas.SectorDivision,
     )
 
-    await cache.hset(
-        "sector_division", sector_division.id, json.dumps(sector_division.to_dict())
-    )
+    await caches.sector_division.set(cache, sector_division)
 
     return {"success": True, "data": sector_division}
 
@@ -82,30 +86,82 @@ async def update_sector_division(
 @router.delete("/{id}", response_model=schemas.SectorDivisionResponse)
 async def delete_sector_division(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an sector_division.
     """
-    sector_division = crud.sector_division.get(db=db, id=id)
+    sector_division = await crud.sector_division.get(db=db, id=id)
     if not sector_division:
         raise HTTPException(status_code=404, detail="SectorDivision not found")
 
-    sector_division = crud.sector_division.remove(db=db, id=id)
+    sector_division = await crud.sector_division.remove(
+        db=db, id=id, load=schemas.SectorDivision
+    )
 
-    await cache.hdel("sector_division", id)
+    await caches.sector_division.delete(cache, id)
 
     return {"success": True, "data": sector_division}
 
 
 @router.get("/", response_model=schemas.SectorDivisionListResponse)
 async def list_sector_divisions(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve sector_divisions.
     """
-    rows = crud.sector_division.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.sector_division, schemas.SectorDivision)
+
+    try:
+        rows, next_cursor = await crud.sector_division.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.SectorDivision
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.SectorDivisionBatchResponse)
+async def batch_get_sector_division(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get sector_divisions by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.sector_division.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.sector_division.get_many(db, ids, load=schemas.SectorDivision),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_sector_division(
+    sector_divisions_in: List[schemas.SectorDivisionCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update sector_divisions in bulk, reporting the outcome of every row.
+    """
+    if len(sector_divisions_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.sector_division.bulk_upsert(
+        db, objs_in=sector_divisions_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return {"success": True, "data": rows}
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
@@ -1,37 +1,41 @@
-import json
-from typing import Any
+from typing import Any, List
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute, dependencies=[Depends(deps.ConditionalGet("sector_group"))]
+)
 
 
 @router.post("/", response_model=schemas.SectorGroupResponse)
 async def create_sector_group(
     sector_group_in: schemas.SectorGroupCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new sector_group.
     """
     try:
-        sector_group = crud.sector_group.create(db=db, obj_in=sector_group_in)
+        sector_group = await crud.sector_group.create(
+            db=db, obj_in=sector_group_in, load=schemas.SectorGroup
+        )
     except Exception:
         raise HTTPException(
             status_code=400, detail="SectorGroup with this ID already exists"
         )
 
-    await cache.hset(
-        "sector_group", sector_group.id, json.dumps(sector_group.to_dict())
-    )
+    await caches.sector_group.set(cache, sector_group)
 
     return {"success": True, "data": sector_group}
 
@@ -39,15 +43,13 @@ async def create_sector_group(
 @router.get("/{id}", response_model=schemas.SectorGroupResponse)
 async def get_sector_group(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get sector_group by ID."""
-    r = await cache.hget("sector_group", id)
-    if r:
-        return {"success": True, "data": json.loads(r)}
-
-    r = crud.sector_group.get(db, id)
+    r = await caches.sector_group.get_or_load(
+        cache, id, lambda: crud.sector_group.get(db, id, load=schemas.SectorGroup)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="SectorGroup not found")
 
@@ -58,23 +60,21 @@ async def get_sector_group(
 async def update_sector_group(
     id: str,
     sector_group_in: schemas.SectorGroupUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a sector_group.
     """
-    sector_group = crud.sector_group.get(db=db, id=id)
+    sector_group = await crud.sector_group.get(db=db, id=id)
     if not sector_group:
         raise HTTPException(status_code=404, detail="SectorGroup not found")
 
-    sector_group = crud.sector_group.update(
-        db=db, db_obj=sector_group, obj_in=sector_group_in
+    sector_group = await crud.sector_group.update(
+        db=db, db_obj=sector_group, obj_in=sector_group_in, load=schemas.SectorGroup
     )
 
-    await cache.hset(
-        "sector_group", sector_group.id, json.dumps(sector_group.to_dict())
-    )
+    await caches.sector_group.set(cache, sector_group)
 
     return {"success": True, "data": sector_group}
 
@@ -82,30 +82,82 @@ async def update_sector_group(
 @router.delete("/{id}", response_model=schemas.SectorGroupResponse)
 async def delete_sector_group(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an sector_group.
     """
-    sector_group = crud.sector_group.get(db=db, id=id)
+    sector_group = await crud.sector_group.get(db=db, id=id)
     if not sector_group:
         raise HTTPException(status_code=404, detail="SectorGroup not found")
 
-    sector_group = crud.sector_group.remove(db=db, id=id)
+    sector_group = await crud.sector_group.remove(
+        db=db, id=id, load=schemas.SectorGroup
+    )
 
-    await cache.hdel("sector_group", id)
+    await caches.sector_group.delete(cache, id)
 
     return {"success": True, "data": sector_group}
 
 
 @router.get("/", response_model=schemas.SectorGroupListResponse)
 async def list_sector_groups(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve sector_groups.
     """
-    rows = crud.sector_group.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.sector_group, schemas.SectorGroup)
+
+    try:
+        rows, next_cursor = await crud.sector_group.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.SectorGroup
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.SectorGroupBatchResponse)
+async def batch_get_sector_group(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get sector_groups by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.sector_group.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.sector_group.get_many(db, ids, load=schemas.SectorGroup),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_sector_group(
+    sector_groups_in: List[schemas.SectorGroupCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update sector_groups in bulk, reporting the outcome of every row.
+    """
+    if len(sector_groups_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.sector_group.bulk_upsert(
+        db, objs_in=sector_groups_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return {"success": True, "data": rows}
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
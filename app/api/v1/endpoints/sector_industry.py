@@ -1,37 +1,42 @@
-import json
-from typing import Any
+from typing import Any, List
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute,
+    dependencies=[Depends(deps.ConditionalGet("sector_industry"))],
+)
 
 
 @router.post("/", response_model=schemas.SectorIndustryResponse)
 async def create_sector_industry(
     sector_industry_in: schemas.SectorIndustryCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new sector_industry.
     """
     try:
-        sector_industry = crud.sector_industry.create(db=db, obj_in=sector_industry_in)
+        sector_industry = await crud.sector_industry.create(
+            db=db, obj_in=sector_industry_in, load=schemas.SectorIndustry
+        )
     except Exception:
         raise HTTPException(
             status_code=400, detail="SectorIndustry with this ID already exists"
         )
 
-    await cache.hset(
-        "sector_industry", sector_industry.id, json.dumps(sector_industry.to_dict())
-    )
+    await caches.sector_industry.set(cache, sector_industry)
 
     return {"success": True, "data": sector_industry}
 
@@ -39,15 +44,13 @@ async def create_sector_industry(
 @router.get("/{id}", response_model=schemas.SectorIndustryResponse)
 async def get_sector_industry(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get sector_industry by ID."""
-    r = await cache.hget("sector_industry", id)
-    if r:
-        return {"success": True, "data": json.loads(r)}
-
-    r = crud.sector_industry.get(db, id)
+    r = await caches.sector_industry.get_or_load(
+        cache, id, lambda: crud.sector_industry.get(db, id, load=schemas.SectorIndustry)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="SectorIndustry not found")
 
@@ -58,23 +61,24 @@ async def get_sector_industry(
 async def update_sector_industry(
     id: str,
     sector_industry_in: schemas.SectorIndustryUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a sector_industry.
     """
-    sector_industry = crud.sector_industry.get(db=db, id=id)
+    sector_industry = await crud.sector_industry.get(db=db, id=id)
     if not sector_industry:
         raise HTTPException(status_code=404, detail="SectorIndustry not found")
 
-    sector_industry = crud.sector_industry.update(
-        db=db, db_obj=sector_industry, obj_in=sector_industry_in
+    sector_industry = await crud.sector_industry.update(
+        db=db,
+        db_obj=sector_industry,
+        obj_in=sector_industry_in,
+        load=schemas.SectorIndustry,
     )
 
-    await cache.hset(
-        "sector_industry", sector_industry.id, json.dumps(sector_industry.to_dict())
-    )
+    await caches.sector_industry.set(cache, sector_industry)
 
     return {"success": True, "data": sector_industry}
 
@@ -82,30 +86,82 @@ async def update_sector_industry(
 @router.delete("/{id}", response_model=schemas.SectorIndustryResponse)
 async def delete_sector_industry(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an sector_industry.
     """
-    sector_industry = crud.sector_industry.get(db=db, id=id)
+    sector_industry = await crud.sector_industry.get(db=db, id=id)
     if not sector_industry:
         raise HTTPException(status_code=404, detail="SectorIndustry not found")
 
-    sector_industry = crud.sector_industry.remove(db=db, id=id)
+    sector_industry = await crud.sector_industry.remove(
+        db=db, id=id, load=schemas.SectorIndustry
+    )
 
-    await cache.hdel("sector_industry", id)
+    await caches.sector_industry.delete(cache, id)
 
     return {"success": True, "data": sector_industry}
 
 
 @router.get("/", response_model=schemas.SectorIndustryListResponse)
 async def list_sector_industries(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve sector_industrys.
     """
-    rows = crud.sector_industry.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.sector_industry, schemas.SectorIndustry)
+
+    try:
+        rows, next_cursor = await crud.sector_industry.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.SectorIndustry
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.SectorIndustryBatchResponse)
+async def batch_get_sector_industry(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get sector_industrys by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.sector_industry.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.sector_industry.get_many(db, ids, load=schemas.SectorIndustry),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_sector_industry(
+    sector_industrys_in: List[schemas.SectorIndustryCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update sector_industrys in bulk, reporting the outcome of every row.
+    """
+    if len(sector_industrys_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.sector_industry.bulk_upsert(
+        db, objs_in=sector_industrys_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return {"success": True, "data": rows}
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
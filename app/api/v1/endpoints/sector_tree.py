@@ -0,0 +1,57 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app import schemas
+from app.api import deps
+from app.api.files import etag_matches
+from app.core.logger import TimedRoute, log  # noqa
+from app.core.sector_tree import Key, SectorLevel, sector_tree
+
+router = APIRouter(route_class=TimedRoute)
+
+
+async def tree_response(
+    request: Request, db: AsyncSession, key: Optional[Key] = None
+) -> Response:
+    await sector_tree.refresh(db)
+    encoded = sector_tree.encoded(key)
+    if encoded is None:
+        raise HTTPException(status_code=404, detail="Sector node not found")
+
+    body, etag = encoded
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+@router.get(
+    "/",
+    response_class=Response,
+    responses={200: {"model": schemas.SectorIndustryListResponse}},
+)
+async def get_sector_tree(
+    request: Request,
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Response:
+    """
+    Retrieve the whole industry > division > group > sector hierarchy.
+    """
+    return await tree_response(request, db)
+
+
+@router.get("/{level}/{id}", response_class=Response)
+async def get_sector_subtree(
+    level: SectorLevel,
+    id: str,
+    request: Request,
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Response:
+    """
+    Retrieve the hierarchy below one industry, division, group or sector.
+    """
+    return await tree_response(request, db, (level, id))
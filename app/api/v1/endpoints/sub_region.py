@@ -1,35 +1,41 @@
-import json
-from typing import Any, List
+from typing import Any, List, Union
 
 import aioredis
 import fastapi_plugins
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, schemas
 from app.api import deps
+from app.api.streaming import ndjson_response
+from app.core import cache as caches
+from app.core.config import settings
 from app.core.logger import TimedRoute, log  # noqa
 
-router = APIRouter(route_class=TimedRoute)
+router = APIRouter(
+    route_class=TimedRoute, dependencies=[Depends(deps.ConditionalGet("sub_region"))]
+)
 
 
 @router.post("/", response_model=schemas.SubRegion)
 async def create_sub_region(
     sub_region_in: schemas.SubRegionCreate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Create new sub_region.
     """
     try:
-        sub_region = crud.sub_region.create(db=db, obj_in=sub_region_in)
+        sub_region = await crud.sub_region.create(
+            db=db, obj_in=sub_region_in, load=schemas.SubRegion
+        )
     except Exception:
         raise HTTPException(
             status_code=400, detail="SubRegion with this ID already exists"
         )
 
-    await cache.hset("sub_region", sub_region.id, json.dumps(sub_region.to_dict()))
+    await caches.sub_region.set(cache, sub_region)
 
     return {"success": True, "data": sub_region}
 
@@ -37,11 +43,13 @@ async def create_sub_region(
 @router.get("/{id}", response_model=schemas.SubRegion)
 async def get_sub_region(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """Get sub_region by ID."""
-    r = crud.sub_region.get(db, id)
+    r = await caches.sub_region.get_or_load(
+        cache, id, lambda: crud.sub_region.get(db, id, load=schemas.SubRegion)
+    )
     if not r:
         raise HTTPException(status_code=401, detail="SubRegion not found")
 
@@ -52,17 +60,21 @@ async def get_sub_region(
 async def update_sub_region(
     id: str,
     sub_region_in: schemas.SubRegionUpdate,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Update a sub_region.
     """
-    sub_region = crud.sub_region.get(db=db, id=id)
+    sub_region = await crud.sub_region.get(db=db, id=id)
     if not sub_region:
         raise HTTPException(status_code=404, detail="SubRegion not found")
 
-    sub_region = crud.sub_region.update(db=db, db_obj=sub_region, obj_in=sub_region_in)
+    sub_region = await crud.sub_region.update(
+        db=db, db_obj=sub_region, obj_in=sub_region_in, load=schemas.SubRegion
+    )
+
+    await caches.sub_region.set(cache, sub_region)
 
     return {"success": True, "data": sub_region}
 
@@ -70,28 +82,86 @@ async def update_sub_region(
 @router.delete("/{id}", response_model=schemas.SubRegion)
 async def delete_sub_region(
     id: str,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
 ) -> Any:
     """
     Delete an sub_region.
     """
-    sub_region = crud.sub_region.get(db=db, id=id)
+    sub_region = await crud.sub_region.get(db=db, id=id)
     if not sub_region:
         raise HTTPException(status_code=404, detail="SubRegion not found")
 
-    sub_region = crud.sub_region.remove(db=db, id=id)
+    sub_region = await crud.sub_region.remove(db=db, id=id, load=schemas.SubRegion)
+
+    await caches.sub_region.delete(cache, id)
 
     return {"success": True, "data": None}
 
 
-@router.get("/", response_model=List[schemas.SubRegion])
+@router.get(
+    "/", response_model=Union[List[schemas.SubRegion], schemas.SubRegionListResponse]
+)
 async def list_sub_regions(
-    db: Session = Depends(deps.get_db),
+    page: deps.PageParams = Depends(),
+    db: AsyncSession = Depends(deps.get_async_db),
 ) -> Any:
     """
     Retrieve sub_regions.
     """
-    rows = crud.sub_region.get_multi(db, limit=1000)
+    if page.stream:
+        return ndjson_response(crud.sub_region, schemas.SubRegion)
+
+    try:
+        rows, next_cursor = await crud.sub_region.get_page(
+            db, cursor=page.cursor, limit=page.limit, load=schemas.SubRegion
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if not page.paged:
+        # The plain list of the first PAGE_SIZE rows this endpoint has
+        # always returned; the envelope only for clients asking for pages
+        return rows
+    return {"success": True, "data": rows, "next": next_cursor}
+
+
+@router.post("/batch-get", response_model=schemas.SubRegionBatchResponse)
+async def batch_get_sub_region(
+    batch_in: schemas.BatchGetRequest,
+    db: AsyncSession = Depends(deps.get_async_db),
+    cache: aioredis.Redis = Depends(fastapi_plugins.depends_redis),
+) -> Any:
+    """
+    Get sub_regions by ID, in request order.
+    Unknown IDs come back as null and are listed in `missing`.
+    """
+    rows = await caches.sub_region.get_many(
+        cache,
+        batch_in.ids,
+        lambda ids: crud.sub_region.get_many(db, ids, load=schemas.SubRegion),
+    )
+    missing = [id for id, r in zip(batch_in.ids, rows) if r is None]
+
+    return {"success": True, "data": rows, "missing": missing}
+
+
+@router.post("/bulk", response_model=schemas.BulkUpsertResponse)
+async def bulk_upsert_sub_region(
+    sub_regions_in: List[schemas.SubRegionCreate],
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Create or update sub_regions in bulk, reporting the outcome of every row.
+    """
+    if len(sub_regions_in) > settings.BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_ROWS} rows per request",
+        )
+
+    r = await crud.sub_region.bulk_upsert(
+        db, objs_in=sub_regions_in, chunk_size=settings.BULK_CHUNK_SIZE
+    )
 
-    return {"success": True, "data": rows}
+    return {"success": all(s["status"] != "failed" for s in r), "data": r}
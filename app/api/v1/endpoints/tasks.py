@@ -0,0 +1,25 @@
+from typing import Any
+
+from fastapi import APIRouter
+
+from app import schemas
+from app.core.celery_app import celery_app
+from app.core.logger import TimedRoute, log  # noqa
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get("/{task_id}", response_model=schemas.TaskStatusResponse)
+def get_task_status(task_id: str) -> Any:
+    """
+    Poll a background processing task. `status` is one of PENDING, STARTED,
+    RETRY, FAILURE or SUCCESS; unknown ids stay PENDING.
+    """
+    r = celery_app.AsyncResult(task_id)
+    data = {"id": task_id, "status": r.status}
+    if r.successful():
+        data["result"] = r.result
+    elif r.failed():
+        data["error"] = str(r.result)
+
+    return {"success": True, "data": data}
@@ -0,0 +1,636 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
+
+import aioredis
+import redis
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.core.config import settings
+from app.core.logger import log
+from app.core.metrics import CACHE_LOOKUPS
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+# Seconds between attempts to renew a lost subscription, doubling up to max
+RESUBSCRIBE_MIN_DELAY = 1
+RESUBSCRIBE_MAX_DELAY = 30
+# Hashes of table name -> write counter, and -> time of the last write
+REVISIONS_KEY = "cache:revisions"
+MODIFIED_KEY = "cache:modified"
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache whose entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+# Lookup result: ModelCache attribute counting it
+LOOKUP_COUNTERS = {
+    "local_hit": "local_hits",
+    "hit": "hits",
+    "negative_hit": "negative_hits",
+    "miss": "misses",
+}
+
+
+class ModelCache:
+    """
+    Cache-aside access to the Redis hash holding one model's rows.
+
+    Rows are stored under `name` as JSON encoded with the response `schema`,
+    so a cache hit can be returned as-is. Ids that are not in the database
+    are remembered for `negative_ttl` seconds under `name:missing:<id>` so
+    repeated lookups for them do not reach Postgres either.
+
+    `dependents` names the hashes whose cached rows embed this model through
+    a relationship; they are dropped whenever a row of this model changes.
+
+    Ids are normalised through the type of the table's primary key, so
+    that "01" and 1, or an upper and a lower case UUID, share one entry.
+
+    With `local=True` decoded rows are also kept in a per-worker `LocalCache`
+    in front of Redis. Workers drop their local copies when a change is
+    announced on `INVALIDATION_CHANNEL` (see `CacheInvalidator`).
+
+    Rows loaded on a miss are only kept if the table revision (bumped by
+    `CacheInvalidator` before it evicts) is the one read before loading,
+    so a load racing a commit cannot leave its stale copy behind.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        schema: Type[BaseModel],
+        *,
+        ttl: int = settings.CACHE_TTL,
+        negative_ttl: int = settings.CACHE_NEGATIVE_TTL,
+        dependents: Sequence[str] = (),
+        local: bool = False,
+    ):
+        self.name = name
+        self.schema = schema
+        table = models.metadata.tables.get(name)
+        self.key_type = table.c.id.type.python_type if table is not None else str
+        self.dependents = list(dependents)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local = (
+            LocalCache(settings.CACHE_LOCAL_SIZE, settings.CACHE_LOCAL_TTL)
+            if local
+            else None
+        )
+        self.local_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def key(self, id: Any) -> Optional[str]:
+        """
+        `id` as stored in the hash, or None when it is not valid for the
+        primary key.
+        """
+        try:
+            if not isinstance(id, self.key_type):
+                id = self.key_type(id)
+        except (TypeError, ValueError):
+            return None
+        return str(id)
+
+    def _missing_key(self, id: Any) -> str:
+        return f"{self.name}:missing:{id}"
+
+    def encode(self, obj: Any) -> Dict[str, Any]:
+        return jsonable_encoder(self.schema.from_orm(obj))
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(self.encode(obj))
+
+    def evict_local(self, id: Optional[str] = None) -> None:
+        if self.local is None:
+            return
+        if id is None:
+            self.local.clear()
+        else:
+            self.local.delete(id)
+
+    async def set(self, cache: aioredis.Redis, obj: Any) -> None:
+        value = self.encode(obj)
+        await cache.hset(self.name, str(obj.id), json.dumps(value))
+        await cache.expire(self.name, self.ttl)
+        await cache.delete(self._missing_key(obj.id))
+        if self.local is not None:
+            self.local.set(str(obj.id), value)
+
+    async def set_missing(self, cache: aioredis.Redis, id: Any) -> None:
+        await cache.set(self._missing_key(id), 1, expire=self.negative_ttl)
+
+    async def delete(self, cache: aioredis.Redis, id: Any) -> None:
+        self.evict_local(str(id))
+        await cache.hdel(self.name, str(id))
+
+    async def fill(
+        self,
+        cache: aioredis.Redis,
+        revision: int,
+        values: Dict[str, Any],
+        missing: Sequence[str] = (),
+    ) -> bool:
+        """
+        Cache the encoded rows `values` and the ids found `missing`, loaded
+        at table `revision` (read before loading). When a commit has bumped
+        the revision since, it may have evicted before these were written,
+        so they are taken back out. Returns whether they were kept.
+        """
+        pipe = cache.pipeline()
+        if values:
+            pipe.hmset_dict(self.name, {k: json.dumps(v) for k, v in values.items()})
+            pipe.expire(self.name, self.ttl)
+        for key in missing:
+            pipe.set(self._missing_key(key), 1, expire=self.negative_ttl)
+        current = pipe.hget(REVISIONS_KEY, self.name)
+        await pipe.execute()
+        if int(await current or 0) == revision:
+            if self.local is not None:
+                for key, value in values.items():
+                    self.local.set(key, value)
+            return True
+
+        pipe = cache.pipeline()
+        if values:
+            pipe.hdel(self.name, *values)
+        if missing:
+            pipe.delete(*[self._missing_key(key) for key in missing])
+        await pipe.execute()
+        return False
+
+    async def get_or_load(
+        self,
+        cache: aioredis.Redis,
+        id: Any,
+        loader: Callable[[], Awaitable[Optional[Any]]],
+    ) -> Optional[Any]:
+        """
+        Return the cached row for `id`, calling `loader` and caching its
+        result on a miss. Returns None when the row does not exist.
+        """
+        key = str(id)
+        if self.local is not None:
+            r = self.local.get(key)
+            if r is not None:
+                self._count("local_hit")
+                return r
+
+        r = await cache.hget(self.name, key)
+        if r is not None:
+            self._count("hit")
+            r = json.loads(r)
+            if self.local is not None:
+                self.local.set(key, r)
+            return r
+
+        pipe = cache.pipeline()
+        flag = pipe.get(self._missing_key(id))
+        revision = pipe.hget(REVISIONS_KEY, self.name)
+        await pipe.execute()
+        if await flag:
+            self._count("negative_hit")
+            return None
+
+        self._count("miss")
+        revision = int(await revision or 0)
+        obj = await loader()
+        if obj is None:
+            await self.fill(cache, revision, {}, [key])
+            return None
+
+        await self.fill(cache, revision, {key: self.encode(obj)})
+        return obj
+
+    async def get_many(
+        self,
+        cache: aioredis.Redis,
+        ids: Sequence[Any],
+        loader: Callable[[List[str]], Awaitable[List[Any]]],
+    ) -> List[Optional[Any]]:
+        """
+        Batch `get_or_load`: return the rows for `ids` in request order, None
+        for ids that do not exist.
+
+        Ids not in the local tier are read with one HMGET, and the ones
+        Redis does not know either are passed to `loader` in a single call.
+        Ids that are not valid for the primary key come back as None.
+        """
+        requested = [self.key(id) for id in ids]
+        keys = list(dict.fromkeys(key for key in requested if key is not None))
+        found: Dict[str, Any] = {}
+        if self.local is not None:
+            for key in keys:
+                r = self.local.get(key)
+                if r is not None:
+                    self._count("local_hit")
+                    found[key] = r
+
+        pending = [key for key in keys if key not in found]
+        if pending:
+            for key, r in zip(pending, await cache.hmget(self.name, *pending)):
+                if r is not None:
+                    self._count("hit")
+                    found[key] = json.loads(r)
+                    if self.local is not None:
+                        self.local.set(key, found[key])
+            pending = [key for key in pending if key not in found]
+
+        if pending:
+            pipe = cache.pipeline()
+            flags = pipe.mget(*[self._missing_key(key) for key in pending])
+            revision = pipe.hget(REVISIONS_KEY, self.name)
+            await pipe.execute()
+            flags = await flags
+            self._count("negative_hit", sum(1 for f in flags if f))
+            pending = [key for key, f in zip(pending, flags) if not f]
+
+        if pending:
+            self._count("miss", len(pending))
+            revision = int(await revision or 0)
+            loaded = {str(obj.id): obj for obj in await loader(pending)}
+            await self.fill(
+                cache,
+                revision,
+                {key: self.encode(obj) for key, obj in loaded.items()},
+                [key for key in pending if key not in loaded],
+            )
+            found.update(loaded)
+
+        return [found.get(key) if key is not None else None for key in requested]
+
+    def _count(self, result: str, n: int = 1) -> None:
+        attr = LOOKUP_COUNTERS[result]
+        setattr(self, attr, getattr(self, attr) + n)
+        CACHE_LOOKUPS.labels(self.name, result).inc(n)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "local_hits": self.local_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+        }
+
+
+country = ModelCache("country", schemas.Country, dependents=["sub_region"], local=True)
+country_contact = ModelCache("country_contact", schemas.CountryContact)
+country_document = ModelCache("country_document", schemas.CountryDocument)
+country_sector = ModelCache("country_sector", schemas.CountrySector)
+sector = ModelCache(
+    "sector",
+    schemas.Sector,
+    dependents=["sector_group", "sector_division", "sector_industry"],
+    local=True,
+)
+sector_group = ModelCache(
+    "sector_group",
+    schemas.SectorGroup,
+    dependents=["sector_division", "sector_industry"],
+    local=True,
+)
+sector_division = ModelCache(
+    "sector_division",
+    schemas.SectorDivision,
+    dependents=["sector_industry"],
+    local=True,
+)
+sector_industry = ModelCache("sector_industry", schemas.SectorIndustry, local=True)
+region = ModelCache("region", schemas.Region, local=True)
+sub_region = ModelCache(
+    "sub_region", schemas.SubRegion, dependents=["region"], local=True
+)
+
+model_caches = [
+    country,
+    country_contact,
+    country_document,
+    country_sector,
+    sector,
+    sector_group,
+    sector_division,
+    sector_industry,
+    region,
+    sub_region,
+]
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    return {c.name: c.stats() for c in model_caches}
+
+
+class CacheInvalidator:
+    """
+    Evicts the cache entries of rows written through any SQLAlchemy session.
+
+    Changed rows are collected on flush and evicted once the transaction
+    commits, so writes from the API, celery tasks and scripts all keep the
+    Redis hashes consistent. Inside the event loop (AsyncSession) eviction
+    runs as a task on the aioredis pool passed to `bind`; elsewhere it uses
+    a blocking Redis client.
+
+    Each commit also bumps the revision counters (`REVISIONS_KEY`) of the
+    tables written, cached or not, and of the cached tables embedding their
+    rows; `TableRevisions` reads them for conditional GETs.
+
+    Every eviction is also published on `INVALIDATION_CHANNEL`; `subscribe`
+    applies those messages to this worker's local caches and passes them on
+    to the callbacks registered with `add_listener`.
+    """
+
+    def __init__(self, caches: Sequence[ModelCache]):
+        self.caches = {c.name: c for c in caches}
+        self.redis: Optional[aioredis.Redis] = None
+        self._sync_redis: Optional[redis.Redis] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._subscriber: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        self._listeners.append(listener)
+
+    def bind(self, cache: Optional[aioredis.Redis]) -> None:
+        self.redis = cache
+
+    def listen(self, session_class: Type[Session] = Session) -> None:
+        event.listen(session_class, "after_flush", self.after_flush)
+        event.listen(session_class, "after_commit", self.after_commit)
+        event.listen(session_class, "after_rollback", self.after_rollback)
+
+    def mark(self, session: Session, name: str, ids: Sequence[Any]) -> None:
+        """
+        Evict rows of table `name` when `session` commits. Writes that bypass
+        the unit of work (Core INSERT/UPDATE statements) have to call this.
+        """
+        if name is None:
+            return
+        session.info.setdefault("table_writes", set()).add(name)
+        if name in self.caches:
+            changed = session.info.setdefault("cache_evictions", set())
+            changed.update((name, str(id)) for id in ids)
+
+    def mark_table(self, session: Session, name: str) -> None:
+        """
+        Drop the whole hash of table `name` when `session` commits, for
+        writes too large to list row by row. Negative entries of the table
+        are left to expire.
+        """
+        session.info.setdefault("table_writes", set()).add(name)
+        if name in self.caches:
+            session.info.setdefault("cache_evictions", set()).add((name, None))
+
+    def after_flush(self, session: Session, flush_context: Any) -> None:
+        for obj in chain(session.new, session.dirty, session.deleted):
+            self.mark(session, getattr(obj, "__tablename__", None), [obj.id])
+
+    def after_rollback(self, session: Session) -> None:
+        session.info.pop("cache_evictions", None)
+        session.info.pop("table_writes", None)
+
+    def after_commit(self, session: Session) -> None:
+        changed = session.info.pop("cache_evictions", set())
+        written = session.info.pop("table_writes", set())
+        if not changed and not written:
+            return
+
+        message = self._message(changed, written)
+        self._evict_local(message)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if loop is None:
+            self._evict_sync(message)
+        elif self.redis is not None:
+            task = loop.create_task(self._evict(message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _embedding(self, names: Set[str]) -> Set[str]:
+        # `names` and the cached tables embedding their rows, transitively
+        found, todo = set(), list(names)
+        while todo:
+            name = todo.pop()
+            if name not in found:
+                found.add(name)
+                if name in self.caches:
+                    todo.extend(self.caches[name].dependents)
+        return found
+
+    def _message(
+        self, changed: Set[Tuple[str, Optional[str]]], written: Set[str]
+    ) -> Dict[str, Any]:
+        rows, tables, hashes = set(), set(), set()
+        for name, id in changed:
+            if id is None:
+                tables.add(name)
+            else:
+                rows.add((name, id))
+            hashes.update(self.caches[name].dependents)
+        return {
+            "rows": sorted(rows),
+            "tables": sorted(tables),
+            "hashes": sorted(hashes | tables),
+            "revisions": sorted(self._embedding(written)),
+        }
+
+    def _commands(self, message: Dict[str, Any]):
+        # Revisions first: a load that read the old revision and fills in
+        # after the evictions below sees the new one and takes its rows back
+        now = time.time()
+        for name in message["revisions"]:
+            yield "hincrby", (REVISIONS_KEY, name, 1)
+            yield "hset", (MODIFIED_KEY, name, now)
+        for name, id in message["rows"]:
+            yield "hdel", (name, id)
+            yield "delete", (self.caches[name]._missing_key(id),)
+        if message["hashes"]:
+            yield "delete", tuple(message["hashes"])
+        yield "publish", (INVALIDATION_CHANNEL, json.dumps(message))
+
+    def _evict_local(self, message: Dict[str, Any]) -> None:
+        for name, id in message["rows"]:
+            self.caches[name].evict_local(id)
+        for name in message["hashes"]:
+            self.caches[name].evict_local()
+        for listener in self._listeners:
+            listener(message)
+
+    async def subscribe(self, cache: aioredis.Redis) -> None:
+        """
+        Start applying invalidations published by other workers.
+
+        When the connection is lost the subscription is renewed, retrying
+        with backoff, and the local caches are cleared since messages may
+        have been missed in the meantime.
+        """
+        (channel,) = await cache.subscribe(INVALIDATION_CHANNEL)
+        self._subscriber = asyncio.create_task(self._receive(cache, channel))
+
+    async def unsubscribe(self, cache: aioredis.Redis) -> None:
+        if self._subscriber is None:
+            return
+        self._subscriber.cancel()
+        self._subscriber = None
+        await cache.unsubscribe(INVALIDATION_CHANNEL)
+
+    async def _receive(self, cache: aioredis.Redis, channel: aioredis.Channel) -> None:
+        while True:
+            try:
+                while await channel.wait_message():
+                    try:
+                        self._evict_local(await channel.get_json())
+                    except Exception as e:
+                        log.error(e, exc_info=True)
+            except Exception as e:
+                log.error(e, exc_info=True)
+
+            log.warning("Lost the %s subscription, renewing it", INVALIDATION_CHANNEL)
+            delay = RESUBSCRIBE_MIN_DELAY
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    # Forget the dead channel, or subscribe hands it back;
+                    # fails harmlessly when the connection is gone with it
+                    await cache.unsubscribe(INVALIDATION_CHANNEL)
+                except Exception:
+                    pass
+                try:
+                    (channel,) = await cache.subscribe(INVALIDATION_CHANNEL)
+                    break
+                except Exception as e:
+                    log.error(e, exc_info=True)
+                    delay = min(delay * 2, RESUBSCRIBE_MAX_DELAY)
+            self._evict_local(self._reset_message())
+
+    def _reset_message(self) -> Dict[str, Any]:
+        # Drops every local tier, for when invalidations may have been missed
+        names = sorted(self.caches)
+        return {
+            "rows": [],
+            "tables": names,
+            "hashes": names,
+            "revisions": [],
+            "reset": True,
+        }
+
+    async def _evict(self, message: Dict[str, Any]) -> None:
+        try:
+            for command, args in self._commands(message):
+                await getattr(self.redis, command)(*args)
+        except Exception as e:
+            log.error(e, exc_info=True)
+
+    def _evict_sync(self, message: Dict[str, Any]) -> None:
+        if self._sync_redis is None:
+            self._sync_redis = redis.Redis.from_url(settings.REDIS_URL)
+        try:
+            pipe = self._sync_redis.pipeline(transaction=False)
+            for command, args in self._commands(message):
+                getattr(pipe, command)(*args)
+            pipe.execute()
+        except Exception as e:
+            log.error(e, exc_info=True)
+
+
+invalidator = CacheInvalidator(model_caches)
+
+
+# (write counter, timestamp of the last write)
+Revision = Tuple[int, float]
+
+
+class TableRevisions:
+    """
+    The revision of each table, bumped by `CacheInvalidator` on every
+    committed write, to validate cached responses without a query.
+
+    Revisions are kept per worker until an invalidation names their table,
+    or for CACHE_LOCAL_TTL seconds should a message be missed. A table never
+    written since Redis was emptied starts at revision 0, modified now.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.local = LocalCache(maxsize, ttl)
+
+    def evict_local(self, message: Dict[str, Any]) -> None:
+        if message.get("reset"):
+            self.local.clear()
+        # Messages of workers predating revisions lack the key
+        for name in message.get("revisions", ()):
+            self.local.delete(name)
+
+    async def get(self, cache: aioredis.Redis, name: str) -> Revision:
+        revision = self.local.get(name)
+        if revision is not None:
+            return revision
+
+        pipe = cache.pipeline()
+        pipe.hsetnx(REVISIONS_KEY, name, 0)
+        pipe.hsetnx(MODIFIED_KEY, name, time.time())
+        counter = pipe.hget(REVISIONS_KEY, name)
+        modified = pipe.hget(MODIFIED_KEY, name)
+        await pipe.execute()
+        revision = (int(await counter), float(await modified))
+        self.local.set(name, revision)
+        return revision
+
+
+revisions = TableRevisions(settings.CACHE_LOCAL_SIZE, settings.CACHE_LOCAL_TTL)
+invalidator.add_listener(revisions.evict_local)
@@ -2,8 +2,12 @@ from celery import Celery
 
 from app.core.config import settings
 
+# The worker imports the task modules in `include`
 celery_app = Celery(
-    "worker", backend=settings.CELERY_BACKEND, broker=settings.CELERY_BROKER
+    "worker",
+    backend=settings.CELERY_BACKEND,
+    broker=settings.CELERY_BROKER,
+    include=["app.worker"],
 )
 
 celery_app.conf.task_routes = {"information.*": {"queue": "information"}}
@@ -35,7 +35,42 @@ class Settings(BaseSettings):
             return None
         return v
 
+    # "local" keeps uploads under UPLOADED_FILES_DEST, "s3" in S3_BUCKET
+    STORAGE_BACKEND: str = "local"
     UPLOADED_FILES_DEST: str = "/project/data"
+    S3_BUCKET: Optional[str] = None
+    # For S3-compatible stores such as MinIO
+    S3_ENDPOINT_URL: Optional[str] = None
+    S3_REGION: Optional[str] = None
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    # Lifetime in seconds of presigned download URLs
+    S3_URL_EXPIRES: int = 300
+    # Uploads are copied to disk in chunks of this many bytes
+    UPLOAD_CHUNK_SIZE: int = 1 << 16
+    MAX_DOCUMENT_SIZE: int = 50 * 1024 * 1024
+    # Unreferenced blobs and abandoned temp files younger than this many
+    # seconds are kept by the garbage collection
+    BLOB_GC_GRACE: int = 24 * 60 * 60
+    # Longest side of the renditions written next to each uploaded image,
+    # besides the 400px thumbnail
+    IMAGE_RENDITION_SIZES: List[int] = [800, 1600]
+    # Pillow format name of the saved images and renditions, e.g. PNG or WEBP
+    # (AVIF needs pillow-avif-plugin)
+    IMAGE_FORMAT: str = "PNG"
+    # zlib level (0-9) for PNG, quality (0-100) for the lossy formats
+    IMAGE_COMPRESS_LEVEL: int = 6
+    IMAGE_QUALITY: int = 80
+    # Internal nginx location mapped to UPLOADED_FILES_DEST; when set,
+    # downloads are handed to the proxy with X-Accel-Redirect
+    ACCEL_REDIRECT_LOCATION: Optional[str] = None
+    FILE_CACHE_CONTROL: str = "public, max-age=3600"
+    # Cache-Control of the JSON read endpoints; with no-cache clients and
+    # proxies keep responses but revalidate them with their ETag each time
+    API_CACHE_CONTROL: str = "no-cache"
+    # Part of every ETag of the read endpoints: change it when a release
+    # changes the response bodies, so responses cached before are refetched
+    ETAG_VERSION: str = "1"
 
     WEBSERVICE_HOST: str = "http://192.168.150.53:10018"
     WEBSERVICE_PATH: str = "feedwebservice"
@@ -43,14 +78,79 @@ class Settings(BaseSettings):
     NSQD_PORT: int = 4150
 
     JAEGER_HOST: str = "192.168.150.113"
+    # Share of the traces started here that are sampled; traces started by a
+    # caller follow its decision
+    TRACE_SAMPLE_RATE: float = 1.0
+    # Also export the traces not sampled that failed or have a span slower
+    # than TRACE_SLOW_SECONDS (all spans are then recorded)
+    TRACE_TAIL_SAMPLING: bool = False
+    TRACE_SLOW_SECONDS: float = 1.0
+    TRACE_TAIL_MAX_TRACES: int = 1000
+    # A span per SQL statement
+    TRACE_SQL: bool = True
+    TRACE_BATCH_MAX_QUEUE_SIZE: int = 2048
+    TRACE_BATCH_MAX_EXPORT_SIZE: int = 512
+    TRACE_BATCH_SCHEDULE_DELAY_MILLIS: int = 5000
 
     GRAYLOG_SERVER: str = "5.189.184.162"
     GRAYLOG_PORT: int = 12201
 
+    # DEBUG for dev, INFO otherwise unless set
+    LOG_LEVEL: Optional[str] = None
+
+    @validator("LOG_LEVEL", pre=True, always=True)
+    def assemble_log_level(cls, v: Optional[str], values: Dict[str, Any]) -> str:
+        if v:
+            return v.upper()
+        return "DEBUG" if values.get("CONFIG_TYPE") == "dev" else "INFO"
+
+    # Share of the requests whose bodies TimedRoute logs at DEBUG level, the
+    # bytes of each body kept, and JSON keys whose values are masked (any
+    # key containing one of them)
+    LOG_SAMPLE_RATE: float = 1.0
+    LOG_BODY_MAX_BYTES: int = 2048
+    LOG_REDACT_FIELDS: List[str] = ["password", "secret", "token", "authorization"]
+    # Records waiting for the logging thread; when full, new records are
+    # dropped, or the oldest ones with LOG_QUEUE_DROP_OLDEST. At exit the
+    # listener waits up to LOG_QUEUE_STOP_TIMEOUT seconds for room to queue
+    # its stop signal before dropping the oldest record for it
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_QUEUE_DROP_OLDEST: bool = False
+    LOG_QUEUE_STOP_TIMEOUT: float = 5
+
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
     REDIS_TYPE: str = "redis"
     REDIS_URL: Optional[RedisDsn] = None
+    # Seconds a model's Redis hash lives without writes, and how long an id
+    # that was not found in the database is remembered
+    CACHE_TTL: int = 60 * 60 * 24
+    CACHE_NEGATIVE_TTL: int = 60
+    # Rows per HSET when prepopulating, and how long a warm-up keeps other
+    # workers from repeating it
+    CACHE_WARM_BATCH_SIZE: int = 500
+    CACHE_WARM_LOCK_TTL: int = 300
+    # Per-worker in-memory copy of the reference data: entries per model and
+    # seconds before an entry is re-read from Redis
+    CACHE_LOCAL_SIZE: int = 1024
+    CACHE_LOCAL_TTL: int = 300
+    # Seconds after which the in-memory sector tree is read again in full,
+    # in case an invalidation was missed
+    SECTOR_TREE_MAX_AGE: int = 60 * 60
+
+    # Rows per page of the list endpoints, and per chunk when streaming
+    PAGE_SIZE: int = 1000
+    MAX_PAGE_SIZE: int = 5000
+    STREAM_BATCH_SIZE: int = 500
+
+    # Most ids a single batch-get request may ask for
+    BATCH_GET_MAX_IDS: int = 1000
+
+    # Rows per INSERT ... ON CONFLICT statement (and commit) of the bulk
+    # endpoints, and the most rows a single bulk request may carry
+    BULK_CHUNK_SIZE: int = 1000
+    BULK_MAX_ROWS: int = 100000
+
     CELERY_BACKEND_DB: int = 1
     CELERY_BROKER_DB: int = 0
 
@@ -109,6 +209,35 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
 
+    ASYNC_SQLALCHEMY_DATABASE_URI: Optional[str] = None
+
+    @validator("ASYNC_SQLALCHEMY_DATABASE_URI", pre=True)
+    def assemble_async_db_connection(
+        cls, v: Optional[str], values: Dict[str, Any]
+    ) -> Any:
+        if isinstance(v, str):
+            return v
+        uri = str(values.get("SQLALCHEMY_DATABASE_URI"))
+        return uri.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+    # Connection pool. Sized per gunicorn worker so that all workers together
+    # stay inside DB_MAX_CONNECTIONS; each worker holds a sync and an async
+    # engine, so the per-worker share is split between the two.
+    WEB_CONCURRENCY: int = 4
+    DB_MAX_CONNECTIONS: int = 100
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_SIZE: Optional[int] = None
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+
+    @validator("DB_POOL_SIZE", pre=True)
+    def assemble_db_pool_size(cls, v: Optional[int], values: Dict[str, Any]) -> Any:
+        if v:
+            return v
+        per_worker = values.get("DB_MAX_CONNECTIONS") // values.get("WEB_CONCURRENCY")
+        return max(1, per_worker // 2 - values.get("DB_MAX_OVERFLOW"))
+
     class Config:
         case_sensitive = True
 
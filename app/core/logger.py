@@ -1,49 +1,270 @@
+import atexit
 import logging
+import os
+import queue
+import random
+import re
 import time
-from typing import Callable
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Optional, Pattern
 
 import graypy
 from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
 
 from app.core.config import settings
+from app.core.metrics import LOG_RECORDS_DROPPED, REQUEST_LATENCY, REQUESTS_IN_PROGRESS
+
+
+class LoggedBody:
+    """
+    A request or response body for the log, formatted only if the record is
+    emitted: cut to LOG_BODY_MAX_BYTES, with the values of JSON keys
+    matching LOG_REDACT_FIELDS masked.
+
+    Only the first LOG_BODY_MAX_BYTES and the original size are kept, so
+    queued records do not hold large uploads in memory.
+    """
+
+    __slots__ = ("body", "content_type", "size")
+
+    def __init__(
+        self,
+        body: Optional[bytes],
+        content_type: str = "",
+        size: Optional[str] = None,
+    ):
+        if body is not None:
+            size = str(len(body))
+            if "json" in content_type or not content_type:
+                body = body[: settings.LOG_BODY_MAX_BYTES]
+            else:
+                body = None
+        self.body = body
+        self.content_type = content_type
+        self.size = size
+
+    def __str__(self) -> str:
+        if self.body is None:
+            return f"<{self.content_type or 'stream'}, {self.size or '?'} bytes>"
+        text = self.body.decode("utf-8", "replace")
+        text = REDACTED_RE.sub(r'\1"***"', text) if REDACTED_RE else text
+        if int(self.size) > len(self.body):
+            text += f"... ({self.size} bytes)"
+        return text
+
+
+def _redacted_re() -> Optional[Pattern]:
+    if not settings.LOG_REDACT_FIELDS:
+        return None
+    keys = "|".join(re.escape(f) for f in settings.LOG_REDACT_FIELDS)
+    return re.compile(
+        rf'("[^"]*(?:{keys})[^"]*"\s*:\s*)(?:"(?:[^"\\]|\\.)*"?|[^,}}\]]*)',
+        re.IGNORECASE,
+    )
+
+
+REDACTED_RE = _redacted_re()
 
 
 class TimedRoute(APIRoute):
+    """
+    Adds the handling time as `X-Response-Time`, records it in the latency
+    histogram of the route template and, at DEBUG level, logs the request
+    and response bodies of a LOG_SAMPLE_RATE share of the requests. Nothing
+    is read or formatted for the log otherwise.
+    """
+
     def get_route_handler(self) -> Callable:
         original_route_handler = super().get_route_handler()
 
         async def custom_route_handler(request: Request) -> Response:
-            before = time.time()
-            j = None
+            before = time.perf_counter_ns()
+            sampled = log.isEnabledFor(logging.DEBUG) and (
+                settings.LOG_SAMPLE_RATE >= 1
+                or random.random() < settings.LOG_SAMPLE_RATE
+            )
+            if sampled:
+                content_type = request.headers.get("content-type", "")
+                # JSON bodies are read by the endpoint anyway and cached on
+                # the request; uploads are not buffered for the log
+                body = None
+                if "json" in content_type:
+                    body = await request.body()
+                log.debug(
+                    "REQUEST: %s, %s, body: %s",
+                    request.method,
+                    request.url.path,
+                    LoggedBody(
+                        body, content_type, request.headers.get("content-length")
+                    ),
+                )
+            method, route = request.method, self.path
+            status = 500
+            REQUESTS_IN_PROGRESS.labels(method, route).inc()
             try:
-                j = await request.json()
-            except Exception:
-                pass
-            log.debug(f"REQUEST: {request.method}, {request.url.path}, body: {j}")
-            response: Response = await original_route_handler(request)
-            duration = time.time() - before
-            response.headers["X-Response-Time"] = str(duration)
-            try:
-                j = response.body
-            except Exception:
-                j = None
-            log.debug(f"RESPONSE: [{duration}] => {j}")
+                response: Response = await original_route_handler(request)
+                status = response.status_code
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                # Answered by http422_error_handler
+                status = 422
+                raise
+            finally:
+                duration = (time.perf_counter_ns() - before) / 1e9
+                REQUESTS_IN_PROGRESS.labels(method, route).dec()
+                REQUEST_LATENCY.labels(method, route, status).observe(duration)
+            response.headers["X-Response-Time"] = f"{duration:.6f}"
+            if sampled:
+                log.debug(
+                    "RESPONSE: [%.6f] => %s",
+                    duration,
+                    LoggedBody(
+                        getattr(response, "body", None), response.media_type or ""
+                    ),
+                )
             return response
 
         return custom_route_handler
 
 
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to a bounded queue drained by a `QueueListener` thread,
+    which does the socket and stdout I/O and formats the request and
+    response bodies.
+
+    When the queue is full the new record is dropped, or with `drop_oldest`
+    the oldest queued one; `dropped` counts the lost records per level, as
+    does the `log_records_dropped` metric.
+    """
+
+    def __init__(self, maxsize: int, drop_oldest: bool = False):
+        super().__init__(queue.Queue(maxsize))
+        self.drop_oldest = drop_oldest
+        self.dropped: Counter = Counter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Rendered on the calling thread, as QueueHandler does, so that the
+        # listener never formats arguments the caller has changed since,
+        # and queued records keep no tracebacks alive. Only the records
+        # carrying a LoggedBody, whose other arguments are immutable, are
+        # left for the listener to format.
+        if isinstance(record.args, tuple) and any(
+            isinstance(arg, LoggedBody) for arg in record.args
+        ):
+            return record
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.drop_oldest:
+            try:
+                lost = self.queue.get_nowait()
+                self.queue.put_nowait(record)
+                record = lost
+            except (queue.Empty, queue.Full):
+                pass
+        self.count_dropped(record)
+
+    def count_dropped(self, record: logging.LogRecord) -> None:
+        self.dropped[record.levelname] += 1
+        LOG_RECORDS_DROPPED.labels(record.levelname).inc()
+
+
+class DrainingQueueListener(QueueListener):
+    """
+    `QueueListener` for a `DroppingQueueHandler` that can stop while the
+    bounded queue is full: `QueueListener.stop` queues its sentinel with
+    `put_nowait`, which raises `queue.Full` and leaves the queued records
+    unhandled.
+
+    The sentinel waits up to `timeout` seconds for the listener thread to
+    make room, then takes the place of the oldest record.
+    """
+
+    def __init__(
+        self, handler: DroppingQueueHandler, *handlers: logging.Handler, timeout: float
+    ):
+        super().__init__(handler.queue, *handlers, respect_handler_level=True)
+        self.handler = handler
+        self.timeout = timeout
+
+    def enqueue_sentinel(self) -> None:
+        try:
+            self.queue.put(self._sentinel, timeout=self.timeout)
+            return
+        except queue.Full:
+            pass
+        while True:
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.handler.count_dropped(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+
+def start_listener(handler: DroppingQueueHandler, *handlers: logging.Handler):
+    listener = DrainingQueueListener(
+        handler, *handlers, timeout=settings.LOG_QUEUE_STOP_TIMEOUT
+    )
+    listener.start()
+
+    def restart_in_child() -> None:
+        # Threads do not survive fork (celery prefork, gunicorn): the child
+        # gets a fresh queue and listener
+        handler.queue = queue.Queue(handler.queue.maxsize)
+        listener.queue = handler.queue
+        listener._thread = None
+        listener.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+
+    def stop() -> None:
+        if listener._thread is not None:
+            listener.stop()
+        if handler.dropped:
+            for h in handlers:
+                h.handle(
+                    logging.makeLogRecord(
+                        {
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": "Dropped log records: %s",
+                            "args": (dict(handler.dropped),),
+                        }
+                    )
+                )
+
+    # Flush what is still queued on exit
+    atexit.register(stop)
+    return listener
+
+
 def create_logger():
     """
     Setup the logging environment
     """
     log = logging.getLogger(__name__)  # root logger
-    log.setLevel(logging.DEBUG)
+    log.setLevel(settings.LOG_LEVEL)
     format_str = "%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)s - %(funcName)s() ] - %(message)s"
     date_format = "%Y-%m-%d %H:%M:%S"
 
     formatter = logging.Formatter(format_str, date_format)
+    handlers = []
 
     if settings.CONFIG_TYPE == "prod":
         handler = graypy.GELFUDPHandler(
@@ -52,12 +273,19 @@ def create_logger():
             localname=settings.DEPLOYMENT,
         )
         handler.setFormatter(formatter)
-        log.addHandler(handler)
+        handlers.append(handler)
 
     handler = logging.StreamHandler()
 
     handler.setFormatter(formatter)
-    log.addHandler(handler)
+    handlers.append(handler)
+
+    # Records are only queued on the calling thread
+    queue_handler = DroppingQueueHandler(
+        settings.LOG_QUEUE_SIZE, drop_oldest=settings.LOG_QUEUE_DROP_OLDEST
+    )
+    start_listener(queue_handler, *handlers)
+    log.addHandler(queue_handler)
     log.propagate = False
 
     my_adapter = logging.LoggerAdapter(log, {"tag": settings.APPLICATION_NAME})
@@ -0,0 +1,87 @@
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+
+# With PROMETHEUS_MULTIPROC_DIR set (see entry-point.sh) every gunicorn
+# worker writes its samples to files in that directory and /metrics sums
+# them up, whichever worker serves it. The directory has to be emptied
+# before the workers start.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, per route template",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Requests being handled",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time a checkout spends getting a connection from the pool, "
+    "including waiting for a free one or opening a new one",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 30),
+)
+DB_POOL_HELD = Histogram(
+    "db_pool_connection_held_seconds",
+    "How long a connection stays checked out of the pool",
+    ["pool"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out of the pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_EXHAUSTED = Counter(
+    "db_pool_exhausted",
+    "Checkouts that left the pool without free connections or overflow",
+    ["pool"],
+)
+
+CACHE_LOOKUPS = Counter(
+    "cache_lookups",
+    "Cached row lookups per Redis hash, by result "
+    "(local_hit, hit, negative_hit, miss)",
+    ["cache", "result"],
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped",
+    "Log records dropped because the logging queue was full, by level",
+    ["level"],
+)
+
+UPLOAD_BYTES = Counter(
+    "upload_bytes",
+    "Bytes of uploaded files, by kind: file, blob (new document content) or "
+    "duplicate (document content already stored)",
+    ["kind"],
+)
+
+
+def metrics_response() -> Response:
+    """
+    The metrics of all workers in the Prometheus text format.
+    """
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import json
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import schemas
+from app.core.cache import invalidator
+from app.core.config import settings
+from app.models import Sector, SectorDivision, SectorGroup, SectorIndustry
+
+
+class SectorLevel(str, Enum):
+    industry = "industry"
+    division = "division"
+    group = "group"
+    sector = "sector"
+
+
+# level: (model, column holding the parent id, key of the children list,
+#         schema whose fields are serialized)
+LEVELS = {
+    SectorLevel.industry: (
+        SectorIndustry,
+        None,
+        "divisions",
+        schemas.SectorIndustryBase,
+    ),
+    SectorLevel.division: (
+        SectorDivision,
+        "sector_industry_id",
+        "groups",
+        schemas.SectorDivisionBase,
+    ),
+    SectorLevel.group: (
+        SectorGroup,
+        "sector_division_id",
+        "sectors",
+        schemas.SectorGroupBase,
+    ),
+    SectorLevel.sector: (Sector, "sector_group_id", None, schemas.SectorBase),
+}
+PARENT = {
+    SectorLevel.division: SectorLevel.industry,
+    SectorLevel.group: SectorLevel.division,
+    SectorLevel.sector: SectorLevel.group,
+}
+CHILD = {parent: child for child, parent in PARENT.items()}
+TABLES = {model.__tablename__: level for level, (model, *_) in LEVELS.items()}
+
+Key = Tuple[SectorLevel, str]
+
+
+class SectorTree:
+    """
+    The industry > division > group > sector hierarchy held in memory.
+
+    The tree is loaded from the four tables on first use, and again in full
+    when a table was replaced or the tree is SECTOR_TREE_MAX_AGE seconds
+    old. Otherwise only the rows reported by `mark_stale` are read again,
+    and only the encoded bodies of the changed nodes and their ancestors
+    are dropped. Encoded
+    bodies are kept as bytes together with their ETag, so serving an
+    unchanged tree is a dictionary lookup.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[Key, Dict[str, Any]] = {}
+        self.children: Dict[Key, Set[str]] = {}
+        self.stale: Set[Key] = set()
+        # Bumped by every replacement of a table; the tree is current while
+        # `loaded_generation` matches it
+        self.generation = 0
+        self.loaded_generation: Optional[int] = None
+        self.loaded_at = 0.0
+        self._encoded: Dict[Optional[Key], Tuple[bytes, str]] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _parent(self, key: Key, row: Dict[str, Any]) -> Optional[Key]:
+        column = LEVELS[key[0]][1]
+        if column is None or row.get(column) is None:
+            return None
+        return PARENT[key[0]], row[column]
+
+    def _touch(self, key: Optional[Key]) -> None:
+        self._encoded.pop(None, None)
+        while key is not None:
+            self._encoded.pop(key, None)
+            row = self.nodes.get(key)
+            key = self._parent(key, row) if row else None
+
+    def _put(self, key: Key, row: Optional[Dict[str, Any]]) -> None:
+        self._encoded.pop(key, None)
+        old = self.nodes.pop(key, None)
+        if old is not None:
+            parent = self._parent(key, old)
+            if parent is not None:
+                self.children.get(parent, set()).discard(key[1])
+            self._touch(parent)
+        if row is None:
+            return
+        self.nodes[key] = row
+        parent = self._parent(key, row)
+        if parent is not None:
+            self.children.setdefault(parent, set()).add(key[1])
+        self._touch(key)
+
+    async def _load(self, db: AsyncSession, level: SectorLevel, ids=None) -> None:
+        model = LEVELS[level][0]
+        stmt = select(*model.__table__.columns)
+        if ids is not None:
+            stmt = stmt.filter(model.id.in_(ids))
+        result = await db.execute(stmt)
+        found = set()
+        for row in result.mappings():
+            self._put((level, row["id"]), dict(row))
+            found.add(row["id"])
+        for id in set(ids or ()) - found:
+            self._put((level, id), None)
+
+    @property
+    def loaded(self) -> bool:
+        return (
+            self.loaded_generation == self.generation
+            and time.monotonic() - self.loaded_at < settings.SECTOR_TREE_MAX_AGE
+        )
+
+    async def refresh(self, db: AsyncSession) -> None:
+        """
+        Load the tree, or re-read the rows marked stale since the last call.
+        """
+        if self.loaded and not self.stale:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.loaded:
+                # A replacement reported while loading bumps the generation
+                # again, so the next call reloads once more; rows marked
+                # meanwhile stay stale and are re-read
+                generation = self.generation
+                self.stale.clear()
+                self.nodes, self.children, self._encoded = {}, {}, {}
+                for level in LEVELS:
+                    await self._load(db, level)
+                self.loaded_generation = generation
+                self.loaded_at = time.monotonic()
+                return
+            stale, self.stale = self.stale, set()
+            for level in LEVELS:
+                ids = [id for lvl, id in stale if lvl == level]
+                if ids:
+                    await self._load(db, level, ids)
+
+    def mark_stale(self, message: Dict[str, Any]) -> None:
+        """
+        `CacheInvalidator` listener: remember the changed sector rows, or
+        reload everything once a whole sector table was replaced.
+        """
+        if any(name in TABLES for name in message.get("tables", ())):
+            self.generation += 1
+        for name, id in message["rows"]:
+            if name in TABLES:
+                self.stale.add((TABLES[name], id))
+
+    def _node(self, key: Key) -> Dict[str, Any]:
+        level, id = key
+        schema, children_key = LEVELS[level][3], LEVELS[level][2]
+        row = self.nodes[key]
+        node = {field: row.get(field) for field in schema.__fields__}
+        if children_key is not None:
+            child = CHILD[level]
+            node[children_key] = [
+                self._node((child, c))
+                for c in sorted(self.children.get(key, ()))
+                if (child, c) in self.nodes
+            ]
+        return node
+
+    def _roots(self) -> List[Dict[str, Any]]:
+        return [
+            self._node(key)
+            for key in sorted(self.nodes)
+            if key[0] == SectorLevel.industry
+        ]
+
+    def encoded(self, key: Optional[Key] = None) -> Optional[Tuple[bytes, str]]:
+        """
+        The `{"success": true, "data": ...}` body for the subtree rooted at
+        `key` (the whole tree for None) and its ETag, or None if there is no
+        such node.
+        """
+        if key in self._encoded:
+            return self._encoded[key]
+        if key is not None and key not in self.nodes:
+            return None
+        data = self._roots() if key is None else self._node(key)
+        body = json.dumps(
+            {"success": True, "data": jsonable_encoder(data)}, separators=(",", ":")
+        ).encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        self._encoded[key] = body, etag
+        return body, etag
+
+
+sector_tree = SectorTree()
+
+# Re-read sector rows changed by this or any other worker
+invalidator.add_listener(sector_tree.mark_stale)
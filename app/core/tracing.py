@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SimpleSpanProcessor,
+    SpanExporter,
+)
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import SpanContext, StatusCode, TraceFlags
+
+from app.core.config import settings
+
+
+class RecordingSampler(Sampler):
+    """
+    Wraps a head sampler so that the traces it drops are still recorded,
+    though not exported, giving `TailSamplingProcessor` the chance to keep
+    them.
+    """
+
+    def __init__(self, sampler: Sampler):
+        self.sampler = sampler
+
+    def should_sample(self, *args, **kwargs) -> SamplingResult:
+        result = self.sampler.should_sample(*args, **kwargs)
+        if result.decision == Decision.DROP:
+            return SamplingResult(
+                Decision.RECORD_ONLY, result.attributes, result.trace_state
+            )
+        return result
+
+    def get_description(self) -> str:
+        return f"Recording{{{self.sampler.get_description()}}}"
+
+
+def slow_or_error(span: ReadableSpan) -> bool:
+    """
+    Tail sampling rule: keep traces with a failed span, a 5xx response or a
+    span slower than TRACE_SLOW_SECONDS.
+    """
+    if span.status.status_code == StatusCode.ERROR:
+        return True
+    if (span.attributes or {}).get("http.status_code", 0) >= 500:
+        return True
+    duration = (span.end_time or 0) - (span.start_time or 0)
+    return duration >= settings.TRACE_SLOW_SECONDS * 1e9
+
+
+def _sampled(span: ReadableSpan) -> ReadableSpan:
+    # Exporting processors skip spans without the sampled flag
+    context = span.context
+    return ReadableSpan(
+        name=span.name,
+        context=SpanContext(
+            context.trace_id,
+            context.span_id,
+            context.is_remote,
+            TraceFlags(TraceFlags.SAMPLED),
+            context.trace_state,
+        ),
+        parent=span.parent,
+        resource=span.resource,
+        attributes=span.attributes,
+        events=span.events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope,
+    )
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """
+    Passes sampled spans straight on to `processor`, and holds the spans of
+    unsampled traces until the trace's local root span ends. The held
+    trace is then exported if `keep` is true for any of its spans, and
+    dropped otherwise.
+
+    At most `max_traces` unfinished traces are held; the oldest ones are
+    dropped first.
+    """
+
+    def __init__(
+        self,
+        processor: SpanProcessor,
+        keep: Callable[[ReadableSpan], bool] = slow_or_error,
+        max_traces: int = 1000,
+    ):
+        self.processor = processor
+        self.keep = keep
+        self.max_traces = max_traces
+        self._held: Dict[int, List[ReadableSpan]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self.processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if span.context.trace_flags.sampled:
+            self.processor.on_end(span)
+            return
+
+        trace_id = span.context.trace_id
+        with self._lock:
+            self._held.setdefault(trace_id, []).append(span)
+            if span.parent is not None and not span.parent.is_remote:
+                while len(self._held) > self.max_traces:
+                    self._held.popitem(last=False)
+                return
+            spans = self._held.pop(trace_id)
+
+        if any(self.keep(s) for s in spans):
+            for s in spans:
+                self.processor.on_end(_sampled(s))
+
+    def shutdown(self) -> None:
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.processor.force_flush(timeout_millis)
+
+
+def create_tracer_provider(
+    exporter: SpanExporter, *, batch: bool = True
+) -> TracerProvider:
+    """
+    A tracer provider exporting to `exporter`.
+
+    Traces are sampled at the service edge with probability
+    TRACE_SAMPLE_RATE and otherwise follow the caller's decision. With
+    TRACE_TAIL_SAMPLING the traces not sampled are still recorded, and
+    the slow and failed ones exported too; this costs the span recording
+    the head sampler saves. Spans are exported in batches sized by the
+    TRACE_BATCH_* settings, or one by one with `batch=False` (for tests,
+    with an `InMemorySpanExporter`).
+    """
+    sampler: Sampler = ParentBased(TraceIdRatioBased(settings.TRACE_SAMPLE_RATE))
+    if settings.TRACE_TAIL_SAMPLING:
+        sampler = RecordingSampler(sampler)
+
+    if batch:
+        processor: SpanProcessor = BatchSpanProcessor(
+            exporter,
+            max_queue_size=settings.TRACE_BATCH_MAX_QUEUE_SIZE,
+            max_export_batch_size=settings.TRACE_BATCH_MAX_EXPORT_SIZE,
+            schedule_delay_millis=settings.TRACE_BATCH_SCHEDULE_DELAY_MILLIS,
+        )
+    else:
+        processor = SimpleSpanProcessor(exporter)
+    if settings.TRACE_TAIL_SAMPLING:
+        processor = TailSamplingProcessor(
+            processor, max_traces=settings.TRACE_TAIL_MAX_TRACES
+        )
+
+    provider = TracerProvider(
+        sampler=sampler,
+        resource=Resource.create({"service.name": settings.APPLICATION_NAME}),
+    )
+    provider.add_span_processor(processor)
+    return provider
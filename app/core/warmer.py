@@ -0,0 +1,85 @@
+import os
+import time
+
+import aioredis
+
+from app import crud
+from app.core import cache as caches
+from app.core.config import settings
+from app.core.logger import log
+from app.db.session import AsyncSessionLocal
+
+WARM_LOCK = "cache:warm:lock"
+
+# (hash, CRUD object of its model); rows are loaded with the relationships
+# the hash's schema serializes
+warmed_models = [
+    (caches.country, crud.country),
+    (caches.region, crud.region),
+    (caches.sub_region, crud.sub_region),
+    (caches.sector_industry, crud.sector_industry),
+    (caches.sector_division, crud.sector_division),
+    (caches.sector_group, crud.sector_group),
+    (caches.sector, crud.sector),
+    (caches.country_sector, crud.country_sector),
+]
+
+
+async def warm_model(
+    cache: aioredis.Redis, model_cache: caches.ModelCache, crud_obj: crud.AsyncCRUDBase
+) -> int:
+    """
+    Stream every row of one model from a server-side cursor and write each
+    batch to the hash with one pipelined HSET.
+
+    Batches are filled like cache misses (see `ModelCache.fill`): once a
+    commit bumps the table revision read before the query, the batch is
+    taken back out and the rest is left to be loaded on demand.
+    """
+    count = 0
+    revision = int(await cache.hget(caches.REVISIONS_KEY, model_cache.name) or 0)
+    async with AsyncSessionLocal() as db:
+        stmt = crud_obj.select(model_cache.schema).execution_options(
+            yield_per=settings.CACHE_WARM_BATCH_SIZE
+        )
+        result = await db.stream(stmt)
+        async for rows in result.scalars().partitions(settings.CACHE_WARM_BATCH_SIZE):
+            values = {str(r.id): model_cache.encode(r) for r in rows}
+            if not await model_cache.fill(cache, revision, values):
+                log.info("PREPOPULATE %s: stopped by a write", model_cache.name)
+                break
+            count += len(rows)
+    return count
+
+
+async def warm_cache(cache: aioredis.Redis) -> None:
+    """
+    Prepopulate the Redis hashes of the reference tables.
+
+    Only the worker that takes the warm lock does the work; the lock is left
+    to expire rather than released, so workers of the same deployment that
+    boot after the warm-up skip it too.
+    """
+    acquired = await cache.set(
+        WARM_LOCK,
+        os.getpid(),
+        expire=settings.CACHE_WARM_LOCK_TTL,
+        exist=cache.SET_IF_NOT_EXIST,
+    )
+    if not acquired:
+        log.debug("Cache already warmed by another worker")
+        return
+
+    for model_cache, crud_obj in warmed_models:
+        started = time.perf_counter()
+        try:
+            count = await warm_model(cache, model_cache, crud_obj)
+        except Exception as e:
+            log.error(e, exc_info=True)
+            continue
+        log.info(
+            "PREPOPULATE %s: %d rows in %.3fs",
+            model_cache.name,
+            count,
+            time.perf_counter() - started,
+        )
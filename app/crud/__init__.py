@@ -19,23 +19,25 @@ from app.schemas.sector_group import SectorGroupCreate, SectorGroupUpdate
 from app.schemas.sector_industry import SectorIndustryCreate, SectorIndustryUpdate
 from app.schemas.sub_region import SubRegionCreate, SubRegionUpdate
 
-from .base import CRUDBase
+from .base import AsyncCRUDBase, CRUDBase  # noqa:F401
 from .crud_country_document import country_document  # noqa:F401
 
-country = CRUDBase[Country, CountryCreate, CountryUpdate](Country)
-country_contact = CRUDBase[CountryContact, CountryContactCreate, CountryContactUpdate](
-    CountryContact
-)
-country_sector = CRUDBase[CountrySector, CountrySectorCreate, CountrySectorUpdate](
+country = AsyncCRUDBase[Country, CountryCreate, CountryUpdate](Country)
+country_contact = AsyncCRUDBase[
+    CountryContact, CountryContactCreate, CountryContactUpdate
+](CountryContact)
+country_sector = AsyncCRUDBase[CountrySector, CountrySectorCreate, CountrySectorUpdate](
     CountrySector
 )
-sector = CRUDBase[Sector, SectorCreate, SectorUpdate](Sector)
-sector_group = CRUDBase[SectorGroup, SectorGroupCreate, SectorGroupUpdate](SectorGroup)
-sector_division = CRUDBase[SectorDivision, SectorDivisionCreate, SectorDivisionUpdate](
-    SectorDivision
-)
-sector_industry = CRUDBase[SectorIndustry, SectorIndustryCreate, SectorIndustryUpdate](
-    SectorIndustry
+sector = AsyncCRUDBase[Sector, SectorCreate, SectorUpdate](Sector)
+sector_group = AsyncCRUDBase[SectorGroup, SectorGroupCreate, SectorGroupUpdate](
+    SectorGroup
 )
-region = CRUDBase[Region, RegionCreate, RegionUpdate](Region)
-sub_region = CRUDBase[SubRegion, SubRegionCreate, SubRegionUpdate](SubRegion)
+sector_division = AsyncCRUDBase[
+    SectorDivision, SectorDivisionCreate, SectorDivisionUpdate
+](SectorDivision)
+sector_industry = AsyncCRUDBase[
+    SectorIndustry, SectorIndustryCreate, SectorIndustryUpdate
+](SectorIndustry)
+region = AsyncCRUDBase[Region, RegionCreate, RegionUpdate](Region)
+sub_region = AsyncCRUDBase[SubRegion, SubRegionCreate, SubRegionUpdate](SubRegion)
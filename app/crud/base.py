@@ -1,15 +1,110 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+import base64
+import json
+from functools import lru_cache
+from inspect import isclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect, literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 
+from app.core.cache import invalidator
 from app.db.base_class import Base
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# Relationships to load with the rows: dotted relationship paths such as
+# "divisions.groups.sectors", or a response schema whose nested fields name
+# the relationships to follow.
+LoadSpec = Union[Sequence[str], Type[BaseModel]]
+
+
+def schema_load_paths(model: Type[Base], schema: Type[BaseModel]) -> List[str]:
+    """
+    Relationship paths of `model` that serializing `schema` will touch.
+    """
+    relationships = inspect(model).relationships
+    paths = []
+    for name, field in schema.__fields__.items():
+        if name not in relationships:
+            continue
+        target = relationships[name].mapper.class_
+        sub_paths = []
+        if isclass(field.type_) and issubclass(field.type_, BaseModel):
+            sub_paths = schema_load_paths(target, field.type_)
+        paths += [f"{name}.{p}" for p in sub_paths] or [name]
+    return paths
+
+
+@lru_cache(maxsize=None)
+def _loader_options(model: Type[Base], spec: Any) -> Tuple[Any, ...]:
+    if isclass(spec) and issubclass(spec, BaseModel):
+        spec = schema_load_paths(model, spec)
+    options = []
+    for path in spec:
+        option, cls = None, model
+        for name in path.split("."):
+            relationship = inspect(cls).relationships[name]
+            # Collections get one extra SELECT ... IN per level, scalars a JOIN
+            strategy = selectinload if relationship.uselist else joinedload
+            attr = getattr(cls, name)
+            if option is None:
+                option = strategy(attr)
+            else:
+                option = getattr(option, strategy.__name__)(attr)
+            cls = relationship.mapper.class_
+        options.append(option)
+    return tuple(options)
+
+
+def loader_options(model: Type[Base], load: LoadSpec) -> Tuple[Any, ...]:
+    """
+    SQLAlchemy loader options for `load`: `selectinload` for collections and
+    `joinedload` for many-to-one relationships, so a query returns its rows
+    and everything they serialize in a constant number of statements.
+    """
+    if not load:
+        return ()
+    if not isclass(load):
+        load = tuple(load)
+    return _loader_options(model, load)
+
+
+def encode_cursor(id: Any) -> str:
+    """Opaque keyset cursor pointing just after the row with `id`."""
+    raw = json.dumps(str(id)).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    """Inverse of `encode_cursor`; raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(value, str):
+        raise ValueError("Invalid cursor")
+    return value
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
@@ -23,13 +118,24 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         self.model = model
 
-    def get(self, db: Session, id: Any) -> Optional[ModelType]:
-        return db.query(self.model).filter(self.model.id == id).first()
+    def get(self, db: Session, id: Any, *, load: LoadSpec = ()) -> Optional[ModelType]:
+        return (
+            db.query(self.model)
+            .options(*loader_options(self.model, load))
+            .filter(self.model.id == id)
+            .first()
+        )
 
     def get_multi(
-        self, db: Session, *, skip: int = 0, limit: int = 1000
+        self, db: Session, *, skip: int = 0, limit: int = 1000, load: LoadSpec = ()
     ) -> List[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return (
+            db.query(self.model)
+            .options(*loader_options(self.model, load))
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
 
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
@@ -44,7 +150,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db: Session,
         *,
         db_obj: ModelType,
-        obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
     ) -> ModelType:
         obj_data = jsonable_encoder(db_obj)
         if isinstance(obj_in, dict):
@@ -74,3 +180,250 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.delete(obj)
         db.commit()
         return obj
+
+
+class AsyncCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    def __init__(self, model: Type[ModelType]):
+        """
+        CRUD object with default methods to Create, Read, Update, Delete (CRUD)
+        over an `AsyncSession`.
+
+        Async sessions cannot lazy load, so every method returning rows takes
+        a `load` spec (see `loader_options`) naming the relationships the
+        caller is going to serialize.
+
+        **Parameters**
+
+        * `model`: A SQLAlchemy model class
+        """
+        self.model = model
+
+    def select(self, load: LoadSpec = ()):
+        """SELECT of the model's rows with the loader options for `load`."""
+        return select(self.model).options(*loader_options(self.model, load))
+
+    async def get(
+        self, db: AsyncSession, id: Any, *, load: LoadSpec = (), refresh: bool = False
+    ) -> Optional[ModelType]:
+        stmt = self.select(load).filter(self.model.id == id)
+        if refresh:
+            stmt = stmt.execution_options(populate_existing=True)
+        result = await db.execute(stmt)
+        return result.scalars().first()
+
+    async def get_multi(
+        self,
+        db: AsyncSession,
+        *,
+        skip: int = 0,
+        limit: int = 1000,
+        load: LoadSpec = (),
+    ) -> List[ModelType]:
+        result = await db.execute(self.select(load).offset(skip).limit(limit))
+        return result.scalars().all()
+
+    async def get_many(
+        self, db: AsyncSession, ids: Sequence[Any], *, load: LoadSpec = ()
+    ) -> List[ModelType]:
+        """
+        Rows whose primary key is in `ids`, in no particular order. Ids that
+        are not valid for the key column are skipped.
+        """
+        python_type = self.model.id.type.python_type
+        keys = []
+        for id in ids:
+            try:
+                keys.append(id if isinstance(id, python_type) else python_type(id))
+            except (TypeError, ValueError):
+                continue
+        if not keys:
+            return []
+        result = await db.execute(self.select(load).filter(self.model.id.in_(keys)))
+        return result.scalars().all()
+
+    def cursor_key(self, cursor: str) -> Any:
+        """
+        The id `cursor` points after, as the type of the model's primary
+        key; raises ValueError when the cursor does not hold one.
+        """
+        try:
+            return self.model.id.type.python_type(decode_cursor(cursor))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+    async def get_page(
+        self,
+        db: AsyncSession,
+        *,
+        cursor: Optional[str] = None,
+        limit: int = 1000,
+        load: LoadSpec = (),
+    ) -> Tuple[List[ModelType], Optional[str]]:
+        """
+        Keyset pagination on the primary key. Returns up to `limit` rows
+        after `cursor` and the cursor of the next page, or None on the last
+        page. Raises ValueError for a cursor not made for this model.
+        """
+        stmt = self.select(load).order_by(self.model.id).limit(limit + 1)
+        if cursor:
+            stmt = stmt.filter(self.model.id > self.cursor_key(cursor))
+        result = await db.execute(stmt)
+        rows = result.scalars().all()
+        if len(rows) > limit:
+            return rows[:limit], encode_cursor(rows[limit - 1].id)
+        return rows, None
+
+    async def stream(
+        self, db: AsyncSession, *, batch_size: int = 500, load: LoadSpec = ()
+    ) -> AsyncIterator[List[ModelType]]:
+        """
+        Yield every row, in primary key order, in batches of `batch_size`
+        read from a server-side cursor.
+        """
+        stmt = self.select(load).order_by(self.model.id)
+        result = await db.stream(stmt.execution_options(yield_per=batch_size))
+        async for rows in result.scalars().partitions(batch_size):
+            yield rows
+
+    async def create(
+        self, db: AsyncSession, *, obj_in: CreateSchemaType, load: LoadSpec = ()
+    ) -> ModelType:
+        obj_in_data = jsonable_encoder(obj_in)
+        db_obj = self.model(**obj_in_data)  # type: ignore
+        db.add(db_obj)
+        await db.commit()
+        return await self.get(db, db_obj.id, load=load, refresh=True)
+
+    async def update(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: ModelType,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        load: LoadSpec = (),
+    ) -> ModelType:
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.dict(exclude_unset=True)
+        for field in inspect(self.model).column_attrs.keys():
+            if field in update_data:
+                setattr(db_obj, field, update_data[field])
+        db.add(db_obj)
+        await db.commit()
+        return await self.get(db, db_obj.id, load=load, refresh=True)
+
+    async def _upsert(
+        self, db: AsyncSession, rows: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        # One statement per distinct set of columns, since rows without an
+        # id leave it to the column default
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for i, row in enumerate(rows):
+            groups.setdefault(tuple(row), []).append(i)
+
+        statuses: List[Dict[str, Any]] = [{} for _ in rows]
+        for columns, indexes in groups.items():
+            stmt = insert(self.model).values([rows[i] for i in indexes])
+            if "id" in columns:
+                update = {c: stmt.excluded[c] for c in columns if c != "id"}
+                if update:
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[self.model.id], set_=update
+                    )
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=[self.model.id])
+            # xmax is 0 for freshly inserted tuples
+            stmt = stmt.returning(self.model.id, literal_column("xmax = 0"))
+            returned = (await db.execute(stmt)).all()
+            invalidator.mark(
+                db.sync_session, self.model.__tablename__, [r[0] for r in returned]
+            )
+
+            if "id" in columns:
+                inserted = {str(id): flag for id, flag in returned}
+                for i in indexes:
+                    id = str(rows[i]["id"])
+                    status = "unchanged"
+                    if id in inserted:
+                        status = "created" if inserted[id] else "updated"
+                    statuses[i] = {"id": id, "status": status}
+            else:
+                for i, (id, _) in zip(indexes, returned):
+                    statuses[i] = {"id": str(id), "status": "created"}
+        return statuses
+
+    async def bulk_upsert(
+        self,
+        db: AsyncSession,
+        *,
+        objs_in: Sequence[CreateSchemaType],
+        chunk_size: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """
+        Insert `objs_in`, updating the rows whose id already exists, with
+        INSERT ... ON CONFLICT (id) DO UPDATE; `chunk_size` rows per
+        statement and one commit per chunk. Rows without an id are always
+        inserted.
+
+        Returns `{"id", "status"}` for every input row, in order, where
+        status is "created", "updated", "unchanged" or "failed". A chunk the
+        database rejects is retried row by row in savepoints, so only the
+        offending rows fail (with the error in "message").
+        """
+        columns = self.model.__table__.columns.keys()
+        statuses: List[Dict[str, Any]] = []
+        for start in range(0, len(objs_in), chunk_size):
+            rows = []
+            for obj_in in objs_in[start : start + chunk_size]:
+                # Only the fields sent are written, so an update keeps the
+                # columns the client left out
+                row = obj_in.dict(exclude_unset=True)
+                row = {k: v for k, v in row.items() if k in columns}
+                if row.get("id") is None:
+                    row.pop("id", None)
+                rows.append(row)
+
+            try:
+                statuses += await self._upsert(db, rows)
+                await db.commit()
+                continue
+            except DBAPIError:
+                await db.rollback()
+
+            for row in rows:
+                try:
+                    async with db.begin_nested():
+                        statuses += await self._upsert(db, [row])
+                except DBAPIError as e:
+                    statuses.append(
+                        {
+                            "id": str(row["id"]) if "id" in row else None,
+                            "status": "failed",
+                            "message": str(e.orig),
+                        }
+                    )
+            await db.commit()
+        return statuses
+
+    async def enable(
+        self, db: AsyncSession, *, id: int, load: LoadSpec = ()
+    ) -> ModelType:
+        db_obj = await self.get(db, id)
+        update_data = {"active": True}
+        return await self.update(db, db_obj=db_obj, obj_in=update_data, load=load)
+
+    async def disable(
+        self, db: AsyncSession, *, id: int, load: LoadSpec = ()
+    ) -> ModelType:
+        db_obj = await self.get(db, id)
+        update_data = {"active": False}
+        return await self.update(db, db_obj=db_obj, obj_in=update_data, load=load)
+
+    async def remove(
+        self, db: AsyncSession, *, id: int, load: LoadSpec = ()
+    ) -> ModelType:
+        obj = await self.get(db, id, load=load)
+        await db.delete(obj)
+        await db.commit()
+        return obj
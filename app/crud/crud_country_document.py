@@ -1,53 +1,96 @@
-import os
+import binascii
 import uuid
-from typing import Any
+from typing import IO, Any, List
 
-from sqlalchemy.orm import Session
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from app.core.config import settings
-from app.crud.base import CRUDBase
+from app.crud.base import AsyncCRUDBase, LoadSpec
+from app.db.blobs import lock_blob
 from app.models import CountryDocument
 from app.schemas.country_document import CountryDocumentCreate, CountryDocumentUpdate
-from app.utils import decode_pdf, isBase64, uploadPDF
+from app.utils import Base64Reader, FileTooLarge, document_key, stage_blob, store_blob
 
 
 class CRUDCountryDocument(
-    CRUDBase[CountryDocument, CountryDocumentCreate, CountryDocumentUpdate]
+    AsyncCRUDBase[CountryDocument, CountryDocumentCreate, CountryDocumentUpdate]
 ):
-    def create(self, db: Session, obj_in: CountryDocumentCreate) -> Any:
-        # Upload the file
-        if not isBase64(obj_in.filename):
+    async def create(
+        self, db: AsyncSession, obj_in: CountryDocumentCreate, load: LoadSpec = ()
+    ) -> Any:
+        # The PDF comes base64 encoded in `filename` and is decoded chunk by
+        # chunk while it is written to disk
+        try:
+            return await self.upload(
+                db, obj_in=obj_in, file=Base64Reader(obj_in.filename or ""), load=load
+            )
+        except (binascii.Error, UnicodeEncodeError):
             return {
                 "success": False,
                 "message": "This is not a valid base64 encoded image",
             }
-
-        attachment = decode_pdf(obj_in.filename)
-
-        if not attachment:
+        except FileTooLarge as e:
+            return {"success": False, "message": str(e)}
+        except ValueError:
             return {"success": False, "message": "This is not a valid PDF"}
 
+    async def upload(
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: CountryDocumentCreate,
+        file: IO[bytes],
+        load: LoadSpec = (),
+    ) -> CountryDocument:
+        """
+        Create a document from a PDF file object, copied in chunks into the
+        blob store, where documents with the same content share one file.
+
+        Raises ValueError when the file is not a PDF, `FileTooLarge` when it
+        exceeds MAX_DOCUMENT_SIZE.
+        """
         if not obj_in.id:
             obj_in.id = uuid.uuid4()
 
-        attachment = uploadPDF(attachment, str(obj_in.id))
-
-        obj_in.filesize = attachment["filesize"]
-
-        r = super().create(db, obj_in=obj_in)
-
-        db.commit()
-        return r
-
-    def get_file(self, db: Session, id: uuid.UUID) -> Any:
-        attachment = self.get(db=db, id=id)
+        staged = await run_in_threadpool(
+            stage_blob, file, magic=b"%PDF", max_size=settings.MAX_DOCUMENT_SIZE
+        )
+        # Held until the row is committed, so that collect_blobs does not
+        # remove the blob in between
+        await db.execute(lock_blob(staged[2]))
+        saved = await run_in_threadpool(store_blob, *staged)
+        obj_in.filesize = saved["size"]
+        obj_in.filetype = "application/pdf"
+        # Not a field of the create schema, so that clients cannot point a
+        # row at someone else's blob
+        obj_in_data = jsonable_encoder(obj_in, exclude={"filename"})
+        obj_in_data["checksum"] = saved["checksum"]
+
+        # The blob may be shared, so it is left for `collect_blobs` when the
+        # insert fails
+        return await super().create(db, obj_in=obj_in_data, load=load)
+
+    async def get_for_country(
+        self, db: AsyncSession, country_id: str, *, load: LoadSpec = ()
+    ) -> List[CountryDocument]:
+        result = await db.execute(
+            self.select(load).filter(self.model.country_id == country_id)
+        )
+        return result.scalars().all()
+
+    async def get_file(self, db: AsyncSession, id: uuid.UUID) -> Any:
+        attachment = await self.get(db=db, id=id)
         if not attachment:
             return None
 
-        filename = str(id)
-
-        filepath = os.path.join(settings.UPLOADED_FILES_DEST, filename[:1], filename)
-        return {"name": attachment.name, "filepath": filepath}
+        return {
+            "name": attachment.name,
+            "key": await run_in_threadpool(document_key, str(id), attachment.checksum),
+            "filetype": attachment.filetype or "application/pdf",
+            "checksum": attachment.checksum,
+        }
 
 
 country_document = CRUDCountryDocument(CountryDocument)
@@ -0,0 +1,169 @@
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from app.core.config import settings
+from app.core.logger import log
+from app.models import CountryDocument
+from app.storage import TEMP_DIR, LocalStorage, Storage, get_storage
+from app.utils import BLOB_DIR, stage_blob, store_blob, upload_key
+
+# Blobs whose references are looked up with one query
+BATCH_SIZE = 1000
+
+# First key of the pg advisory locks on blobs
+BLOB_LOCK = 8151
+
+
+def blob_lock(checksum: str) -> Tuple[int, int]:
+    # 28 bits of the checksum fit the int4 key; collisions only serialize
+    return BLOB_LOCK, int(checksum[:7], 16)
+
+
+def lock_blob(checksum: str) -> Select:
+    """
+    Statement taking a shared lock on blob `checksum` until the transaction
+    ends. Uploads hold it from before they reuse or write the blob until
+    their row is committed, so `collect_blobs` cannot remove a blob that a
+    pending row is about to reference.
+    """
+    return select(func.pg_advisory_xact_lock_shared(*blob_lock(checksum)))
+
+
+def blob_references(db: Session, checksums: Iterable[str]) -> Dict[str, int]:
+    """
+    The number of country_document rows referencing each blob of
+    `checksums`; unreferenced ones are left out.
+    """
+    result = db.execute(
+        select(CountryDocument.checksum, func.count())
+        .filter(CountryDocument.checksum.in_(list(checksums)))
+        .group_by(CountryDocument.checksum)
+    )
+    return dict(result.all())
+
+
+def _remove(storage: Storage, key: str, cutoff: float, dry_run: bool) -> Optional[int]:
+    # Checked again right before removing: an upload of the same content
+    # touches the blob
+    stat = storage.stat(key)
+    if stat is None or stat[1] > cutoff:
+        return None
+    if not dry_run:
+        storage.delete(key)
+    return stat[0]
+
+
+def _remove_blob(
+    db: Session, storage: Storage, key: str, cutoff: float, dry_run: bool
+) -> Optional[int]:
+    checksum = key.rsplit("/", 1)[-1]
+    # Skipped while an upload of the same content holds the lock; once it
+    # is taken, a row committed since the batch query is seen
+    locked = db.execute(
+        select(func.pg_try_advisory_xact_lock(*blob_lock(checksum)))
+    ).scalar()
+    try:
+        if not locked or checksum in blob_references(db, [checksum]):
+            return None
+        return _remove(storage, key, cutoff, dry_run)
+    finally:
+        db.commit()
+
+
+def collect_blobs(
+    db: Session, *, grace: Optional[int] = None, dry_run: bool = False
+) -> Dict[str, int]:
+    """
+    Remove the blobs no country_document row references any more, and the
+    temporary files left by interrupted uploads.
+
+    Each blob is removed holding its lock (see `lock_blob`), after checking
+    once more that no row references it. Files modified within the last
+    `grace` seconds (BLOB_GC_GRACE by default) are kept as well.
+    """
+    cutoff = time.time() - (settings.BLOB_GC_GRACE if grace is None else grace)
+    stats = {"scanned": 0, "removed": 0, "bytes": 0}
+
+    storage = get_storage()
+
+    def count(size: Optional[int]) -> None:
+        if size is not None:
+            stats["removed"] += 1
+            stats["bytes"] += size
+
+    def sweep(keys: List[str]) -> None:
+        for key in keys:
+            count(_remove_blob(db, storage, key, cutoff, dry_run))
+
+    # Temporary files of interrupted uploads, with local storage
+    for key, (_, mtime) in storage.list(f"{TEMP_DIR}/"):
+        stats["scanned"] += 1
+        if mtime <= cutoff:
+            count(_remove(storage, key, cutoff, dry_run))
+
+    batch: Dict[str, str] = {}
+    for key, (_, mtime) in storage.list(f"{BLOB_DIR}/"):
+        stats["scanned"] += 1
+        if mtime > cutoff:
+            continue
+        batch[key.rsplit("/", 1)[-1]] = key
+        if len(batch) >= BATCH_SIZE:
+            referenced = blob_references(db, batch)
+            sweep([k for c, k in batch.items() if c not in referenced])
+            batch = {}
+    if batch:
+        referenced = blob_references(db, batch)
+        sweep([k for c, k in batch.items() if c not in referenced])
+
+    log.info(
+        "BLOB GC%s: %d files scanned, %d removed, %d bytes freed",
+        " (dry run)" if dry_run else "",
+        stats["scanned"],
+        stats["removed"],
+        stats["bytes"],
+    )
+    return stats
+
+
+def migrate_documents(db: Session) -> Dict[str, int]:
+    """
+    Move the files of documents stored before the blob store, under
+    `<first char>/<id>`, into it and record their checksum.
+
+    Each row is committed before its old file is removed, so an interrupted
+    run leaves both copies and can be repeated.
+    """
+    stats = {"migrated": 0, "deduplicated": 0}
+    local = LocalStorage()
+    documents = db.execute(select(CountryDocument)).scalars().all()
+    for document in documents:
+        # Files stored by id were always on the local filesystem
+        path = local.path(upload_key(str(document.id)))
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "rb") as f:
+                staged = stage_blob(f)
+        except ValueError as e:
+            log.error("Cannot migrate %s: %s", path, e)
+            continue
+        db.execute(lock_blob(staged[2]))
+        saved = store_blob(*staged)
+        document.checksum = saved["checksum"]
+        document.filesize = saved["size"]
+        db.commit()
+        os.remove(path)
+        stats["migrated"] += 1
+        stats["deduplicated"] += not saved["created"]
+
+    log.info(
+        "BLOB MIGRATE: %d documents moved, %d already stored",
+        stats["migrated"],
+        stats["deduplicated"],
+    )
+    return stats
@@ -0,0 +1,155 @@
+import csv
+import gzip
+import time
+from typing import IO, Any, Dict, List, Optional, Union
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.cache import invalidator
+from app.core.logger import log
+
+# Tables that can be loaded from CSV
+ingestable_models = {
+    m.__tablename__: m
+    for m in (
+        models.Region,
+        models.SubRegion,
+        models.Country,
+        models.CountryContact,
+        models.CountrySector,
+        models.SectorIndustry,
+        models.SectorDivision,
+        models.SectorGroup,
+        models.Sector,
+    )
+}
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _decompressed(f: IO[bytes]) -> IO[bytes]:
+    position = f.tell()
+    magic = f.read(2)
+    f.seek(position)
+    return gzip.GzipFile(fileobj=f) if magic == GZIP_MAGIC else f
+
+
+def _read_header(f: IO[bytes], table: str) -> List[str]:
+    header = next(csv.reader([f.readline().decode("utf-8-sig")]), [])
+    if not header:
+        raise ValueError("The CSV file has no header line")
+    unknown = set(header) - set(ingestable_models[table].__table__.columns.keys())
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(sorted(unknown))}")
+    return header
+
+
+def ingest_csv(
+    db: Session,
+    table: str,
+    source: Union[str, IO[bytes]],
+    *,
+    update: bool = True,
+    previous: Optional[IO[bytes]] = None,
+    commit: bool = True,
+) -> Dict[str, Any]:
+    """
+    Load a CSV (or gzipped CSV) file, given as a path or a seekable binary
+    file object, into `table` and commit, unless `commit` is False.
+
+    The rows are streamed with COPY into a temporary staging table, then
+    merged into the target with one INSERT ... SELECT. Rows whose id already
+    exists are updated, or left alone when `update` is False; rows equal to
+    the stored ones are skipped either way. The header line names the
+    columns; columns missing from it keep their defaults.
+
+    `previous` is the version of the file loaded before. When given, only
+    the rows that differ from it are updated, so rows edited in the table
+    since keep their edits unless the file changes them too.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return ingest_csv(
+                db, table, f, update=update, previous=previous, commit=commit
+            )
+
+    if table not in ingestable_models:
+        raise ValueError(f"Cannot ingest into {table}")
+
+    started = time.perf_counter()
+    f = _decompressed(source)
+    header = _read_header(f, table)
+
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    target, staging = quote(table), quote(f"staging_{table}")
+    columns = ", ".join(quote(c) for c in header)
+
+    cursor = db.connection().connection.cursor()
+    cursor.execute(
+        f"CREATE TEMP TABLE {staging} (LIKE {target} INCLUDING DEFAULTS) "
+        "ON COMMIT DROP"
+    )
+    cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN WITH CSV", f)
+    copied = cursor.rowcount
+
+    if previous is not None:
+        f = _decompressed(previous)
+        previous_columns = ", ".join(quote(c) for c in _read_header(f, table))
+        previous_staging = quote(f"previous_{table}")
+        cursor.execute(
+            f"CREATE TEMP TABLE {previous_staging} (LIKE {target}) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            f"COPY {previous_staging} ({previous_columns}) FROM STDIN WITH CSV", f
+        )
+
+    merge = f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {staging} s"
+    if "id" in header:
+        compared = [quote(c) for c in header if c != "id"]
+        # Rows identical to the stored ones are not rewritten
+        unchanged = f"SELECT 1 FROM {target} t WHERE t.id = s.id"
+        if compared:
+            unchanged += " AND ({}) IS NOT DISTINCT FROM ({})".format(
+                ", ".join(f"t.{c}" for c in compared),
+                ", ".join(f"s.{c}" for c in compared),
+            )
+        merge += f" WHERE NOT EXISTS ({unchanged})"
+        if update and compared:
+            updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in compared)
+            merge += f" ON CONFLICT (id) DO UPDATE SET {updates}"
+            if previous is not None:
+                # Only rows the file changed since its previous version
+                merge += (
+                    f" WHERE NOT EXISTS (SELECT 1 FROM {previous_staging} p"
+                    " WHERE p.id = EXCLUDED.id AND ({}) IS NOT DISTINCT FROM ({}))"
+                ).format(
+                    ", ".join(f"p.{c}" for c in compared),
+                    ", ".join(f"EXCLUDED.{c}" for c in compared),
+                )
+        else:
+            merge += " ON CONFLICT (id) DO NOTHING"
+    cursor.execute(merge)
+    merged = cursor.rowcount
+
+    invalidator.mark_table(db, table)
+    if commit:
+        db.commit()
+
+    seconds = time.perf_counter() - started
+    stats = {
+        "table": table,
+        "rows": copied,
+        "merged": merged,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(copied / seconds) if seconds else copied,
+    }
+    log.info(
+        "INGEST %s: %d rows (%d merged) in %.3fs, %d rows/s",
+        table,
+        copied,
+        merged,
+        seconds,
+        stats["rows_per_second"],
+    )
+    return stats
@@ -1,6 +1,10 @@
+import gzip
+import hashlib
+import io
 import os
-from csv import DictReader
+from typing import Iterator, Tuple
 
+from sqlalchemy import func, select
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Session
@@ -9,26 +13,89 @@ from sqlalchemy.schema import DropTable
 from app import models
 from app.core.logger import log
 from app.db import base  # noqa: F401
+from app.db.ingest import GZIP_MAGIC, ingest_csv, ingestable_models
 from app.db.session import engine
 
+# pg_advisory_xact_lock key serializing seed loading across containers
+SEED_LOCK = 8150
+
 
 @compiles(DropTable, "postgresql")
 def _compile_drop_table(element, compiler, **kwargs):
     return compiler.visit_drop_table(element) + " CASCADE"
 
 
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def seed_files(directory: str) -> Iterator[Tuple[str, str]]:
+    """
+    (table, path) of the seed files in `directory`, `<table>.csv` or
+    `<table>.csv.gz`, in foreign key order.
+    """
+    for table in ingestable_models:
+        for name in (f"{table}.csv", f"{table}.csv.gz"):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                yield table, path
+
+
 def init_db(db: Session) -> None:
-    log.info("initialising countries")
-    # Create countries
-    file_name = f"{os.getcwd()}/csv/country.csv"
-    with open(file_name, "r") as f:
-        dict_reader = DictReader(f)
-        data = list(dict_reader)
-        stmt = insert(models.Country).values(data)
-        stmt = stmt.on_conflict_do_nothing(index_elements=[models.Country.id])
+    """
+    Load the seed files whose content changed since they were last loaded.
+
+    Every file's SHA-256 and contents are kept in `seed_file`; unchanged
+    files are not read again. Of a changed file, the rows missing from the
+    table are inserted and the rows that differ from the previous version
+    of the file are updated. Other rows, possibly edited through the API
+    since, are left alone; so are all existing rows when no previous
+    version is recorded. Everything runs in one transaction holding an
+    advisory lock, so containers starting together load the seeds once.
+    """
+    log.info("initialising seed data")
+    db.execute(select(func.pg_advisory_xact_lock(SEED_LOCK)))
+    loaded = dict(
+        db.execute(select(models.SeedFile.name, models.SeedFile.checksum)).all()
+    )
+
+    for table, path in seed_files(f"{os.getcwd()}/csv"):
+        name = os.path.basename(path)
+        checksum = file_checksum(path)
+        if loaded.get(name) == checksum:
+            log.info("seed %s unchanged", name)
+            continue
+
+        previous = db.scalar(
+            select(models.SeedFile.contents).filter(models.SeedFile.name == name)
+        )
+        with open(path, "rb") as f:
+            contents = f.read()
+        ingest_csv(
+            db,
+            table,
+            io.BytesIO(contents),
+            update=previous is not None,
+            previous=io.BytesIO(previous) if previous is not None else None,
+            commit=False,
+        )
+
+        if not contents.startswith(GZIP_MAGIC):
+            contents = gzip.compress(contents)
+        stmt = insert(models.SeedFile).values(
+            name=name, checksum=checksum, contents=contents
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.SeedFile.name],
+            set_={"checksum": checksum, "contents": contents, "loaded_at": func.now()},
+        )
         db.execute(stmt)
-        db.commit()
 
+    db.commit()
     log.info("initialising finished")
 
 
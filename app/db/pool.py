@@ -0,0 +1,126 @@
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from app.core.metrics import (
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_EXHAUSTED,
+    DB_POOL_HELD,
+    DB_POOL_WAIT,
+)
+
+
+class PoolMetrics:
+    """
+    Counters for a single engine's connection pool, fed by SQLAlchemy pool
+    events.
+
+    `exhausted` counts checkouts that left the pool with no free connection
+    and no overflow headroom, i.e. the next concurrent checkout has to wait
+    up to `pool_timeout`.
+
+    `wait_seconds` is the time checkouts spent getting a connection out of
+    the pool, waiting for a free one or opening a new one; `held_seconds` is
+    the time connections stayed checked out until they were returned.
+
+    Both times, checked out connections and exhausted checkouts are also
+    exported to /metrics.
+    """
+
+    def __init__(self, name: str, engine: Engine):
+        self.name = name
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.overflow_checkouts = 0
+        self.exhausted = 0
+        self.wait_seconds = 0.0
+        self.held_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def wrap_pool(self, pool: Pool) -> None:
+        """
+        Time `pool._do_get`, the step of a checkout that waits for a free
+        connection (up to `pool_timeout`) or opens a new one. SQLAlchemy has
+        no event before a checkout starts, so the pool's getter is wrapped.
+        """
+        do_get = pool._do_get
+
+        def timed_do_get():
+            started = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                waited = time.perf_counter() - started
+                with self._lock:
+                    self.wait_seconds += waited
+                DB_POOL_WAIT.labels(self.name).observe(waited)
+
+        pool._do_get = timed_do_get
+
+    def on_engine_disposed(self, engine: Engine) -> None:
+        # dispose() swaps in a recreated pool, which needs wrapping again.
+        self.wrap_pool(self.engine.pool)
+
+    def on_connect(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        pool = self.engine.pool
+        connection_record.info["checkout_time"] = time.perf_counter()
+        with self._lock:
+            self.checkouts += 1
+            if pool.overflow() > 0:
+                self.overflow_checkouts += 1
+            if pool.checkedout() >= pool.size() + pool._max_overflow:
+                self.exhausted += 1
+                DB_POOL_EXHAUSTED.labels(self.name).inc()
+        DB_POOL_CHECKED_OUT.labels(self.name).inc()
+
+    def on_checkin(self, dbapi_connection, connection_record) -> None:
+        started = connection_record.info.pop("checkout_time", None)
+        with self._lock:
+            self.checkins += 1
+            if started is not None:
+                held = time.perf_counter() - started
+                self.held_seconds += held
+        if started is not None:
+            DB_POOL_HELD.labels(self.name).observe(held)
+            DB_POOL_CHECKED_OUT.labels(self.name).dec()
+
+    def status(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        return {
+            "name": self.name,
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "overflow_checkouts": self.overflow_checkouts,
+            "exhausted": self.exhausted,
+            "wait_seconds": self.wait_seconds,
+            "held_seconds": self.held_seconds,
+        }
+
+
+def instrument_pool(name: str, engine: Engine) -> PoolMetrics:
+    """
+    Attach pool event listeners to `engine` and return the metrics object.
+
+    For an `AsyncEngine` pass `async_engine.sync_engine`.
+    """
+    metrics = PoolMetrics(name, engine)
+    metrics.wrap_pool(engine.pool)
+    event.listen(engine, "engine_disposed", metrics.on_engine_disposed)
+    event.listen(engine, "connect", metrics.on_connect)
+    event.listen(engine, "checkout", metrics.on_checkout)
+    event.listen(engine, "checkin", metrics.on_checkin)
+    return metrics
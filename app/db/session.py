@@ -1,17 +1,42 @@
+import sqlalchemy
+import sqlalchemy.ext.asyncio
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
 
+from app.core.cache import invalidator
 from app.core.config import settings
+from app.db.pool import instrument_pool
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, poolclass=NullPool)
+# Wraps the engine factories, so both engines below are traced
+if settings.TRACE_SQL:
+    SQLAlchemyInstrumentor().instrument()
 
-SQLAlchemyInstrumentor().instrument(
-    engine=engine,
-    pool_size=20,
-    max_overflow=100,
-    echo=False,
-    pool_pre_ping=True,
+pool_options = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
 )
+
+# Sync engine for scripts, migrations and celery tasks
+engine = sqlalchemy.create_engine(settings.SQLALCHEMY_DATABASE_URI, **pool_options)
+
+# Async engine (asyncpg) for the API endpoints
+async_engine = sqlalchemy.ext.asyncio.create_async_engine(
+    settings.ASYNC_SQLALCHEMY_DATABASE_URI, **pool_options
+)
+
+pool_metrics = {
+    "sync": instrument_pool("sync", engine),
+    "async": instrument_pool("async", async_engine.sync_engine),
+}
+
 SessionLocal = sessionmaker(autocommit=False, bind=engine)
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine, class_=AsyncSession, autocommit=False, expire_on_commit=False
+)
+
+# Evict cached rows on commit, for sync and async sessions alike
+invalidator.listen(Session)
@@ -7,10 +7,11 @@ from sqlalchemy import (
     Float,
     ForeignKey,
     Integer,
+    LargeBinary,
     Text,
     text,
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy_serializer import SerializerMixin
 
@@ -114,6 +115,12 @@ class CountryDocument(Base, SerializerMixin):
     name = Column(Text)
     filesize = Column(Integer)
     filetype = Column(Text)
+    # SHA-256 of the file, also the name of its blob
+    checksum = Column(CHAR(64), index=True)
+    # Filled in by the information.process_document task
+    status = Column(Text, default="processing")
+    page_count = Column(Integer)
+    info = Column(JSONB)
 
 
 class CountrySector(Base, SerializerMixin):
@@ -171,3 +178,14 @@ class Sector(Base, SerializerMixin):
         ForeignKey("sector_group.id", ondelete="CASCADE", onupdate="CASCADE")
     )
     name = Column(Text)
+
+
+class SeedFile(Base):
+    __tablename__ = "seed_file"
+
+    name = Column(Text, primary_key=True)
+    checksum = Column(CHAR(64), nullable=False)
+    loaded_at = Column(DateTime, server_default=text("now()"))
+    # The file as last loaded, gzipped, to tell which rows the next version
+    # changes
+    contents = Column(LargeBinary)
@@ -1,9 +1,11 @@
 from pydantic import BaseModel
 
+from .batch import *  # noqa
 from .country import *  # noqa
 from .country_contact import *  # noqa
 from .country_document import *  # noqa
 from .country_sector import *  # noqa
+from .ingest import *  # noqa
 from .region import *  # noqa
 from .sector import *  # noqa
 from .sector_division import *  # noqa
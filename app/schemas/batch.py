@@ -0,0 +1,32 @@
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+
+
+class BatchGetRequest(BaseModel):
+    ids: List[str] = Field(..., min_items=1, max_items=settings.BATCH_GET_MAX_IDS)
+
+
+class BulkRowStatus(BaseModel):
+    id: Optional[str]
+    status: str
+    message: Optional[str]
+
+
+class BulkUpsertResponse(BaseModel):
+    success: bool
+    data: List[BulkRowStatus]
+
+
+class TaskStatus(BaseModel):
+    id: str
+    status: str
+    result: Optional[Any]
+    error: Optional[str]
+
+
+class TaskStatusResponse(BaseModel):
+    success: bool
+    data: TaskStatus
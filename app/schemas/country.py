@@ -75,3 +75,10 @@ class CountryResponse(BaseModel):
 class CountryListResponse(BaseModel):
     success: bool
     data: Optional[List[Country]]
+    next: Optional[str]
+
+
+class CountryBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[Country]]
+    missing: List[str]
@@ -48,3 +48,10 @@ class CountryContactResponse(BaseModel):
 class CountryContactListResponse(BaseModel):
     success: bool
     data: Optional[List[CountryContact]]
+    next: Optional[str]
+
+
+class CountryContactBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[CountryContact]]
+    missing: List[str]
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -16,7 +16,8 @@ class CountryDocumentBase(BaseModel):
 
 # Properties to receive via API on creation
 class CountryDocumentCreate(CountryDocumentBase):
-    pass
+    # Base64 encoded PDF
+    filename: Optional[str]
 
 
 class CountryDocumentUpdate(CountryDocumentBase):
@@ -25,6 +26,11 @@ class CountryDocumentUpdate(CountryDocumentBase):
 
 class CountryDocumentInDBBase(CountryDocumentBase):
     id: UUID
+    # Set from the uploaded file only, never by clients
+    checksum: Optional[str]
+    status: Optional[str]
+    page_count: Optional[int]
+    info: Optional[Dict[str, str]]
 
     class Config:
         orm_mode = True
@@ -43,8 +49,17 @@ class CountryDocumentInDB(CountryDocumentInDBBase):
 class CountryDocumentResponse(BaseModel):
     success: bool
     data: Optional[CountryDocument]
+    # Celery task extracting the page count and metadata
+    task_id: Optional[str]
 
 
 class CountryDocumentListResponse(BaseModel):
     success: bool
     data: Optional[List[CountryDocument]]
+    next: Optional[str]
+
+
+class CountryDocumentBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[CountryDocument]]
+    missing: List[str]
@@ -45,3 +45,10 @@ class CountrySectorResponse(BaseModel):
 class CountrySectorListResponse(BaseModel):
     success: bool
     data: Optional[List[CountrySector]]
+    next: Optional[str]
+
+
+class CountrySectorBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[CountrySector]]
+    missing: List[str]
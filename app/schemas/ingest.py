@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+
+class IngestStats(BaseModel):
+    table: str
+    rows: int
+    merged: int
+    seconds: float
+    rows_per_second: int
+
+
+class IngestResponse(BaseModel):
+    success: bool
+    data: IngestStats
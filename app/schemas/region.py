@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -34,3 +34,15 @@ class Region(RegionInDBBase):
 # Additional properties stored in DB
 class RegionInDB(RegionInDBBase):
     pass
+
+
+class RegionListResponse(BaseModel):
+    success: bool
+    data: Optional[List[Region]]
+    next: Optional[str]
+
+
+class RegionBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[Region]]
+    missing: List[str]
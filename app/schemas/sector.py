@@ -42,3 +42,10 @@ class SectorResponse(BaseModel):
 class SectorListResponse(BaseModel):
     success: bool
     data: Optional[List[Sector]]
+    next: Optional[str]
+
+
+class SectorBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[Sector]]
+    missing: List[str]
@@ -45,3 +45,10 @@ class SectorDivisionResponse(BaseModel):
 class SectorDivisionListResponse(BaseModel):
     success: bool
     data: Optional[List[SectorDivision]]
+    next: Optional[str]
+
+
+class SectorDivisionBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[SectorDivision]]
+    missing: List[str]
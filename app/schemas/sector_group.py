@@ -45,3 +45,10 @@ class SectorGroupResponse(BaseModel):
 class SectorGroupListResponse(BaseModel):
     success: bool
     data: Optional[List[SectorGroup]]
+    next: Optional[str]
+
+
+class SectorGroupBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[SectorGroup]]
+    missing: List[str]
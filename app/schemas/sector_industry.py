@@ -45,3 +45,10 @@ class SectorIndustryResponse(BaseModel):
 class SectorIndustryListResponse(BaseModel):
     success: bool
     data: Optional[List[SectorIndustry]]
+    next: Optional[str]
+
+
+class SectorIndustryBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[SectorIndustry]]
+    missing: List[str]
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -35,3 +35,15 @@ class SubRegion(SubRegionInDBBase):
 # Additional properties stored in DB
 class SubRegionInDB(SubRegionInDBBase):
     pass
+
+
+class SubRegionListResponse(BaseModel):
+    success: bool
+    data: Optional[List[SubRegion]]
+    next: Optional[str]
+
+
+class SubRegionBatchResponse(BaseModel):
+    success: bool
+    data: List[Optional[SubRegion]]
+    missing: List[str]
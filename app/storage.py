@@ -0,0 +1,254 @@
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import IO, AsyncIterator, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+# (size in bytes, modification time as a timestamp)
+Stat = Tuple[int, float]
+
+# Key prefix of LocalStorage.temp_dir
+TEMP_DIR = "tmp"
+
+
+class Storage:
+    """
+    Where uploaded files live, addressed by `/`-separated keys such as
+    `blobs/ab/cd/<sha256>`.
+
+    The blocking methods are meant for Celery tasks, scripts and thread
+    pools; `iter_bytes` streams a file into an async response.
+    """
+
+    def path(self, key: str) -> Optional[str]:
+        """The file of `key` on the local filesystem, if stored there."""
+        return None
+
+    def temp_dir(self) -> Optional[str]:
+        """Directory for files being written before `move`."""
+        return None
+
+    def stat(self, key: str) -> Optional[Stat]:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def open(self, key: str, start: int = 0) -> IO[bytes]:
+        """A binary file object reading `key` from byte `start`."""
+        raise NotImplementedError
+
+    def move(self, key: str, filepath: str) -> None:
+        """Store the local file `filepath` as `key`, consuming it."""
+        raise NotImplementedError
+
+    def save(self, key: str, src: IO[bytes]) -> None:
+        """Store the contents of the binary file object `src` as `key`."""
+        fd, tmp = tempfile.mkstemp(dir=self.temp_dir(), prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(src, f, settings.UPLOAD_CHUNK_SIZE)
+            self.move(key, tmp)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def touch(self, key: str) -> None:
+        """Set the modification time of `key` to now."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, Stat]]:
+        """The keys under `prefix` with their size and modification time."""
+        raise NotImplementedError
+
+    def url(self, key: str, *, filename: str, media_type: str) -> Optional[str]:
+        """
+        A time-limited URL from which clients download `key` directly, or
+        None when the file has to be served by the API.
+        """
+        return None
+
+    async def iter_bytes(
+        self, key: str, start: int = 0, length: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """Read `length` bytes of `key` (all for None) from `start`."""
+        f = await run_in_threadpool(self.open, key, start)
+        try:
+            while length is None or length > 0:
+                size = settings.UPLOAD_CHUNK_SIZE
+                if length is not None:
+                    size = min(size, length)
+                chunk = await run_in_threadpool(f.read, size)
+                if not chunk:
+                    break
+                if length is not None:
+                    length -= len(chunk)
+                yield chunk
+        finally:
+            await run_in_threadpool(f.close)
+
+
+class LocalStorage(Storage):
+    """Files under UPLOADED_FILES_DEST, one per key."""
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+
+    @property
+    def root(self) -> str:
+        return self._root or settings.UPLOADED_FILES_DEST
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def temp_dir(self) -> str:
+        # Same filesystem as the keys, so `move` is a rename
+        directory = self.path(TEMP_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def stat(self, key: str) -> Optional[Stat]:
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def open(self, key: str, start: int = 0) -> IO[bytes]:
+        f = open(self.path(key), "rb")
+        f.seek(start)
+        return f
+
+    def move(self, key: str, filepath: str) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(filepath, path)
+
+    def touch(self, key: str) -> None:
+        os.utime(self.path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, Stat]]:
+        top = self.path(prefix)
+        for directory, _, names in os.walk(top):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                yield key, (stat.st_size, stat.st_mtime)
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3 bucket, or any S3-compatible store (MinIO, Ceph) at
+    S3_ENDPOINT_URL. Downloads are presigned URLs, so the file bytes do
+    not pass through the API.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        *,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        url_expires: int = 300,
+    ):
+        import boto3
+
+        self.bucket = bucket
+        self.url_expires = url_expires
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+        )
+
+    def stat(self, key: str) -> Optional[Stat]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return head["ContentLength"], head["LastModified"].timestamp()
+
+    def open(self, key: str, start: int = 0) -> IO[bytes]:
+        extra = {"Range": f"bytes={start}-"} if start else {}
+        return self.client.get_object(Bucket=self.bucket, Key=key, **extra)["Body"]
+
+    def move(self, key: str, filepath: str) -> None:
+        # Multipart upload for large files
+        self.client.upload_file(filepath, self.bucket, key)
+        os.unlink(filepath)
+
+    def save(self, key: str, src: IO[bytes]) -> None:
+        self.client.upload_fileobj(src, self.bucket, key)
+
+    def touch(self, key: str) -> None:
+        self.client.copy_object(
+            Bucket=self.bucket,
+            Key=key,
+            CopySource={"Bucket": self.bucket, "Key": key},
+            MetadataDirective="REPLACE",
+        )
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, Stat]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", ()):
+                yield obj["Key"], (obj["Size"], obj["LastModified"].timestamp())
+
+    def url(self, key: str, *, filename: str, media_type: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": key,
+                "ResponseContentType": media_type,
+                "ResponseContentDisposition": (
+                    f"attachment; filename*=utf-8''{quote(filename)}"
+                ),
+            },
+            ExpiresIn=self.url_expires,
+        )
+
+
+@lru_cache()
+def get_storage() -> Storage:
+    """The STORAGE_BACKEND ("local" or "s3") of this process."""
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            settings.S3_BUCKET,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            url_expires=settings.S3_URL_EXPIRES,
+        )
+    return LocalStorage()
@@ -0,0 +1,17 @@
+import pytest
+from httpx import AsyncClient
+
+from app import app
+from app.core.config import settings
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filename", ["JVBERi0xLjQK!!!!", "JVBERi0xLjQKJVh="])
+async def test_create_rejects_invalid_base64(cache, filename) -> None:
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        r = await ac.post(
+            f"{settings.API_V1_STR}/country-document/",
+            json={"country_id": "UG", "filename": filename},
+        )
+    assert r.status_code == 422
+    assert r.json()["message"] == "This is not a valid base64 encoded image"
@@ -0,0 +1,34 @@
+import pytest
+from httpx import AsyncClient
+
+from app import app, crud
+from app.core.config import settings
+from app.crud.base import encode_cursor
+
+REGION = {"id": "7d4c4f46-4a4c-4bb0-9c64-6f4f7e0b55a1", "subregions": []}
+
+
+@pytest.mark.asyncio
+async def test_list_regions_is_a_plain_list_unless_paged(cache, mocker) -> None:
+    get_page = mocker.patch.object(
+        crud.region, "get_page", return_value=([REGION], "next-page")
+    )
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        r = await ac.get(f"{settings.API_V1_STR}/region/")
+        assert r.status_code == 200
+        assert r.json() == [REGION]
+        assert get_page.call_args.kwargs["limit"] == settings.PAGE_SIZE
+
+        r = await ac.get(f"{settings.API_V1_STR}/region/", params={"limit": 1})
+        assert r.status_code == 200
+        assert r.json() == {"success": True, "data": [REGION], "next": "next-page"}
+        assert get_page.call_args.kwargs["limit"] == 1
+
+
+@pytest.mark.asyncio
+async def test_list_regions_rejects_a_cursor_of_another_key_type(cache) -> None:
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        r = await ac.get(
+            f"{settings.API_V1_STR}/region/", params={"cursor": encode_cursor("UG")}
+        )
+    assert r.status_code == 422
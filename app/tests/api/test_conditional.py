@@ -0,0 +1,105 @@
+import asyncio
+from email.utils import formatdate
+
+import fakeredis.aioredis
+import pytest
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from fastapi_plugins import depends_redis
+
+from app import app, not_modified_handler
+from app.api.deps import ConditionalGet, NotModified
+from app.core import cache as caches
+from app.core.cache import MODIFIED_KEY, REVISIONS_KEY, TableRevisions
+from app.core.config import settings
+
+
+@pytest.fixture()
+def api(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(caches, "revisions", TableRevisions(10, 60))
+
+    async def redis():
+        return await fakeredis.aioredis.create_redis_pool(server)
+
+    router = APIRouter(dependencies=[Depends(ConditionalGet("sector"))])
+    calls = []
+
+    @router.get("/sector/")
+    async def list_sectors():
+        calls.append(1)
+        return {"success": True, "data": []}
+
+    test_app = FastAPI()
+    test_app.include_router(router)
+    test_app.dependency_overrides[depends_redis] = redis
+    test_app.add_exception_handler(NotModified, not_modified_handler)
+    return TestClient(test_app), calls, redis
+
+
+def test_repeated_get_is_not_modified_without_calling_the_endpoint(api) -> None:
+    client, calls, _ = api
+
+    r = client.get("/sector/")
+    assert r.status_code == 200
+    assert r.headers["etag"] == 'W/"1-sector-0"'
+    assert r.headers["cache-control"] == "no-cache"
+    assert "last-modified" in r.headers
+
+    r = client.get("/sector/", headers={"If-None-Match": r.headers["etag"]})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == 'W/"1-sector-0"'
+    assert calls == [1]
+
+
+def test_write_changes_the_etag(api) -> None:
+    client, calls, redis = api
+    etag = client.get("/sector/").headers["etag"]
+
+    async def bump():
+        cache = await redis()
+        await cache.hincrby(REVISIONS_KEY, "sector", 1)
+        await cache.hset(MODIFIED_KEY, "sector", 2e9)
+
+    asyncio.new_event_loop().run_until_complete(bump())
+    caches.revisions.evict_local({"revisions": ["sector"]})
+
+    r = client.get("/sector/", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["etag"] == 'W/"1-sector-1"'
+    assert calls == [1, 1]
+
+
+def test_if_modified_since(api) -> None:
+    client, calls, _ = api
+    modified = client.get("/sector/").headers["last-modified"]
+
+    r = client.get("/sector/", headers={"If-Modified-Since": modified})
+    assert r.status_code == 304
+
+    r = client.get(
+        "/sector/", headers={"If-Modified-Since": formatdate(0, usegmt=True)}
+    )
+    assert r.status_code == 200
+    # If-None-Match takes precedence
+    r = client.get(
+        "/sector/", headers={"If-None-Match": '"other"', "If-Modified-Since": modified}
+    )
+    assert r.status_code == 200
+    assert len(calls) == 3
+
+
+def test_document_files_are_validated_by_their_own_etag() -> None:
+    conditional = {
+        route.path
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        and any(
+            isinstance(d.call, ConditionalGet) for d in route.dependant.dependencies
+        )
+    }
+    prefix = f"{settings.API_V1_STR}/country-document"
+    assert f"{prefix}/{{id}}" in conditional
+    assert f"{prefix}/{{id}}/file" not in conditional
@@ -0,0 +1,110 @@
+import hashlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app.api.files import file_response, parse_range
+
+DATA = bytes(range(256)) * 40
+CHECKSUM = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture()
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.api.files.settings.UPLOADED_FILES_DEST", str(tmp_path))
+    (tmp_path / "d").mkdir()
+    (tmp_path / "d" / "doc").write_bytes(DATA)
+
+    api = FastAPI()
+
+    @api.get("/file")
+    async def get_file(request: Request):
+        return await file_response(
+            request,
+            "d/doc",
+            filename="Report.pdf",
+            media_type="application/pdf",
+            checksum=CHECKSUM,
+        )
+
+    return TestClient(api)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-10", (990, 999)),
+        ("bytes=500-5000", (500, 999)),
+        ("bytes=0-1,5-6", None),
+        ("bytes=9-2", None),
+        ("items=0-1", None),
+        (None, None),
+    ],
+)
+def test_parse_range(header, expected) -> None:
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0"])
+def test_parse_range_not_satisfiable(header) -> None:
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+def test_whole_file_with_etag(client) -> None:
+    r = client.get("/file")
+    assert r.status_code == 200
+    assert r.content == DATA
+    assert r.headers["etag"] == f'"{CHECKSUM}"'
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["content-disposition"] == 'attachment; filename="Report.pdf"'
+
+
+def test_not_modified(client) -> None:
+    r = client.get("/file", headers={"If-None-Match": f'"{CHECKSUM}"'})
+    assert r.status_code == 304
+    assert r.content == b""
+
+
+def test_range(client) -> None:
+    r = client.get("/file", headers={"Range": "bytes=100-299"})
+    assert r.status_code == 206
+    assert r.content == DATA[100:300]
+    assert r.headers["content-range"] == f"bytes 100-299/{len(DATA)}"
+
+
+def test_if_range_mismatch_sends_whole_file(client) -> None:
+    r = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert r.status_code == 200
+    assert r.content == DATA
+
+
+def test_range_not_satisfiable(client) -> None:
+    r = client.get("/file", headers={"Range": f"bytes={len(DATA)}-"})
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_accel_redirect(client, monkeypatch) -> None:
+    monkeypatch.setattr("app.api.files.settings.ACCEL_REDIRECT_LOCATION", "/files/")
+    r = client.get("/file")
+    assert r.status_code == 200
+    assert r.content == b""
+    assert r.headers["x-accel-redirect"] == "/files/d/doc"
+    assert r.headers["etag"] == f'"{CHECKSUM}"'
+
+
+def test_presigned_redirect(client, monkeypatch, mocker) -> None:
+    storage = mocker.Mock()
+    storage.url.return_value = "https://s3.example/d/doc?X-Amz-Signature=x"
+    monkeypatch.setattr("app.api.files.get_storage", lambda: storage)
+    r = client.get("/file", allow_redirects=False)
+    assert r.status_code == 307
+    assert r.headers["location"] == storage.url.return_value
+    storage.url.assert_called_once_with(
+        "d/doc", filename="Report.pdf", media_type="application/pdf"
+    )
@@ -8,7 +8,7 @@ from fastapi.testclient import TestClient
 from fastapi_plugins import depends_redis
 
 from app import app
-from app.db.session import SessionLocal
+from app.db.session import AsyncSessionLocal, SessionLocal
 from app.tests.redis import redis_cache
 
 
@@ -53,6 +53,12 @@ def db() -> Generator:
     yield db
 
 
+@pytest.fixture()
+async def async_db() -> Generator:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture(autouse=True)
 def faker_seed():
     r = int((random.SystemRandom(random.seed()).random()) * 100000000)
@@ -0,0 +1,278 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import fakeredis.aioredis
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.core import cache as caches
+from app.core.cache import (
+    INVALIDATION_CHANNEL,
+    REVISIONS_KEY,
+    LocalCache,
+    ModelCache,
+    TableRevisions,
+    invalidator,
+)
+from app.db import session  # noqa: F401
+from app.models import Sector
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_caches_rows_and_misses(cache) -> None:
+    model_cache = ModelCache("test_sector", schemas.Sector)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return SimpleNamespace(id="0111", sector_group_id="011", name="Cereals")
+
+    r = await model_cache.get_or_load(cache, "0111", loader)
+    assert r.name == "Cereals"
+    r = await model_cache.get_or_load(cache, "0111", loader)
+    assert r["name"] == "Cereals"
+    assert len(calls) == 1
+
+    async def missing():
+        calls.append(1)
+        return None
+
+    assert await model_cache.get_or_load(cache, "9999", missing) is None
+    assert await model_cache.get_or_load(cache, "9999", missing) is None
+    assert len(calls) == 2
+
+    assert model_cache.stats() == {
+        "local_hits": 0,
+        "hits": 1,
+        "misses": 2,
+        "negative_hits": 1,
+    }
+
+    await model_cache.set(
+        cache, SimpleNamespace(id="9999", sector_group_id="999", name="Other")
+    )
+    r = await model_cache.get_or_load(cache, "9999", missing)
+    assert r["name"] == "Other"
+
+
+@pytest.mark.asyncio
+async def test_get_many_returns_rows_in_request_order(cache) -> None:
+    model_cache = ModelCache("test_batch_sector", schemas.Sector, local=True)
+    await model_cache.set(
+        cache, SimpleNamespace(id="0111", sector_group_id="011", name="Cereals")
+    )
+    model_cache.evict_local("0111")
+    calls = []
+
+    async def loader(ids):
+        calls.append(ids)
+        return [SimpleNamespace(id="0112", sector_group_id="011", name="Rice")]
+
+    rows = await model_cache.get_many(cache, ["0112", "9999", "0111", "0112"], loader)
+    assert rows[0].name == "Rice" and rows[1] is None
+    assert rows[2]["name"] == "Cereals" and rows[3] is rows[0]
+    assert calls == [["0112", "9999"]]
+
+    rows = await model_cache.get_many(cache, ["9999", "0112", "0111"], loader)
+    assert [r and r["name"] for r in rows] == [None, "Rice", "Cereals"]
+    assert len(calls) == 1
+    assert model_cache.stats() == {
+        "local_hits": 2,
+        "hits": 1,
+        "misses": 2,
+        "negative_hits": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_get_many_normalises_ids_to_the_key_type(cache) -> None:
+    # Any schema with a UUID id, on a table keyed by UUID
+    model_cache = ModelCache("region", schemas.CountryDocument)
+    region_id = uuid.uuid4()
+    calls = []
+
+    async def loader(ids):
+        calls.append(ids)
+        return [SimpleNamespace(id=region_id, name="East")]
+
+    ids = [str(region_id).upper(), region_id, "not a uuid"]
+    rows = await model_cache.get_many(cache, ids, loader)
+
+    assert [r and r.name for r in rows] == ["East", "East", None]
+    assert calls == [[str(region_id)]]
+    rows = await model_cache.get_many(cache, [str(region_id).upper()], loader)
+    assert rows[0]["name"] == "East"
+    assert len(calls) == 1
+    assert ModelCache("country_contact", schemas.Sector).key("01") == "1"
+    await model_cache.delete(cache, region_id)
+
+
+def test_local_cache_evicts_least_recently_used_and_expired(mocker) -> None:
+    local = LocalCache(maxsize=2, ttl=10)
+    local.set("a", 1)
+    local.set("b", 2)
+    assert local.get("a") == 1
+    local.set("c", 3)
+    assert local.get("b") is None
+    assert len(local) == 2
+
+    mocker.patch("app.core.cache.time.monotonic", return_value=10**12)
+    assert local.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_local_tier_is_dropped_on_invalidation(cache) -> None:
+    model_cache = ModelCache("test_region", schemas.Sector, local=True)
+    row = SimpleNamespace(id="1", sector_group_id="1", name="East")
+    await model_cache.set(cache, row)
+
+    async def loader():
+        return None
+
+    assert (await model_cache.get_or_load(cache, "1", loader))["name"] == "East"
+    assert model_cache.local_hits == 1
+
+    model_cache.evict_local("1")
+    assert (await model_cache.get_or_load(cache, "1", loader))["name"] == "East"
+    assert model_cache.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidator_evicts_rows_committed_through_a_session(cache) -> None:
+    engine = create_engine("sqlite://")
+    Sector.__table__.create(engine)
+    invalidator.bind(cache)
+
+    await cache.hset("sector", "0112", "{}")
+    await cache.hset("sector_industry", "A", "{}")
+    await cache.set("sector:missing:0113", 1)
+
+    db = Session(bind=engine)
+    db.add(Sector(id="0113", sector_group_id="011", name="Rice"))
+    db.merge(Sector(id="0112", sector_group_id="011", name="Maize"))
+    db.commit()
+    await asyncio.gather(*invalidator._tasks)
+
+    assert await cache.hget("sector", "0112") is None
+    assert await cache.get("sector:missing:0113") is None
+    assert await cache.hgetall("sector_industry") == {}
+    invalidator.bind(None)
+
+
+@pytest.mark.asyncio
+async def test_commits_bump_revisions_of_embedding_tables(cache) -> None:
+    engine = create_engine("sqlite://")
+    Sector.__table__.create(engine)
+    invalidator.bind(cache)
+    await cache.delete(REVISIONS_KEY)
+
+    revisions = TableRevisions(10, 60)
+    invalidator.add_listener(revisions.evict_local)
+    assert (await revisions.get(cache, "sector_industry"))[0] == 0
+
+    db = Session(bind=engine)
+    db.add(Sector(id="0114", sector_group_id="011", name="Wheat"))
+    db.commit()
+    await asyncio.gather(*invalidator._tasks)
+
+    assert await cache.hgetall(REVISIONS_KEY) == {
+        b"sector": b"1",
+        b"sector_group": b"1",
+        b"sector_division": b"1",
+        b"sector_industry": b"1",
+    }
+    assert (await revisions.get(cache, "sector_industry"))[0] == 1
+    invalidator._listeners.remove(revisions.evict_local)
+    invalidator.bind(None)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("batch", [False, True])
+async def test_load_racing_a_commit_is_not_cached(cache, batch) -> None:
+    engine = create_engine("sqlite://")
+    Sector.__table__.create(engine)
+    invalidator.bind(cache)
+    caches.sector.evict_local()
+
+    async def load():
+        # Read before the commit, which evicts before this value is cached
+        stale = SimpleNamespace(id="0115", sector_group_id="011", name="Barley")
+        db = Session(bind=engine)
+        db.add(Sector(id="0115", sector_group_id="011", name="Oats"))
+        db.commit()
+        await asyncio.gather(*invalidator._tasks)
+        return stale
+
+    async def load_many(ids):
+        return [await load()]
+
+    if batch:
+        (r,) = await caches.sector.get_many(cache, ["0115"], load_many)
+    else:
+        r = await caches.sector.get_or_load(cache, "0115", load)
+    assert r.name == "Barley"
+    assert await cache.hget("sector", "0115") is None
+    assert caches.sector.local.get("0115") is None
+
+    async def reload():
+        return SimpleNamespace(id="0115", sector_group_id="011", name="Oats")
+
+    # Without a commit in between the loaded row is kept
+    await caches.sector.get_or_load(cache, "0115", reload)
+    assert (await caches.sector.get_or_load(cache, "0115", load))["name"] == "Oats"
+    await caches.sector.delete(cache, "0115")
+    invalidator.bind(None)
+
+
+def test_mark_records_rows_of_cached_tables_only() -> None:
+    db = Session()
+    invalidator.mark(db, "sector", ["0111", 42])
+    invalidator.mark(db, "alembic_version", ["abc"])
+    assert db.info["cache_evictions"] == {("sector", "0111"), ("sector", "42")}
+    assert db.info["table_writes"] == {"sector", "alembic_version"}
+
+
+@pytest.mark.asyncio
+async def test_lost_subscription_is_renewed_and_local_tiers_cleared(
+    monkeypatch,
+) -> None:
+    monkeypatch.setattr("app.core.cache.RESUBSCRIBE_MIN_DELAY", 0)
+    redis = await fakeredis.aioredis.create_redis_pool()
+    channels = []
+    subscribe = redis.subscribe
+
+    async def recording_subscribe(*names):
+        channels.extend(await subscribe(*names))
+        return channels[-len(names) :]
+
+    monkeypatch.setattr(redis, "subscribe", recording_subscribe)
+    messages = []
+    invalidator.add_listener(messages.append)
+    await invalidator.subscribe(redis)
+    try:
+        # What aioredis does to the channel when the connection drops
+        channels[0].close()
+        for _ in range(20):
+            await asyncio.sleep(0)
+            if messages:
+                break
+        assert messages[0]["reset"] is True
+        assert "sector" in messages[0]["tables"]
+
+        await redis.publish_json(
+            INVALIDATION_CHANNEL,
+            {"rows": [], "tables": [], "hashes": [], "revisions": ["sector"]},
+        )
+        for _ in range(20):
+            await asyncio.sleep(0)
+            if len(messages) > 1:
+                break
+        assert messages[1]["revisions"] == ["sector"]
+    finally:
+        await invalidator.unsubscribe(redis)
+        invalidator._listeners.remove(messages.append)
+        redis.close()
+        await redis.wait_closed()
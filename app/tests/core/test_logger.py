@@ -0,0 +1,160 @@
+import logging
+import sys
+import threading
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.core import logger
+from app.core.logger import (
+    DrainingQueueListener,
+    DroppingQueueHandler,
+    LoggedBody,
+    TimedRoute,
+    start_listener,
+)
+
+
+@pytest.fixture()
+def client():
+    router = APIRouter(route_class=TimedRoute)
+
+    @router.post("/echo")
+    def echo(body: dict):
+        return body
+
+    api = FastAPI()
+    api.include_router(router)
+    return TestClient(api)
+
+
+def test_logged_body_is_redacted_and_truncated(monkeypatch) -> None:
+    monkeypatch.setattr(logger.settings, "LOG_BODY_MAX_BYTES", 40)
+    body = b'{"name": "x", "password": "hunter2", "data": "' + b"A" * 100 + b'"}'
+
+    text = str(LoggedBody(body, "application/json"))
+
+    assert text.startswith('{"name": "x", "password": "***", "da...')
+    assert text.endswith(f"... ({len(body)} bytes)")
+    assert str(LoggedBody(None, "multipart/form-data", "10")).endswith("10 bytes>")
+    assert str(LoggedBody(b"%PDF", "application/pdf")) == "<application/pdf, 4 bytes>"
+
+
+def test_logged_body_keeps_only_what_it_logs(monkeypatch) -> None:
+    monkeypatch.setattr(logger.settings, "LOG_BODY_MAX_BYTES", 40)
+
+    logged = LoggedBody(b'{"data": "' + b"A" * 10**6 + b'"}', "application/json")
+
+    assert len(logged.body) == 40
+    assert str(logged).endswith(f"... ({10**6 + 12} bytes)")
+    assert LoggedBody(b"%PDF" * 1000, "application/pdf").body is None
+
+
+def test_bodies_are_logged_lazily_at_debug(client, mocker) -> None:
+    debug = mocker.patch.object(logger.log, "debug")
+    mocker.patch.object(logger.log, "isEnabledFor", return_value=True)
+
+    r = client.post("/echo", json={"token": "abc"})
+
+    assert float(r.headers["X-Response-Time"]) >= 0
+    (request_args, _), (response_args, _) = debug.call_args_list
+    assert isinstance(request_args[-1], LoggedBody)
+    assert str(request_args[-1]) == '{"token": "***"}'
+    assert str(response_args[-1]) == '{"token":"***"}'
+
+
+@pytest.mark.parametrize("enabled, rate", [(False, 1.0), (True, 0.0)])
+def test_nothing_is_logged_unless_sampled(client, mocker, monkeypatch, enabled, rate):
+    monkeypatch.setattr(logger.settings, "LOG_SAMPLE_RATE", rate)
+    debug = mocker.patch.object(logger.log, "debug")
+    mocker.patch.object(logger.log, "isEnabledFor", return_value=enabled)
+
+    r = client.post("/echo", json={"a": 1})
+
+    assert r.json() == {"a": 1}
+    assert "X-Response-Time" in r.headers
+    debug.assert_not_called()
+
+
+def make_record(msg: str) -> logging.LogRecord:
+    return logging.makeLogRecord(
+        {"msg": msg, "levelno": logging.INFO, "levelname": "INFO"}
+    )
+
+
+@pytest.mark.parametrize("drop_oldest, kept", [(False, ["a", "b"]), (True, ["b", "c"])])
+def test_full_queue_drops_records(drop_oldest, kept) -> None:
+    handler = DroppingQueueHandler(2, drop_oldest=drop_oldest)
+    for msg in "abc":
+        handler.handle(make_record(msg))
+
+    assert [handler.queue.get_nowait().msg for _ in range(2)] == kept
+    assert handler.dropped == {"INFO": 1}
+
+
+def test_listener_stops_with_a_full_queue() -> None:
+    busy, release = threading.Event(), threading.Event()
+
+    class Blocking(logging.Handler):
+        def emit(self, record):
+            busy.set()
+            release.wait()
+            emitted.append(record.msg)
+
+    emitted = []
+    handler = DroppingQueueHandler(2)
+    listener = DrainingQueueListener(handler, Blocking(), timeout=0.05)
+    listener.start()
+    handler.handle(make_record("a"))
+    assert busy.wait(5)
+    for msg in "bc":
+        handler.handle(make_record(msg))
+    labels = {"level": "INFO"}
+    dropped = REGISTRY.get_sample_value("log_records_dropped_total", labels) or 0
+
+    threading.Timer(0.2, release.set).start()
+    listener.stop()
+
+    assert emitted == ["a", "c"]
+    assert handler.dropped == {"INFO": 1}
+    assert REGISTRY.get_sample_value("log_records_dropped_total", labels) == dropped + 1
+
+
+def test_bodies_are_formatted_on_the_listener_thread() -> None:
+    class Capture(logging.Handler):
+        def emit(self, record):
+            emitted.append((threading.get_ident(), self.format(record)))
+
+    emitted = []
+    handler = DroppingQueueHandler(10)
+    listener = start_listener(handler, Capture())
+    test_log = logging.getLogger("test_queue_logging")
+    test_log.propagate = False
+    test_log.addHandler(handler)
+
+    test_log.warning("body: %s", LoggedBody(b'{"a": 1}'))
+    listener.stop()
+
+    [(thread, message)] = emitted
+    assert thread != threading.get_ident()
+    assert message == 'body: {"a": 1}'
+
+
+def test_other_records_are_rendered_before_queueing() -> None:
+    handler = DroppingQueueHandler(10)
+    args = {"state": "before"}
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        record = logging.getLogger("test").makeRecord(
+            "test", logging.ERROR, __file__, 1, "state: %s", (args,), sys.exc_info()
+        )
+    handler.handle(record)
+    args["state"] = "after"
+
+    queued = handler.queue.get_nowait()
+    assert queued.args is None and queued.exc_info is None
+    assert queued.getMessage().startswith("state: {'state': 'before'}")
+    assert "ZeroDivisionError" in queued.getMessage()
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.core import metrics
+from app.core.logger import TimedRoute
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_route_latency_by_template() -> None:
+    router = APIRouter(route_class=TimedRoute)
+
+    @router.get("/items/{id}")
+    def get_item(id: int):
+        if id == 0:
+            raise HTTPException(status_code=404, detail="Not found")
+        return {"id": id}
+
+    api = FastAPI()
+    api.include_router(router, prefix="/v1")
+    client = TestClient(api)
+    labels = dict(method="GET", route="/v1/items/{id}")
+    before = sample("http_request_duration_seconds_count", status="200", **labels)
+
+    client.get("/v1/items/1")
+    client.get("/v1/items/2")
+    client.get("/v1/items/0")
+    client.get("/v1/items/x")
+
+    assert (
+        sample("http_request_duration_seconds_count", status="200", **labels)
+        == before + 2
+    )
+    assert sample("http_request_duration_seconds_count", status="404", **labels) >= 1
+    # Invalid parameters are answered with 422, not counted as errors
+    assert sample("http_request_duration_seconds_count", status="422", **labels) >= 1
+    assert sample("http_requests_in_progress", **labels) == 0
+
+
+def test_metrics_are_summed_over_processes(tmp_path, monkeypatch) -> None:
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    code = "from app.core.metrics import UPLOAD_BYTES; UPLOAD_BYTES.labels('x').inc(5)"
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "MULTIPROCESS", True)
+
+    body = metrics.metrics_response().body.decode()
+
+    assert 'upload_bytes_total{kind="x"} 10.0' in body
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.core.sector_tree import LEVELS, SectorLevel, SectorTree
+
+industry = (SectorLevel.industry, "A")
+division = (SectorLevel.division, "01")
+group = (SectorLevel.group, "011")
+sector = (SectorLevel.sector, "0111")
+
+
+def build() -> SectorTree:
+    tree = SectorTree()
+    tree._put(industry, {"id": "A", "name": "Agriculture"})
+    tree._put(division, {"id": "01", "sector_industry_id": "A", "name": "Crops"})
+    tree._put(group, {"id": "011", "sector_division_id": "01", "name": "Cereals"})
+    tree._put(sector, {"id": "0111", "sector_group_id": "011", "name": "Wheat"})
+    tree._put((SectorLevel.industry, "B"), {"id": "B", "name": "Mining"})
+    return tree
+
+
+def test_encodes_tree_and_subtrees() -> None:
+    tree = build()
+    body, etag = tree.encoded()
+    data = json.loads(body)["data"]
+    assert [i["id"] for i in data] == ["A", "B"]
+    assert data[0]["divisions"][0]["groups"][0]["sectors"] == [
+        {"id": "0111", "sector_group_id": "011", "name": "Wheat"}
+    ]
+    assert tree.encoded() == (body, etag)
+
+    body, _ = tree.encoded(group)
+    assert json.loads(body)["data"]["sectors"][0]["name"] == "Wheat"
+    assert tree.encoded((SectorLevel.group, "999")) is None
+
+
+def test_changes_drop_only_ancestor_encodings() -> None:
+    tree = build()
+    _, tree_etag = tree.encoded()
+    _, mining_etag = tree.encoded((SectorLevel.industry, "B"))
+    tree.encoded(sector)
+
+    tree.mark_stale({"rows": [["sector", "0111"], ["country", "UG"]]})
+    assert tree.stale == {sector}
+
+    tree._put(sector, {"id": "0111", "sector_group_id": "011", "name": "Durum"})
+    assert set(tree._encoded) == {(SectorLevel.industry, "B")}
+    assert tree.encoded()[1] != tree_etag
+    assert tree.encoded((SectorLevel.industry, "B"))[1] == mining_etag
+
+    tree._put(group, None)
+    assert tree.encoded(group) is None
+    assert json.loads(tree.encoded(division)[0])["data"]["groups"] == []
+
+
+@pytest.mark.asyncio
+async def test_table_replaced_during_a_reload_is_reloaded_again(mocker) -> None:
+    tree = SectorTree()
+    loads = []
+
+    async def load(db, level, ids=None):
+        loads.append(level)
+        if len(loads) == 1:
+            tree.mark_stale({"rows": [], "tables": ["sector"]})
+
+    mocker.patch.object(tree, "_load", load)
+    await tree.refresh(None)
+    assert not tree.loaded
+
+    await tree.refresh(None)
+    assert tree.loaded
+    assert len(loads) == 2 * len(LEVELS)
+
+
+@pytest.mark.asyncio
+async def test_tree_is_reloaded_after_its_max_age(mocker, monkeypatch) -> None:
+    tree = SectorTree()
+    load = mocker.patch.object(tree, "_load")
+    await tree.refresh(None)
+    await tree.refresh(None)
+    assert load.call_count == len(LEVELS)
+
+    monkeypatch.setattr(settings, "SECTOR_TREE_MAX_AGE", 0)
+    assert not tree.loaded
+    await tree.refresh(None)
+    assert load.call_count == 2 * len(LEVELS)
@@ -0,0 +1,65 @@
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanContext, Status, StatusCode, TraceFlags
+
+from app.core import tracing
+
+
+@pytest.fixture()
+def exporter():
+    return InMemorySpanExporter()
+
+
+def make_tracer(exporter, monkeypatch, rate: float, tail: bool = False):
+    monkeypatch.setattr(tracing.settings, "TRACE_SAMPLE_RATE", rate)
+    monkeypatch.setattr(tracing.settings, "TRACE_TAIL_SAMPLING", tail)
+    provider = tracing.create_tracer_provider(exporter, batch=False)
+    return provider.get_tracer(__name__)
+
+
+@pytest.mark.parametrize("rate, exported", [(0.0, 0), (1.0, 2)])
+def test_ratio_sampling(exporter, monkeypatch, rate, exported) -> None:
+    tracer = make_tracer(exporter, monkeypatch, rate)
+    with tracer.start_as_current_span("request"):
+        with tracer.start_as_current_span("query"):
+            pass
+
+    assert len(exporter.get_finished_spans()) == exported
+
+
+def test_remote_parent_decision_is_followed(exporter, monkeypatch) -> None:
+    tracer = make_tracer(exporter, monkeypatch, 0.0)
+    parent = SpanContext(
+        1, 2, is_remote=True, trace_flags=TraceFlags(TraceFlags.SAMPLED)
+    )
+
+    with tracer.start_as_current_span(
+        "request", context=trace.set_span_in_context(trace.NonRecordingSpan(parent))
+    ):
+        pass
+
+    assert [s.name for s in exporter.get_finished_spans()] == ["request"]
+
+
+def test_tail_sampling_keeps_failed_traces(exporter, monkeypatch) -> None:
+    tracer = make_tracer(exporter, monkeypatch, 0.0, tail=True)
+    with tracer.start_as_current_span("fine"):
+        with tracer.start_as_current_span("query"):
+            pass
+    with tracer.start_as_current_span("failed"):
+        with tracer.start_as_current_span("query") as span:
+            span.set_status(Status(StatusCode.ERROR))
+
+    spans = exporter.get_finished_spans()
+    assert [s.name for s in spans] == ["query", "failed"]
+    assert all(s.context.trace_flags.sampled for s in spans)
+
+
+def test_tail_sampling_keeps_slow_traces(exporter, monkeypatch) -> None:
+    monkeypatch.setattr(tracing.settings, "TRACE_SLOW_SECONDS", 0.0)
+    tracer = make_tracer(exporter, monkeypatch, 0.0, tail=True)
+    with tracer.start_as_current_span("slow"):
+        pass
+
+    assert [s.name for s in exporter.get_finished_spans()] == ["slow"]
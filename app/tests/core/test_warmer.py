@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import delete
+
+from app import crud
+from app.core import cache as caches
+from app.core.warmer import warm_model
+from app.models import SectorIndustry
+
+
+@pytest.fixture()
+async def industries(async_db, cache, monkeypatch):
+    monkeypatch.setattr("app.core.warmer.settings.CACHE_WARM_BATCH_SIZE", 2)
+    ids = [f"zz-warm-{i:02d}" for i in range(5)]
+    async_db.add_all(SectorIndustry(id=id, name=id) for id in ids)
+    await async_db.commit()
+    await cache.delete("sector_industry")
+    caches.sector_industry.evict_local()
+    yield ids
+    await async_db.execute(delete(SectorIndustry).filter(SectorIndustry.id.in_(ids)))
+    await async_db.commit()
+    await cache.delete("sector_industry")
+
+
+@pytest.mark.asyncio
+async def test_warm_model_fills_the_hash_batch_by_batch(
+    cache, industries, mocker
+) -> None:
+    fill = mocker.spy(caches.sector_industry, "fill")
+
+    count = await warm_model(cache, caches.sector_industry, crud.sector_industry)
+
+    assert count >= len(industries)
+    assert fill.call_count == (count + 1) // 2
+    cached = await cache.hmget("sector_industry", *industries)
+    assert all(r is not None for r in cached)
+
+
+@pytest.mark.asyncio
+async def test_warm_model_stops_at_a_concurrent_write(
+    cache, industries, monkeypatch
+) -> None:
+    fill = caches.sector_industry.fill
+
+    async def fill_after_a_commit(*args, **kwargs):
+        await cache.hincrby(caches.REVISIONS_KEY, "sector_industry")
+        return await fill(*args, **kwargs)
+
+    monkeypatch.setattr(caches.sector_industry, "fill", fill_after_a_commit)
+
+    count = await warm_model(cache, caches.sector_industry, crud.sector_industry)
+
+    assert count == 0
+    assert await cache.hgetall("sector_industry") == {}
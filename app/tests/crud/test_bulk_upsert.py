@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import delete, select
+
+from app import crud
+from app.models import Sector
+from app.schemas import SectorCreate
+
+
+@pytest.fixture()
+async def sectors(async_db):
+    ids = ["zz-bulk-1", "zz-bulk-2", "zz-bulk-3", "zz-bulk-4"]
+    yield ids
+    await async_db.execute(delete(Sector).filter(Sector.id.in_(ids)))
+    await async_db.commit()
+
+
+async def names(db, ids):
+    result = await db.execute(
+        select(Sector.id, Sector.name).filter(Sector.id.in_(ids)).order_by(Sector.id)
+    )
+    return dict(result.all())
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_reports_created_and_updated_rows(async_db, sectors) -> None:
+    await crud.sector.bulk_upsert(
+        async_db, objs_in=[SectorCreate(id="zz-bulk-1", name="One")]
+    )
+
+    statuses = await crud.sector.bulk_upsert(
+        async_db,
+        objs_in=[
+            SectorCreate(id="zz-bulk-1", name="Uno"),
+            SectorCreate(id="zz-bulk-2", name="Two"),
+            SectorCreate(id="zz-bulk-3", name="Three"),
+        ],
+        chunk_size=2,
+    )
+
+    assert statuses == [
+        {"id": "zz-bulk-1", "status": "updated"},
+        {"id": "zz-bulk-2", "status": "created"},
+        {"id": "zz-bulk-3", "status": "created"},
+    ]
+    assert await names(async_db, sectors) == {
+        "zz-bulk-1": "Uno",
+        "zz-bulk-2": "Two",
+        "zz-bulk-3": "Three",
+    }
+
+
+@pytest.mark.asyncio
+async def test_bad_row_fails_alone_in_its_chunk(async_db, sectors) -> None:
+    statuses = await crud.sector.bulk_upsert(
+        async_db,
+        objs_in=[
+            SectorCreate(id="zz-bulk-1", name="One"),
+            SectorCreate(id="zz-bulk-2", sector_group_id="zz-missing", name="Two"),
+            SectorCreate(id="zz-bulk-3", name="Three"),
+            SectorCreate(id="zz-bulk-4", name="Four"),
+        ],
+        chunk_size=3,
+    )
+
+    assert [s["status"] for s in statuses] == [
+        "created",
+        "failed",
+        "created",
+        "created",
+    ]
+    assert statuses[1]["id"] == "zz-bulk-2"
+    assert "foreign key" in statuses[1]["message"]
+    assert await names(async_db, sectors) == {
+        "zz-bulk-1": "One",
+        "zz-bulk-3": "Three",
+        "zz-bulk-4": "Four",
+    }
@@ -0,0 +1,41 @@
+import uuid
+
+import pytest
+from sqlalchemy import delete
+
+from app import crud, schemas
+from app.models import Country, CountryDocument
+
+CHECKSUM = "a" * 64
+
+
+@pytest.fixture()
+async def document(async_db):
+    async_db.add(Country(id="ZZ", name="Test"))
+    await async_db.commit()
+    document = CountryDocument(
+        id=uuid.uuid4(), country_id="ZZ", name="Report", checksum=CHECKSUM
+    )
+    async_db.add(document)
+    await async_db.commit()
+    yield document
+    await async_db.execute(delete(Country).filter(Country.id == "ZZ"))
+    await async_db.commit()
+
+
+def test_checksum_is_not_writable() -> None:
+    body = {"name": "Renamed", "checksum": "b" * 64}
+    assert "checksum" not in schemas.CountryDocumentCreate(**body).dict()
+    assert "checksum" not in schemas.CountryDocumentUpdate(**body).dict()
+    assert "checksum" in schemas.CountryDocument.__fields__
+
+
+@pytest.mark.asyncio
+async def test_update_keeps_the_checksum(async_db, document) -> None:
+    # The body of PUT /country-document/{id}
+    obj_in = schemas.CountryDocumentUpdate(name="Renamed", checksum="b" * 64)
+    updated = await crud.country_document.update(
+        async_db, db_obj=document, obj_in=obj_in
+    )
+    assert updated.name == "Renamed"
+    assert updated.checksum == CHECKSUM
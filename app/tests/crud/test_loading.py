@@ -0,0 +1,18 @@
+from app import models, schemas
+from app.crud.base import loader_options, schema_load_paths
+
+
+def test_schema_load_paths_follow_nested_schemas() -> None:
+    assert schema_load_paths(models.SectorIndustry, schemas.SectorIndustry) == [
+        "divisions.groups.sectors"
+    ]
+    assert schema_load_paths(models.Region, schemas.Region) == ["subregions"]
+    assert schema_load_paths(models.Sector, schemas.Sector) == []
+
+
+def test_loader_options() -> None:
+    assert loader_options(models.Sector, ()) == ()
+    assert len(loader_options(models.SectorIndustry, ["divisions.groups"])) == 1
+    assert loader_options(models.Region, schemas.Region) is loader_options(
+        models.Region, schemas.Region
+    )
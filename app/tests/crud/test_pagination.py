@@ -0,0 +1,75 @@
+import uuid
+
+import pytest
+from sqlalchemy import delete
+
+from app import crud
+from app.crud.base import decode_cursor, encode_cursor
+from app.models import SectorIndustry
+
+
+@pytest.mark.parametrize("id", ["UG", 42, uuid.uuid4()])
+def test_cursor_round_trip(id) -> None:
+    cursor = encode_cursor(id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == str(id)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor("x")[:-2], "MQ"])
+def test_malformed_cursor_is_rejected(cursor) -> None:
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_cursor_key_has_the_type_of_the_primary_key() -> None:
+    region_id = uuid.uuid4()
+    assert crud.region.cursor_key(encode_cursor(region_id)) == region_id
+    assert crud.country_contact.cursor_key(encode_cursor(42)) == 42
+    assert crud.country.cursor_key(encode_cursor("UG")) == "UG"
+
+
+@pytest.mark.parametrize("model_crud", [crud.region, crud.country_contact])
+def test_cursor_of_another_key_type_is_rejected(model_crud) -> None:
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        model_crud.cursor_key(encode_cursor("UG"))
+
+
+@pytest.fixture()
+async def industries(async_db):
+    ids = [f"zz-page-{i:02d}" for i in range(5)]
+    async_db.add_all(SectorIndustry(id=id, name=id) for id in ids)
+    await async_db.commit()
+    yield ids
+    await async_db.execute(delete(SectorIndustry).filter(SectorIndustry.id.in_(ids)))
+    await async_db.commit()
+
+
+@pytest.mark.asyncio
+async def test_get_page_walks_the_table_in_key_order(async_db, industries) -> None:
+    seen, cursor = [], None
+    while True:
+        rows, cursor = await crud.sector_industry.get_page(
+            async_db, cursor=cursor, limit=2
+        )
+        assert len(rows) <= 2
+        seen += [row.id for row in rows]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen))
+    assert [id for id in seen if id in industries] == industries
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_every_row_in_batches(async_db, industries) -> None:
+    pages, cursor = [], None
+    while True:
+        rows, cursor = await crud.sector_industry.get_page(async_db, cursor=cursor)
+        pages += [row.id for row in rows]
+        if cursor is None:
+            break
+
+    batches = [
+        rows async for rows in crud.sector_industry.stream(async_db, batch_size=2)
+    ]
+    assert all(0 < len(rows) <= 2 for rows in batches)
+    assert [row.id for rows in batches for row in rows] == pages
@@ -0,0 +1,77 @@
+import io
+import os
+import time
+
+from app.db import blobs
+from app.db.session import SessionLocal
+from app.utils import blob_key, save_blob
+
+PDF = b"%PDF-1.4\n" + b"x" * 100
+
+
+def test_collect_blobs_keeps_referenced_and_recent(
+    tmp_path, monkeypatch, mocker
+) -> None:
+    monkeypatch.setattr("app.utils.settings.UPLOADED_FILES_DEST", str(tmp_path))
+    kept = save_blob(io.BytesIO(PDF))
+    orphan = tmp_path / save_blob(io.BytesIO(PDF + b"1"))["key"]
+    recent = tmp_path / save_blob(io.BytesIO(PDF + b"2"))["key"]
+    temp = tmp_path / "tmp" / ".upload-x"
+    temp.write_bytes(b"")
+    old = time.time() - 3600
+    for path in (tmp_path / kept["key"], orphan, temp):
+        os.utime(path, (old, old))
+
+    db = mocker.Mock()
+    db.execute.return_value.all.return_value = [(kept["checksum"], 2)]
+
+    stats = blobs.collect_blobs(db, grace=60)
+
+    assert stats["removed"] == 2
+    assert (tmp_path / kept["key"]).exists() and recent.exists()
+    assert not orphan.exists() and not temp.exists()
+
+
+def test_migrate_documents(tmp_path, monkeypatch, mocker) -> None:
+    monkeypatch.setattr("app.utils.settings.UPLOADED_FILES_DEST", str(tmp_path))
+    document = mocker.Mock(id="a1", checksum=None)
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "a1").write_bytes(PDF)
+    db = mocker.Mock()
+    db.execute.return_value.scalars.return_value.all.return_value = [document]
+
+    assert blobs.migrate_documents(db) == {"migrated": 1, "deduplicated": 0}
+    assert (tmp_path / blob_key(document.checksum)).read_bytes() == PDF
+    assert not (tmp_path / "a" / "a1").exists()
+
+
+def old_blob(tmp_path, data: bytes) -> dict:
+    saved = save_blob(io.BytesIO(data))
+    old = time.time() - 3600
+    os.utime(tmp_path / saved["key"], (old, old))
+    return saved
+
+
+def test_blob_referenced_after_the_batch_query_is_kept(
+    tmp_path, monkeypatch, mocker
+) -> None:
+    monkeypatch.setattr("app.utils.settings.UPLOADED_FILES_DEST", str(tmp_path))
+    saved = old_blob(tmp_path, PDF)
+    db = mocker.Mock()
+    # Unreferenced for the batch, referenced when checked under the lock
+    db.execute.return_value.all.side_effect = [[], [(saved["checksum"], 1)]]
+
+    assert blobs.collect_blobs(db, grace=60)["removed"] == 0
+    assert (tmp_path / saved["key"]).exists()
+
+
+def test_blob_locked_by_an_upload_is_kept(tmp_path, monkeypatch, db) -> None:
+    monkeypatch.setattr("app.utils.settings.UPLOADED_FILES_DEST", str(tmp_path))
+    saved = old_blob(tmp_path, PDF + b"locked")
+    upload = SessionLocal()
+    upload.execute(blobs.lock_blob(saved["checksum"]))
+
+    assert blobs.collect_blobs(db, grace=60)["removed"] == 0
+    upload.rollback()
+    assert blobs.collect_blobs(db, grace=60)["removed"] == 1
+    assert not (tmp_path / saved["key"]).exists()
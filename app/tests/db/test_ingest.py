@@ -0,0 +1,60 @@
+import gzip
+import io
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.db.ingest import _decompressed, ingest_csv
+from app.models import Country
+
+CSV = b"id,name,calling_code\nUG,Uganda,256\n"
+
+
+@pytest.mark.parametrize("data", [CSV, gzip.compress(CSV)])
+def test_plain_and_gzipped_files_read_the_same(data) -> None:
+    assert _decompressed(io.BytesIO(data)).read() == CSV
+
+
+@pytest.mark.parametrize(
+    "table, data, message",
+    [
+        ("bank", CSV, "Cannot ingest into bank"),
+        ("country", b"", "no header"),
+        ("country", b"id,swift_code\n", "Unknown columns for country: swift_code"),
+    ],
+)
+def test_rejects_unknown_tables_and_columns(table, data, message) -> None:
+    with pytest.raises(ValueError, match=message):
+        ingest_csv(None, table, io.BytesIO(data))
+
+
+@pytest.fixture()
+def countries(db):
+    db.execute(delete(Country).filter(Country.id.in_(["ZW", "ZX", "ZY"])))
+    db.add_all(
+        [Country(id="ZX", name="Xland"), Country(id="ZY", name="Yland (edited)")]
+    )
+    db.commit()
+    yield
+    db.execute(delete(Country).filter(Country.id.in_(["ZW", "ZX", "ZY"])))
+    db.commit()
+
+
+def test_only_rows_changed_since_the_previous_file_are_updated(db, countries) -> None:
+    previous = b"id,name\nZX,Xland\nZY,Yland\n"
+    changed = b"id,name\nZX,Republic of Xland\nZY,Yland\nZW,Wland\n"
+
+    stats = ingest_csv(
+        db, "country", io.BytesIO(changed), previous=io.BytesIO(gzip.compress(previous))
+    )
+
+    names = dict(
+        db.execute(select(Country.id, Country.name).filter(Country.id.like("Z_"))).all()
+    )
+    assert {id: names[id] for id in ("ZW", "ZX", "ZY")} == {
+        "ZW": "Wland",
+        "ZX": "Republic of Xland",
+        # Edited through the API and unchanged in the file
+        "ZY": "Yland (edited)",
+    }
+    assert stats["merged"] == 2
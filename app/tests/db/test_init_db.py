@@ -0,0 +1,68 @@
+import gzip
+import hashlib
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.db import init_db as seeding
+from app.models import Country, SeedFile
+
+
+def test_seed_files_in_foreign_key_order(tmp_path) -> None:
+    (tmp_path / "country.csv").write_bytes(b"id,name\n")
+    (tmp_path / "region.csv.gz").write_bytes(gzip.compress(b"id\n"))
+    (tmp_path / "notes.csv").write_bytes(b"x\n")
+
+    assert [t for t, _ in seeding.seed_files(str(tmp_path))] == ["region", "country"]
+
+
+def test_only_changed_seed_files_are_loaded(tmp_path, monkeypatch, mocker) -> None:
+    (tmp_path / "csv").mkdir()
+    (tmp_path / "csv" / "country.csv").write_bytes(b"id,name\nUG,Uganda\n")
+    (tmp_path / "csv" / "region.csv").write_bytes(b"id\nAfrica\n")
+    monkeypatch.chdir(tmp_path)
+    unchanged = hashlib.sha256(b"id\nAfrica\n").hexdigest()
+
+    db = mocker.Mock()
+    loaded = mocker.Mock()
+    loaded.all.return_value = [("region.csv", unchanged)]
+    db.execute.side_effect = [None, loaded, None]
+    db.scalar.return_value = None
+    ingest = mocker.patch.object(seeding, "ingest_csv")
+
+    seeding.init_db(db)
+
+    ingest.assert_called_once_with(
+        db, "country", mocker.ANY, update=False, previous=None, commit=False
+    )
+    assert ingest.call_args.args[2].read() == b"id,name\nUG,Uganda\n"
+    db.commit.assert_called_once_with()
+
+
+@pytest.fixture()
+def seed_dir(db, tmp_path, monkeypatch):
+    (tmp_path / "csv").mkdir()
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path / "csv" / "country.csv"
+    db.execute(delete(SeedFile).filter(SeedFile.name == "country.csv"))
+    db.execute(delete(Country).filter(Country.id.in_(["ZX", "ZY"])))
+    db.commit()
+
+
+def test_changed_seed_rows_are_upserted(db, seed_dir) -> None:
+    seed_dir.write_bytes(b"id,name\nZX,Xland\nZY,Yland\n")
+    seeding.init_db(db)
+    db.execute(update(Country).filter(Country.id == "ZY").values(name="Edited"))
+    db.commit()
+
+    seed_dir.write_bytes(b"id,name\nZX,Republic of Xland\nZY,Yland\n")
+    seeding.init_db(db)
+
+    names = db.execute(
+        select(Country.id, Country.name).filter(Country.id.in_(["ZX", "ZY"]))
+    ).all()
+    assert dict(names) == {"ZX": "Republic of Xland", "ZY": "Edited"}
+    contents = db.scalar(
+        select(SeedFile.contents).filter(SeedFile.name == "country.csv")
+    )
+    assert gzip.decompress(contents) == seed_dir.read_bytes()
@@ -0,0 +1,47 @@
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from app.db.pool import instrument_pool
+
+
+def test_pool_metrics_count_checkouts_and_exhaustion() -> None:
+    engine = create_engine(
+        "sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=0
+    )
+    metrics = instrument_pool("test", engine)
+
+    conn = engine.connect()
+    status = metrics.status()
+    assert status["connects"] == 1
+    assert status["checkouts"] == 1
+    assert status["checked_out"] == 1
+    assert status["exhausted"] == 1
+
+    conn.close()
+    status = metrics.status()
+    assert status["checkins"] == 1
+    assert status["checked_out"] == 0
+    assert status["held_seconds"] >= 0
+
+
+def test_pool_metrics_time_checkout_wait() -> None:
+    engine = create_engine(
+        "sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=0
+    )
+    metrics = instrument_pool("test", engine)
+
+    conn = engine.connect()
+    release = threading.Timer(0.2, conn.close)
+    release.start()
+    # Blocks until the timer returns the only connection to the pool.
+    engine.connect().close()
+    release.join()
+    assert metrics.status()["wait_seconds"] >= 0.15
+
+    # A disposed engine gets a new pool, which is timed as well.
+    engine.dispose()
+    waited = metrics.status()["wait_seconds"]
+    engine.connect().close()
+    assert metrics.status()["wait_seconds"] > waited
@@ -14,10 +14,20 @@ class RedisCache:
             await self.init_cache()
         return await self.redis_cache.keys(pattern)
 
-    async def set(self, key, value):
+    async def set(self, key, value, expire=0):
         if not self.redis_cache:
             await self.init_cache()
-        return await self.redis_cache.set(key, value)
+        return await self.redis_cache.set(key, value, expire=expire)
+
+    async def delete(self, key, *keys):
+        if not self.redis_cache:
+            await self.init_cache()
+        return await self.redis_cache.delete(key, *keys)
+
+    async def expire(self, key, timeout):
+        if not self.redis_cache:
+            await self.init_cache()
+        return await self.redis_cache.expire(key, timeout)
 
     async def get(self, key):
         if not self.redis_cache:
@@ -31,6 +41,19 @@ class RedisCache:
 
         return r
 
+    async def hmget(self, key, field, *fields):
+        if not self.redis_cache:
+            await self.init_cache()
+        return await self.redis_cache.hmget(key, field, *fields)
+
+    async def mget(self, key, *keys):
+        if not self.redis_cache:
+            await self.init_cache()
+        return await self.redis_cache.mget(key, *keys)
+
+    def pipeline(self):
+        return self.redis_cache.pipeline()
+
     async def hgetall(self, key):
         if not self.redis_cache:
             await self.init_cache()
@@ -42,11 +65,21 @@ class RedisCache:
         r = await self.redis_cache.hset(key, idx, val)
         return r
 
+    async def hincrby(self, key, field, increment=1):
+        if not self.redis_cache:
+            await self.init_cache()
+        return await self.redis_cache.hincrby(key, field, increment)
+
     async def hdel(self, key, idx):
         if not self.redis_cache:
             await self.init_cache()
         return await self.redis_cache.hdel(key, idx)
 
+    async def publish(self, channel, message):
+        if not self.redis_cache:
+            await self.init_cache()
+        return await self.redis_cache.publish(channel, message)
+
     async def close(self):
         self.redis_cache.close()
         await self.redis_cache.wait_closed()
@@ -0,0 +1,77 @@
+import asyncio
+import io
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from app.storage import LocalStorage, S3Storage
+
+moto = pytest.importorskip("moto")
+
+DATA = b"%PDF-1.4\n" + bytes(range(256)) * 10
+
+
+@pytest.fixture(params=["local", "s3"])
+def storage(request, tmp_path, monkeypatch):
+    if request.param == "local":
+        yield LocalStorage(str(tmp_path))
+        return
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_s3():
+        s3 = S3Storage("documents", region="us-east-1")
+        s3.client.create_bucket(Bucket="documents")
+        yield s3
+
+
+def test_save_and_read(storage) -> None:
+    storage.save("a/abc", io.BytesIO(DATA))
+
+    assert storage.exists("a/abc") and not storage.exists("a/abd")
+    assert storage.stat("a/abc")[0] == len(DATA)
+    with storage.open("a/abc", 100) as f:
+        assert f.read() == DATA[100:]
+
+
+def test_iter_bytes(storage) -> None:
+    storage.save("a/abc", io.BytesIO(DATA))
+
+    async def read(*args):
+        return b"".join([chunk async for chunk in storage.iter_bytes(*args)])
+
+    assert asyncio.run(read("a/abc")) == DATA
+    assert asyncio.run(read("a/abc", 10, 20)) == DATA[10:30]
+
+
+def test_move_list_and_delete(storage, tmp_path) -> None:
+    src = tmp_path / "upload"
+    src.write_bytes(DATA)
+    storage.move("blobs/ab/cd/abcd", str(src))
+    started = time.time()
+    storage.touch("blobs/ab/cd/abcd")
+
+    assert not src.exists()
+    [(key, (size, mtime))] = storage.list("blobs/")
+    assert (key, size) == ("blobs/ab/cd/abcd", len(DATA))
+    assert mtime >= int(started)
+
+    storage.delete("blobs/ab/cd/abcd")
+    assert list(storage.list("blobs/")) == []
+
+
+def test_presigned_url(storage) -> None:
+    storage.save("a/abc", io.BytesIO(DATA))
+
+    url = storage.url("a/abc", filename="Report.pdf", media_type="application/pdf")
+    if isinstance(storage, LocalStorage):
+        assert url is None
+        return
+    assert requests.get(url).content == DATA
+    # Signed into the URL, for S3 to send back as response headers
+    params = parse_qs(urlsplit(url).query)
+    assert params["response-content-type"] == ["application/pdf"]
+    assert params["response-content-disposition"] == [
+        "attachment; filename*=utf-8''Report.pdf"
+    ]
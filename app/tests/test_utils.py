@@ -0,0 +1,121 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from app.utils import (
+    Base64Reader,
+    FileTooLarge,
+    b64decode,
+    blob_key,
+    save_blob,
+    save_stream,
+    uploadPhoto,
+)
+
+PDF = b"%PDF-1.4\n" + b"x" * 1000
+
+
+@pytest.fixture()
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.utils.settings.UPLOADED_FILES_DEST", str(tmp_path))
+    return tmp_path
+
+
+def test_save_stream_writes_in_chunks(upload_dir) -> None:
+    r = save_stream(io.BytesIO(PDF), "abc", magic=b"%PDF", chunk_size=64)
+    assert r["size"] == len(PDF)
+    assert r["checksum"] == hashlib.sha256(PDF).hexdigest()
+    assert (upload_dir / "a" / "abc").read_bytes() == PDF
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [(b"GIF89a", ValueError), (b"", ValueError), (PDF * 2, FileTooLarge)],
+)
+def test_save_stream_leaves_nothing_behind_on_error(upload_dir, data, error) -> None:
+    with pytest.raises(error):
+        save_stream(io.BytesIO(data), "abc", magic=b"%PDF", max_size=1500)
+    assert os.listdir(upload_dir / "tmp") == []
+    assert not (upload_dir / "a").exists()
+
+
+def test_base64_reader_decodes_incrementally(upload_dir) -> None:
+    encoded = base64.b64encode(PDF).decode()
+    reader = Base64Reader(encoded)
+    assert b"".join(iter(lambda: reader.read(7), b"")) == PDF
+
+    r = save_stream(Base64Reader(encoded), "b64", magic=b"%PDF", chunk_size=100)
+    assert r["checksum"] == hashlib.sha256(PDF).hexdigest()
+
+    with pytest.raises(binascii.Error):
+        Base64Reader("JVBE!!!!").read(100)
+
+
+def test_base64_reader_fills_small_buffers() -> None:
+    reader = Base64Reader(base64.b64encode(PDF).decode())
+    assert reader.read(1) == PDF[:1]
+    assert reader.read(2) == PDF[1:3]
+    buffer = bytearray(1)
+    assert reader.readinto(memoryview(buffer)) == 1
+    assert bytes(buffer) == PDF[3:4]
+    assert reader.read() == PDF[4:]
+
+
+@pytest.mark.parametrize("value", ["JVBERg==", b"JVBERg==", "JVBERi0="])
+def test_base64_validation(value) -> None:
+    assert b64decode(value) == base64.b64decode(value)
+
+
+@pytest.mark.parametrize("value", ["JVBERg=", "JVB!Rg==", "JVBERg==é", None])
+def test_invalid_base64(value) -> None:
+    assert b64decode(value) is None
+
+
+@pytest.mark.parametrize("value", ["JVBERh==", "JVBERi1="])
+def test_non_canonical_base64_is_not_valid(value) -> None:
+    # base64.b64decode ignores the nonzero bits before the padding
+    assert base64.b64decode(value)
+    assert b64decode(value) is None
+    with pytest.raises(binascii.Error):
+        Base64Reader(value).read()
+
+
+def test_upload_photo_writes_renditions(upload_dir, monkeypatch) -> None:
+    monkeypatch.setattr("app.utils.settings.IMAGE_RENDITION_SIZES", [100])
+    os.makedirs(upload_dir / "p")
+    image = Image.new("RGB", (600, 300))
+    image.paste((200, 0, 0), (100, 50, 500, 250))
+
+    assert uploadPhoto(image, "photo") == ["photo_thumb", "photo_100"]
+    assert Image.open(upload_dir / "p" / "photo").size == (400, 200)
+    assert Image.open(upload_dir / "p" / "photo_thumb").size == (400, 200)
+    assert Image.open(upload_dir / "p" / "photo_100").size == (100, 50)
+
+
+def test_upload_photo_uses_configured_format(upload_dir, monkeypatch) -> None:
+    monkeypatch.setattr("app.utils.settings.IMAGE_RENDITION_SIZES", [])
+    monkeypatch.setattr("app.utils.settings.IMAGE_FORMAT", "WEBP")
+    os.makedirs(upload_dir / "p")
+    image = Image.new("RGB", (50, 50))
+    image.paste((0, 0, 200), (10, 10, 20, 30))
+
+    uploadPhoto(image, "photo")
+    with Image.open(upload_dir / "p" / "photo") as saved:
+        assert (saved.format, saved.size) == ("WEBP", (10, 20))
+
+
+def test_save_blob_stores_content_once(upload_dir) -> None:
+    first = save_blob(io.BytesIO(PDF), magic=b"%PDF")
+    second = save_blob(io.BytesIO(PDF), magic=b"%PDF")
+
+    checksum = hashlib.sha256(PDF).hexdigest()
+    assert first["key"] == second["key"] == blob_key(checksum)
+    assert first["key"] == f"blobs/{checksum[:2]}/{checksum[2:4]}/{checksum}"
+    assert (first["created"], second["created"]) == (True, False)
+    assert (upload_dir / first["key"]).read_bytes() == PDF
+    assert os.listdir(upload_dir / "tmp") == []
@@ -1,15 +1,21 @@
 import base64
+import binascii
+import hashlib
 import io
 import os
+import re
+import tempfile
 import uuid
+from typing import IO, Any, Dict, Optional, Tuple
 
-import numpy as np
 import phonenumbers
 from PIL import Image
 
 from app import crud, schemas
+from app.core.celery_app import celery_app
 from app.core.config import settings
-from app.core.logger import log
+from app.core.metrics import UPLOAD_BYTES
+from app.storage import get_storage
 
 max_tries = 60 * 5  # 5 minutes
 wait_seconds = 15
@@ -30,84 +36,280 @@ def uuid_to_hex(uuid_string: str) -> str:
     return uuid.UUID(uuid_string).hex
 
 
+# Key prefix of the content-addressed files
+BLOB_DIR = "blobs"
+
+
+def upload_key(name: str) -> str:
+    return f"{name[:1]}/{name}"
+
+
+def image_save_options(format: str) -> Dict[str, Any]:
+    """
+    Encoder options for IMAGE_FORMAT: zlib level for PNG, quality for the
+    lossy formats (WEBP, and AVIF when pillow-avif-plugin is installed).
+    """
+    if format.upper() == "PNG":
+        return {"compress_level": settings.IMAGE_COMPRESS_LEVEL}
+    return {"quality": settings.IMAGE_QUALITY}
+
+
 def uploadPhoto(f, name):
+    """
+    Crop the empty border off image `f` and save it in IMAGE_FORMAT under
+    `name`, with a `_thumb` thumbnail and a `_<size>` rendition per
+    IMAGE_RENDITION_SIZES. Runs in the `information.process_image` task.
+
+    The renditions are scaled from the cropped image in memory, largest
+    first, each from the previous one.
+    """
+    # Bounding box of the pixels that are not zero in every band
+    bbox = f.getbbox()
+    new_image = f.crop(bbox) if bbox else f
+    new_image.load()
+
+    format = settings.IMAGE_FORMAT
+    options = image_save_options(format)
+    storage = get_storage()
+
+    def save(image, key):
+        buffer = io.BytesIO()
+        image.save(buffer, format, **options)
+        buffer.seek(0)
+        # Need to overwrite if it exists
+        storage.save(key, buffer)
+
+    save(new_image, upload_key(name))
+
+    renditions = [("thumb", 400)] + [
+        (str(size), size) for size in settings.IMAGE_RENDITION_SIZES
+    ]
+    thumb_image = new_image
+    for suffix, size in sorted(renditions, key=lambda r: -r[1]):
+        thumb_image = thumb_image.copy()
+        thumb_image.thumbnail((size, size), reducing_gap=3.0)
+        save(thumb_image, upload_key(f"{name}_{suffix}"))
+
+    return [f"{name}_{suffix}" for suffix, _ in renditions]
+
+
+class FileTooLarge(ValueError):
+    pass
+
+
+def _copy_to_temp(
+    src: IO[bytes],
+    directory: Optional[str],
+    *,
+    magic: Optional[bytes],
+    max_size: Optional[int],
+    chunk_size: int,
+) -> Tuple[str, int, str]:
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".upload-")
+    digest = hashlib.sha256()
+    size = 0
     try:
-        image_data = np.asarray(f)
-        image_data_bw = image_data.max(axis=2)
-        non_empty_columns = np.where(image_data_bw.max(axis=0) > 0)[0]
-        non_empty_rows = np.where(image_data_bw.max(axis=1) > 0)[0]
-        cropBox = (
-            min(non_empty_rows),
-            max(non_empty_rows),
-            min(non_empty_columns),
-            max(non_empty_columns),
-        )
-
-        image_data_new = image_data[
-            cropBox[0] : cropBox[1] + 1, cropBox[2] : cropBox[3] + 1, :
-        ]
-
-        new_image = Image.fromarray(image_data_new)
-    except Exception:
-        new_image = f
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                if size == 0 and magic and not chunk.startswith(magic):
+                    raise ValueError("Unexpected file type")
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise FileTooLarge(f"Files are limited to {max_size} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+        if size == 0:
+            raise ValueError("The file is empty")
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return tmp, size, digest.hexdigest()
+
+
+def save_stream(
+    src: IO[bytes],
+    name: str,
+    *,
+    magic: Optional[bytes] = None,
+    max_size: Optional[int] = None,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """
+    Copy the binary file object `src` into storage as `name` in
+    `chunk_size` pieces, computing its size and SHA-256 on the way, so
+    memory use does not grow with the file.
 
-    # Need to overwrite if it exists
-    filepath = os.path.join(settings.UPLOADED_FILES_DEST, name[:1], name)
+    The first chunk must start with `magic`. The file only appears under
+    `name` once it has been written completely.
+    """
+    storage = get_storage()
+    tmp, size, checksum = _copy_to_temp(
+        src,
+        storage.temp_dir(),
+        magic=magic,
+        max_size=max_size,
+        chunk_size=chunk_size,
+    )
+    key = upload_key(name)
+    try:
+        storage.move(key, tmp)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    UPLOAD_BYTES.labels("file").inc(size)
+
+    return {"size": size, "checksum": checksum, "key": key}
 
-    new_image.save(filepath, "png")
-    thumb_image = Image.open(filepath)
-    thumb_image.thumbnail((400, 400))
-    thumb_image.save(f"{filepath}_thumb", "png")
 
+def blob_key(checksum: str) -> str:
+    return f"{BLOB_DIR}/{checksum[:2]}/{checksum[2:4]}/{checksum}"
 
-def uploadPDF(pdf, name):
-    # Need to overwrite if it exists
-    filepath = os.path.join(settings.UPLOADED_FILES_DEST, name[:1], name)
-    log.debug(f"writing to {filepath}")
-    f = open(filepath, "wb")
-    f.write(pdf)
-    f.close()
-    size = os.path.getsize(os.path.join(settings.UPLOADED_FILES_DEST, name[:1], name))
 
-    return {"size": size}
+def stage_blob(
+    src: IO[bytes],
+    *,
+    magic: Optional[bytes] = None,
+    max_size: Optional[int] = None,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE,
+) -> Tuple[str, int, str]:
+    """
+    First half of `save_blob`: copy `src` to a temporary file and return
+    its path, size and SHA-256, so that the caller can lock the blob (see
+    `app.db.blobs.lock_blob`) before `store_blob`.
+    """
+    return _copy_to_temp(
+        src,
+        get_storage().temp_dir(),
+        magic=magic,
+        max_size=max_size,
+        chunk_size=chunk_size,
+    )
 
 
-def isBase64(sb):
+def store_blob(tmp: str, size: int, checksum: str) -> Dict[str, Any]:
+    """
+    Second half of `save_blob`: move the file staged as `tmp` into the blob
+    store, or drop it when the content is stored already.
+    """
+    storage = get_storage()
+    key = blob_key(checksum)
     try:
-        if isinstance(sb, str):
-            # If there's any unicode here, an exception will be thrown and the function will return false
-            sb_bytes = bytes(sb, "ascii")
-        elif isinstance(sb, bytes):
-            sb_bytes = sb
+        created = not storage.exists(key)
+        if created:
+            storage.move(key, tmp)
         else:
-            raise False
-        return base64.b64encode(base64.b64decode(sb_bytes)) == sb_bytes
-    except Exception:
-        return False
+            # Restart the garbage collection grace period of the existing
+            # blob, whose new row may not be committed yet
+            storage.touch(key)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
 
+    UPLOAD_BYTES.labels("blob" if created else "duplicate").inc(size)
 
-def decode_pdf(msg):
-    try:
-        bytes = base64.b64decode(msg, validate=True)
-        log.debug(f"Got bytes [{bytes[0:4]}]")
-        if bytes[0:4] != b"%PDF":
-            return None
-        return bytes
-    except Exception as e:
-        log.error(e, exc_info=True)
-        return None
+    return {"size": size, "checksum": checksum, "key": key, "created": created}
+
+
+def save_blob(
+    src: IO[bytes],
+    *,
+    magic: Optional[bytes] = None,
+    max_size: Optional[int] = None,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """
+    Like `save_stream`, but store the file under its SHA-256 in the blob
+    store, `blobs/<ab>/<cd>/<sha256>`. A file whose content is already
+    stored is not written twice; `created` tells whether it was new.
+
+    Blobs are shared by every row with the same checksum and are only
+    removed by `app.db.blobs.collect_blobs`.
+    """
+    return store_blob(
+        *stage_blob(src, magic=magic, max_size=max_size, chunk_size=chunk_size)
+    )
+
+
+def document_key(id: str, checksum: Optional[str]) -> str:
+    """
+    The storage key of a document's file: its blob, or for documents stored
+    before the blob store, `<first char>/<id>`.
+    """
+    if checksum:
+        key = blob_key(checksum)
+        if get_storage().exists(key):
+            return key
+    return upload_key(id)
+
+
+# The last quantum of canonical base64 when it is padded: the bits the
+# padding leaves unused are zero, as b64encode writes them
+# (base64.b64decode ignores those bits)
+PADDED_QUANTUM_RE = re.compile(
+    rb"[A-Za-z0-9+/](?:[AQgw]=|[A-Za-z0-9+/][AEIMQUYcgkosw048])="
+)
 
 
-def decode_img(msg):
+def _strict_b64decode(data: bytes) -> bytes:
+    """
+    Decode `data`, rejecting anything but canonical base64. Raises
+    binascii.Error.
+    """
+    decoded = base64.b64decode(data, validate=True)
+    if data.endswith(b"=") and not PADDED_QUANTUM_RE.fullmatch(data[-4:]):
+        raise binascii.Error("Non-canonical base64 padding")
+    return decoded
+
+
+def b64decode(msg) -> Optional[bytes]:
+    """
+    Validate and decode base64 in a single pass. Returns None when `msg` is
+    not canonical base64.
+    """
     try:
-        msg = base64.b64decode(msg)
-        buf = io.BytesIO(msg)
-        img = Image.open(buf)
-        return img
-    except Exception:
+        if isinstance(msg, str):
+            msg = msg.encode("ascii")
+        return _strict_b64decode(msg)
+    except (TypeError, ValueError):
         return None
 
 
+class Base64Reader(io.RawIOBase):
+    """
+    Binary file object over a base64 string that decodes it as it is read,
+    so a large payload is never held decoded in full.
+
+    `read` raises ValueError once it reaches input that is not canonical
+    base64.
+    """
+
+    def __init__(self, msg):
+        self._msg = msg
+        self._pos = 0
+        # Decoded bytes that did not fit the last buffer
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._pending:
+            # Whole quanta of 4 characters, decoding to at most len(b) bytes
+            # unless the buffer is smaller than one quantum
+            end = self._pos + max(len(b) // 3, 1) * 4
+            chunk = self._msg[self._pos : end]
+            if not chunk:
+                return 0
+            self._pos = end
+            if isinstance(chunk, str):
+                chunk = chunk.encode("ascii")
+            self._pending = _strict_b64decode(chunk)
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
 def normalizeMSISDN(country, tel):
     try:
         r = phonenumbers.parse(tel, country)
@@ -162,16 +364,14 @@ def upload_image(db, id, image_data, type):
             "message": "`type` should be one of 'photo', 'id' or 'id_back'",
         }
 
-    if not isBase64(image_data):
-        return {
-            "success": False,
-            "status_code": 400,
-            "message": "This is not a valid base64 encoded image",
-        }
-
-    picture = decode_img(image_data)
+    data = b64decode(image_data)
+    try:
+        # Only reads the header
+        Image.open(io.BytesIO(data))
+    except Exception:
+        data = None
 
-    if not picture:
+    if not data:
         return {
             "success": False,
             "status_code": 400,
@@ -181,8 +381,10 @@ def upload_image(db, id, image_data, type):
     if not filename:
         filename = str(uuid.uuid4())
 
-    uploadPhoto(picture, filename)
+    # Cropping and thumbnails are done by the information.process_image task
+    save_stream(io.BytesIO(data), f"{filename}.upload")
+    task = celery_app.send_task("information.process_image", args=[filename])
 
     r = crud.application.update(db=db, db_obj=application, obj_in={fname: filename})
 
-    return {"success": True, "data": r}
+    return {"success": True, "data": r, "task_id": task.id}
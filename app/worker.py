@@ -1,9 +1,19 @@
+import io
+import uuid
 from contextlib import contextmanager
+from typing import Any, Dict
 
 import redis
+from PIL import Image
+from pypdf import PdfReader
 
+from app import models
+from app.core.celery_app import celery_app
 from app.core.config import settings
+from app.core.logger import log
 from app.db.session import SessionLocal
+from app.storage import get_storage
+from app.utils import document_key, upload_key, uploadPhoto
 
 redisConn = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
 
@@ -20,3 +30,51 @@ def session_scope():
         raise
     finally:
         session.close()
+
+
+@celery_app.task(name="information.process_image", acks_late=True)
+def process_image(name: str) -> Dict[str, Any]:
+    """
+    Crop the image uploaded as `<name>.upload` and write it as `name` with
+    its thumbnail and renditions.
+    """
+    storage = get_storage()
+    src = upload_key(f"{name}.upload")
+    with storage.open(src) as f, Image.open(io.BytesIO(f.read())) as image:
+        renditions = uploadPhoto(image, name)
+    storage.delete(src)
+    return {"name": name, "renditions": renditions}
+
+
+@celery_app.task(name="information.process_document", acks_late=True)
+def process_document(id: str) -> Dict[str, Any]:
+    """
+    Read the page count and document info of an uploaded PDF into its
+    country_document row.
+    """
+    with session_scope() as db:
+        document = db.get(models.CountryDocument, uuid.UUID(id))
+        if document is None:
+            return {"id": id, "status": None}
+
+        try:
+            storage = get_storage()
+            key = document_key(id, document.checksum)
+            # pypdf seeks, which object store bodies cannot
+            path = storage.path(key)
+            if path is None:
+                with storage.open(key) as f:
+                    path = io.BytesIO(f.read())
+            reader = PdfReader(path)
+            page_count = len(reader.pages)
+            info = {k.lstrip("/"): str(v) for k, v in (reader.metadata or {}).items()}
+            status = "ready"
+        except Exception as e:
+            log.error(e, exc_info=True)
+            page_count, info, status = None, None, "failed"
+
+        document.page_count = page_count
+        document.info = info
+        document.status = status
+
+    return {"id": id, "status": status, "page_count": page_count, "info": info}
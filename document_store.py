@@ -0,0 +1,37 @@
+import argparse
+import logging
+
+from app.db.blobs import collect_blobs, migrate_documents
+from app.db.session import SessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the document blob store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    gc = commands.add_parser("gc", help="remove unreferenced blobs")
+    gc.add_argument(
+        "--grace",
+        type=int,
+        help="keep files modified within this many seconds (BLOB_GC_GRACE)",
+    )
+    gc.add_argument(
+        "--dry-run", action="store_true", help="only report what would be removed"
+    )
+    commands.add_parser(
+        "migrate", help="move documents stored by id into the blob store"
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    if args.command == "gc":
+        stats = collect_blobs(db, grace=args.grace, dry_run=args.dry_run)
+    else:
+        stats = migrate_documents(db)
+    logger.info("%s: %s", args.command, stats)
+
+
+if __name__ == "__main__":
+    main()
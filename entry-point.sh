@@ -1,6 +1,16 @@
 #!/bin/sh
+if [ "$1" = "worker" ]; then
+    # Celery worker for the information.* tasks (image and PDF processing)
+    exec celery -A app.core.celery_app worker -Q information --loglevel=INFO
+fi
+
 alembic upgrade head
 
 python initial_data.py
 
-gunicorn -w 4 -k uvicorn.workers.UvicornWorker app:app --bind 0.0.0.0:5000
+# Per-worker metric files, summed up by /metrics
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+gunicorn -w ${WEB_CONCURRENCY:-4} -k uvicorn.workers.UvicornWorker app:app --bind 0.0.0.0:5000
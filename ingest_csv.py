@@ -0,0 +1,28 @@
+import argparse
+import logging
+
+from app.db.ingest import ingest_csv, ingestable_models
+from app.db.session import SessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load a CSV file into a table")
+    parser.add_argument("table", choices=sorted(ingestable_models))
+    parser.add_argument("file", help="CSV file, optionally gzipped")
+    parser.add_argument(
+        "--keep-existing",
+        action="store_true",
+        help="leave rows whose id already exists untouched",
+    )
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    stats = ingest_csv(db, args.table, args.file, update=not args.keep_existing)
+    logger.info("Ingested %s", stats)
+
+
+if __name__ == "__main__":
+    main()